@@ -0,0 +1,46 @@
+"""create transcode queue
+
+Revision ID: 7b1e4c2d9a10
+Revises: 50d63e3650d2
+Create Date: 2026-10-18 10:12:31.402216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# pylint: disable=no-member
+
+# revision identifiers, used by Alembic.
+revision = '7b1e4c2d9a10'
+down_revision = '50d63e3650d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('transcode_queue',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('status', sa.String(length=20), nullable=True),
+                    sa.Column('raw_path', sa.String(length=256), nullable=True),
+                    sa.Column('transcode_out_path', sa.String(length=256), nullable=True),
+                    sa.Column('final_directory', sa.String(length=256), nullable=True),
+                    sa.Column('use_make_mkv', sa.Boolean(), nullable=True),
+                    sa.Column('protection', sa.Boolean(), nullable=True),
+                    sa.Column('tracks', sa.Text(), nullable=True),
+                    sa.Column('config', sa.Text(), nullable=True),
+                    sa.Column('worker_pid', sa.Integer(), nullable=True),
+                    sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('error', sa.Text(), nullable=True),
+                    sa.Column('queued_time', sa.DateTime(), nullable=True),
+                    sa.Column('start_time', sa.DateTime(), nullable=True),
+                    sa.Column('stop_time', sa.DateTime(), nullable=True),
+                    sa.ForeignKeyConstraint(['job_id'], ['job.job_id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_transcode_queue_status', 'transcode_queue', ['status', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_transcode_queue_status', table_name='transcode_queue')
+    op.drop_table('transcode_queue')
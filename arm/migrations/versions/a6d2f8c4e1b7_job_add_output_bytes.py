@@ -0,0 +1,32 @@
+"""Job output bytes
+
+Revision ID: a6d2f8c4e1b7
+Revises: f3a9c6e2b8d4
+Create Date: 2026-10-18 21:14:37.582104
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d2f8c4e1b7'
+down_revision = 'f3a9c6e2b8d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """
+    Update Job table with an additional column
+
+    output_bytes - big integer
+    - Size of the output folder, stored when the job succeeds, added up by the daily stats
+    """
+    op.add_column('job',
+                  sa.Column('output_bytes', sa.BigInteger(), nullable=True)
+                  )
+
+
+def downgrade():
+    op.drop_column('job', 'output_bytes')
@@ -0,0 +1,45 @@
+"""create job search index
+
+Revision ID: c2f4a8e1b6d3
+Revises: 7b1e4c2d9a10
+Create Date: 2026-10-18 14:02:11.518934
+
+"""
+from alembic import op
+
+# pylint: disable=no-member
+
+# revision identifiers, used by Alembic.
+revision = 'c2f4a8e1b6d3'
+down_revision = '7b1e4c2d9a10'
+branch_labels = None
+depends_on = None
+
+COLUMNS = "title, label, imdb_id, year, crc_id, path"
+NEW_VALUES = "new.title, new.label, new.imdb_id, new.year, new.crc_id, new.path"
+OLD_VALUES = "old.title, old.label, old.imdb_id, old.year, old.crc_id, old.path"
+
+
+def upgrade():
+    # External content table, the index reads the values from job and holds no copy of them
+    op.execute(f"CREATE VIRTUAL TABLE job_search USING fts5({COLUMNS}, content='job', content_rowid='job_id', "
+               "tokenize='unicode61 remove_diacritics 2', prefix='2 3')")
+    op.execute(f"""CREATE TRIGGER job_search_insert AFTER INSERT ON job BEGIN
+        INSERT INTO job_search(rowid, {COLUMNS}) VALUES (new.job_id, {NEW_VALUES});
+    END""")
+    op.execute(f"""CREATE TRIGGER job_search_delete AFTER DELETE ON job BEGIN
+        INSERT INTO job_search(job_search, rowid, {COLUMNS}) VALUES ('delete', old.job_id, {OLD_VALUES});
+    END""")
+    # Only the searched columns, status and progress updates don't touch the index
+    op.execute(f"""CREATE TRIGGER job_search_update AFTER UPDATE OF {COLUMNS} ON job BEGIN
+        INSERT INTO job_search(job_search, rowid, {COLUMNS}) VALUES ('delete', old.job_id, {OLD_VALUES});
+        INSERT INTO job_search(rowid, {COLUMNS}) VALUES (new.job_id, {NEW_VALUES});
+    END""")
+    op.execute("INSERT INTO job_search(job_search) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER job_search_update")
+    op.execute("DROP TRIGGER job_search_delete")
+    op.execute("DROP TRIGGER job_search_insert")
+    op.execute("DROP TABLE job_search")
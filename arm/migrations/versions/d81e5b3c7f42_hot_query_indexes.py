@@ -0,0 +1,42 @@
+"""add indexes for hot queries
+
+Revision ID: d81e5b3c7f42
+Revises: c2f4a8e1b6d3
+Create Date: 2026-10-18 15:20:47.102385
+
+"""
+from alembic import op
+
+# pylint: disable=no-member
+
+# revision identifiers, used by Alembic.
+revision = 'd81e5b3c7f42'
+down_revision = 'c2f4a8e1b6d3'
+branch_labels = None
+depends_on = None
+
+# (name, table, columns), also read by devtools/query_benchmark.py
+INDEXES = (
+    # home page, clean_old_jobs, get_x_jobs, failed job count
+    ('ix_job_status', 'job', ['status']),
+    # ripper job_dupe_check
+    ('ix_job_label_status', 'job', ['label', 'status']),
+    # ui job_dupe_check
+    ('ix_job_crc_id_status', 'job', ['crc_id', 'status']),
+    # job.tracks and the per file lookups of handbrake_mkv and ffmpeg_mkv
+    ('ix_track_job_id_filename', 'track', ['job_id', 'filename']),
+    # unread notifications, sent with every /json response
+    ('ix_notifications_seen', 'notifications', ['seen']),
+    # drive of a job by its device path
+    ('ix_system_drives_mount', 'system_drives', ['mount']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, _columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,38 @@
+"""create daily stats
+
+Revision ID: e4b7a2c9d5f1
+Revises: d81e5b3c7f42
+Create Date: 2026-10-18 16:41:05.873120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# pylint: disable=no-member
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7a2c9d5f1'
+down_revision = 'd81e5b3c7f42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_stats',
+                    sa.Column('day', sa.Date(), nullable=False),
+                    sa.Column('jobs_completed', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('jobs_failed', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('bytes_ripped', sa.BigInteger(), nullable=False, server_default='0'),
+                    sa.Column('rip_seconds', sa.Float(), nullable=False, server_default='0'),
+                    sa.Column('rip_count', sa.Integer(), nullable=False, server_default='0'),
+                    sa.Column('transcode_seconds', sa.Float(), nullable=False, server_default='0'),
+                    sa.Column('transcode_count', sa.Integer(), nullable=False, server_default='0'),
+                    sa.PrimaryKeyConstraint('day')
+                    )
+    # Jobs finished on a day, read when a day is aggregated
+    op.create_index('ix_job_stop_time', 'job', ['stop_time'])
+
+
+def downgrade():
+    op.drop_index('ix_job_stop_time', table_name='job')
+    op.drop_table('daily_stats')
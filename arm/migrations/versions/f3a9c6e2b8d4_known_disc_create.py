@@ -0,0 +1,49 @@
+"""create known disc index
+
+Revision ID: f3a9c6e2b8d4
+Revises: e4b7a2c9d5f1
+Create Date: 2026-10-18 17:52:19.446021
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# pylint: disable=no-member
+
+# revision identifiers, used by Alembic.
+revision = 'f3a9c6e2b8d4'
+down_revision = 'e4b7a2c9d5f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('known_disc',
+                    sa.Column('crc_id', sa.String(length=63), nullable=False),
+                    sa.Column('title', sa.String(length=256), nullable=True),
+                    sa.Column('year', sa.String(length=4), nullable=True),
+                    sa.Column('imdb_id', sa.String(length=15), nullable=True),
+                    sa.Column('video_type', sa.String(length=20), nullable=True),
+                    sa.Column('poster_url', sa.String(length=256), nullable=True),
+                    sa.Column('titles', sa.String(length=256), nullable=True),
+                    sa.Column('source', sa.String(length=20), nullable=True),
+                    sa.Column('job_id', sa.Integer(), nullable=True),
+                    sa.Column('updated', sa.DateTime(), nullable=True),
+                    sa.PrimaryKeyConstraint('crc_id')
+                    )
+    # Learn the discs ripped so far, the newest job of a disc wins
+    op.execute("""
+        INSERT OR REPLACE INTO known_disc
+            (crc_id, title, year, imdb_id, video_type, poster_url, titles, source, job_id, updated)
+        SELECT crc_id, title, year, imdb_id, video_type, poster_url,
+               (SELECT group_concat(track_number) FROM track
+                WHERE track.job_id = job.job_id AND track.ripped),
+               'job', job_id, stop_time
+        FROM job
+        WHERE status = 'success' AND disctype = 'dvd' AND hasnicetitle AND crc_id IS NOT NULL AND crc_id != ''
+        ORDER BY job_id
+    """)
+
+
+def downgrade():
+    op.drop_table('known_disc')
@@ -3,10 +3,13 @@
 
 from .alembic_version import AlembicVersion  # noqa F401
 from .config import Config  # noqa F401
+from .daily_stats import DailyStats  # noqa F401
 from .job import Job, JobState  # noqa F401
+from .known_disc import KnownDisc  # noqa F401
 from .notifications import Notifications  # noqa F401
 from .system_drives import SystemDrives  # noqa F401
 from .system_info import SystemInfo  # noqa F401
 from .track import Track  # noqa F401
+from .transcode_queue import TranscodeQueue, TranscodeState  # noqa F401
 from .ui_settings import UISettings  # noqa F401
 from .user import User  # noqa F401
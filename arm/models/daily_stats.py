@@ -0,0 +1,45 @@
+from arm.ui import db
+
+
+class DailyStats(db.Model):
+    """
+    Jobs finished on one day, aggregated by the UI stats collector.
+    Durations are kept as sums and counts, get_d() returns the averages.
+    """
+    day = db.Column(db.Date, primary_key=True)
+    jobs_completed = db.Column(db.Integer, default=0, nullable=False)
+    jobs_failed = db.Column(db.Integer, default=0, nullable=False)
+    bytes_ripped = db.Column(db.BigInteger, default=0, nullable=False)
+    rip_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    rip_count = db.Column(db.Integer, default=0, nullable=False)
+    transcode_seconds = db.Column(db.Float, default=0.0, nullable=False)
+    transcode_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __init__(self, day):
+        self.day = day
+        self.reset()
+
+    def reset(self):
+        """Zero the totals before the day is counted again"""
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.bytes_ripped = 0
+        self.rip_seconds = 0.0
+        self.rip_count = 0
+        self.transcode_seconds = 0.0
+        self.transcode_count = 0
+
+    def __repr__(self):
+        return f'<DailyStats {self.day} {self.jobs_completed} completed {self.jobs_failed} failed>'
+
+    def get_d(self):
+        """ Returns a dict of the day with the average durations in minutes"""
+        return {
+            "day": self.day.isoformat(),
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "bytes_ripped": self.bytes_ripped,
+            "avg_rip_minutes": round(self.rip_seconds / self.rip_count / 60, 1) if self.rip_count else None,
+            "avg_transcode_minutes":
+                round(self.transcode_seconds / self.transcode_count / 60, 1) if self.transcode_count else None,
+        }
@@ -85,6 +85,12 @@ class Job(db.Model):
     Job Class hold most of the details for each job
     connects to track, config
     """
+    __table_args__ = (
+        db.Index('ix_job_status', 'status'),
+        db.Index('ix_job_label_status', 'label', 'status'),
+        db.Index('ix_job_crc_id_status', 'crc_id', 'status'),
+        db.Index('ix_job_stop_time', 'stop_time'),
+    )
     job_id = db.Column(db.Integer, primary_key=True)
     arm_version = db.Column(db.String(20))
     crc_id = db.Column(db.String(63))
@@ -130,11 +136,17 @@ class Job(db.Model):
     is_iso = db.Column(db.Boolean)
     manual_start = db.Column(db.Boolean)
     manual_mode = db.Column(db.Boolean)
+    output_bytes = db.Column(db.BigInteger)
     tracks = db.relationship('Track', backref='job', lazy='dynamic')
     config = db.relationship('Config', uselist=False, backref="job")
 
-    def __init__(self, devpath):
-        """Return a disc object"""
+    def __init__(self, devpath, probe=True):
+        """
+        Return a disc object\n
+        :param devpath: device of the disc
+        :param probe: read the disc type and label from the device, False for jobs
+                      that don't come from a drive, e.g. movies imported from COMPLETED_PATH
+        """
         self.devpath = devpath
         self.mountpoint = ""
         self.hasnicetitle = False
@@ -143,12 +155,15 @@ class Job(db.Model):
         self.updated = False
         if cfg.arm_config['VIDEOTYPE'] != "auto":
             self.video_type = cfg.arm_config['VIDEOTYPE']
-        self.parse_udev()
         self.get_pid()
         self.stage = str(round(time.time() * 100))
         self.manual_start = False
         self.manual_mode = False
         self.has_track_99 = False
+        if not probe:
+            self.disctype = "unknown"
+            return
+        self.parse_udev()
 
         if self.disctype == "dvd" and not self.label:
             logging.info("No disk label Available. Trying lsdvd")
@@ -276,6 +291,22 @@ class Job(db.Model):
                 return_dict[str(key)] = str(value)
         return return_dict
 
+    def measure_output(self):
+        """
+        Store the bytes of all files below the job path, done once when the job succeeds\n
+        The daily stats add these up instead of walking the output folders again.
+        :return int: the bytes, 0 if the path is gone
+        """
+        total = 0
+        for root, _dirs, files in os.walk(self.path or ""):
+            for file in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, file))
+                except OSError:
+                    pass
+        self.output_bytes = total
+        return total
+
     def eject(self):
         """Eject disc if it hasn't previously been ejected
         """
@@ -300,6 +331,15 @@ class Job(db.Model):
     def finished(cls):
         return cls.status.in_([js.value for js in JOB_STATUS_FINISHED])
 
+    @hybrid_property
+    def active(self):
+        return not self.finished
+
+    @active.expression
+    def active(cls):
+        # IN over the unfinished states can use ix_job_status, NOT IN over the finished ones can't
+        return cls.status.in_(sorted({js.value for js in JobState} - {js.value for js in JOB_STATUS_FINISHED}))
+
     @property
     def idle(self):
         return JobState(self.status) == JobState.IDLE
@@ -0,0 +1,37 @@
+from arm.ui import db
+
+
+class KnownDisc(db.Model):
+    """
+    Identification of a DVD by its pydvdid CRC64, taken from a successful job or
+    imported from a dump. identify_dvd checks it before asking any online service.
+    titles holds the track numbers ripped from the disc, comma separated.
+    """
+    crc_id = db.Column(db.String(63), primary_key=True)
+    title = db.Column(db.String(256))
+    year = db.Column(db.String(4))
+    imdb_id = db.Column(db.String(15))
+    video_type = db.Column(db.String(20))
+    poster_url = db.Column(db.String(256))
+    titles = db.Column(db.String(256))
+    source = db.Column(db.String(20))
+    job_id = db.Column(db.Integer)
+    updated = db.Column(db.DateTime)
+
+    def __init__(self, crc_id):
+        self.crc_id = crc_id
+
+    def __repr__(self):
+        return f'<KnownDisc {self.crc_id} {self.title} ({self.year})>'
+
+    def get_d(self):
+        """ Returns a dict of the disc, in the column order of a dump"""
+        return {
+            "crc_id": self.crc_id,
+            "title": self.title,
+            "year": self.year,
+            "imdb_id": self.imdb_id,
+            "video_type": self.video_type,
+            "poster_url": self.poster_url,
+            "titles": self.titles,
+        }
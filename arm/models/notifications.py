@@ -7,6 +7,7 @@ class Notifications(db.Model):
     """
     Class to hold the A.R.M notifications
     """
+    __table_args__ = (db.Index('ix_notifications_seen', 'seen'),)
     id = db.Column(db.Integer, autoincrement=True, primary_key=True)
     seen = db.Column(db.Boolean)
     trigger_time = db.Column(db.DateTime)
@@ -91,6 +91,7 @@ class SystemDrives(db.Model):  # pylint: disable=too-many-instance-attributes
     """
     Class to hold the system cd/dvd/Blu-ray drive information
     """
+    __table_args__ = (db.Index('ix_system_drives_mount', 'mount'),)
     drive_id = db.Column(db.Integer, index=True, primary_key=True)
 
     # static information:
@@ -3,6 +3,7 @@ from arm.ui import db
 
 class Track(db.Model):
     """ Holds all the individual track details for each job """
+    __table_args__ = (db.Index('ix_track_job_id_filename', 'job_id', 'filename'),)
     track_id = db.Column(db.Integer, primary_key=True)
     job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'))
     track_number = db.Column(db.String(4))
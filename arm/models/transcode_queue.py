@@ -0,0 +1,76 @@
+import datetime
+import enum
+import json
+
+from arm.ui import db
+
+
+class TranscodeState(str, enum.Enum):
+    """Possible states for TranscodeQueue.status"""
+    QUEUED = "queued"
+    ACTIVE = "active"
+    DONE = "done"
+    FAILED = "failed"
+
+
+TRANSCODE_QUEUE_PENDING = {
+    TranscodeState.QUEUED,
+    TranscodeState.ACTIVE,
+}
+
+
+class TranscodeQueue(db.Model):
+    """
+    Durable transcode work item, written by the ripper once the raw files are on disk
+    and drained by the transcode worker pool
+    """
+    id = db.Column(db.Integer, autoincrement=True, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('job.job_id'))
+    status = db.Column(db.String(20))
+    raw_path = db.Column(db.String(256))
+    transcode_out_path = db.Column(db.String(256))
+    final_directory = db.Column(db.String(256))
+    use_make_mkv = db.Column(db.Boolean)
+    protection = db.Column(db.Boolean)
+    tracks = db.Column(db.Text)
+    config = db.Column(db.Text)
+    worker_pid = db.Column(db.Integer)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    error = db.Column(db.Text)
+    queued_time = db.Column(db.DateTime)
+    start_time = db.Column(db.DateTime)
+    stop_time = db.Column(db.DateTime)
+    job = db.relationship("Job")
+
+    def __init__(self, job_id, raw_path, transcode_out_path, final_directory,
+                 use_make_mkv, protection, tracks, config):
+        self.job_id = job_id
+        self.status = TranscodeState.QUEUED.value
+        self.raw_path = raw_path
+        self.transcode_out_path = transcode_out_path
+        self.final_directory = final_directory
+        self.use_make_mkv = use_make_mkv
+        self.protection = protection
+        self.tracks = json.dumps(tracks)
+        self.config = json.dumps(config)
+        self.attempts = 0
+        self.queued_time = datetime.datetime.now()
+
+    def __repr__(self):
+        return f'<TranscodeQueue {self.id} job {self.job_id} {self.status}>'
+
+    def get_config(self):
+        """Returns the config snapshot taken when the item was queued"""
+        return json.loads(self.config) if self.config else {}
+
+    def get_tracks(self):
+        """Returns the list of raw track filenames queued for transcoding"""
+        return json.loads(self.tracks) if self.tracks else []
+
+    def get_d(self):
+        """ Returns a dict of the object"""
+        return_dict = {}
+        for key, value in self.__dict__.items():
+            if key not in ('_sa_instance_state', 'job', 'config'):
+                return_dict[str(key)] = str(value)
+        return return_dict
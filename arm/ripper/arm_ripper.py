@@ -12,8 +12,9 @@ from pathlib import Path
 if find_spec("arm") is None:
     sys.path.append(str(Path(__file__).parents[2]))
 
-from arm.ripper import utils, makemkv, handbrake, ffmpeg  # noqa E402
-from arm.ui import app, db, constants  # noqa E402
+import arm.config.config as cfg  # noqa E402
+from arm.ripper import utils, makemkv, handbrake, ffmpeg, transcode_pipeline, transcode_queue  # noqa E402
+from arm.ui import app, db_writer, constants  # noqa E402
 from arm.models.job import JobState  # noqa E402
 
 
@@ -25,7 +26,7 @@ def rip_visual_media(have_dupes, job, logfile, protection):
     :param job: Current job
     :param logfile: Current logfile
     :param protection: Does the disc have 99 track protection
-    :return: None
+    :return: True if the job was handed to the transcode queue
     """
     # Fix the sub-folder type - (movie|tv|unknown)
     type_sub_folder = utils.convert_job_type(job.video_type)
@@ -52,14 +53,21 @@ def rip_visual_media(have_dupes, job, logfile, protection):
     # Do we need to use MakeMKV - Blu-rays, protected dvd's, and dvd with mainfeature off
     use_make_mkv = rip_with_mkv(job, protection)
     logging.debug(f"Using MakeMKV: [{use_make_mkv}]")
+    pipeline = None
     if use_make_mkv:
         logging.info("************* Ripping disc with MakeMKV *************")
+        # Transcode each title as soon as MakeMKV has written it
+        if transcode_pipeline.can_pipeline(job):
+            logging.info("Transcoding titles while ripping")
+            pipeline = transcode_pipeline.TranscodePipeline(job, logfile, transcode_out_path)
         # Run MakeMKV and get path to output
         job.status = JobState.VIDEO_RIPPING.value
-        db.session.commit()
+        db_writer.commit()
         try:
-            makemkv_out_path = makemkv.makemkv(job)
+            makemkv_out_path = makemkv.makemkv(job, pipeline)
         except Exception as mkv_error:  # noqa: E722
+            if pipeline is not None:
+                pipeline.cancel()
             raise utils.RipperException("Error while running MakeMKV") from mkv_error
 
         if job.config.NOTIFY_RIP:
@@ -67,8 +75,41 @@ def rip_visual_media(have_dupes, job, logfile, protection):
         logging.info("************* Ripping with MakeMKV completed *************")
         # point HB/FFMPEG to the path MakeMKV ripped to
         transcode_in_path = makemkv_out_path
+    if pipeline is not None:
+        logging.info("Waiting for the remaining titles to finish transcoding")
+        utils.database_updater({'status': JobState.TRANSCODE_ACTIVE.value}, job)
+        pipeline.finish(makemkv_out_path)
+        utils.database_updater({'status': JobState.IDLE.value}, job)
+    # Hand the raw files over to the transcode worker pool, this frees the drive and ends the ripper
+    elif use_make_mkv and not job.config.SKIP_TRANSCODE and int(cfg.arm_config.get("TRANSCODE_WORKERS", 0)) > 0:
+        transcode_queue.enqueue(job, makemkv_out_path, transcode_out_path, final_directory, use_make_mkv, protection)
+        return True
+
+    finish_visual_media(job, logfile, transcode_in_path, transcode_out_path, final_directory,
+                        makemkv_out_path, use_make_mkv, protection, transcoded=pipeline is not None)
+    return False
+
+
+def finish_visual_media(job, logfile, transcode_in_path, transcode_out_path, final_directory,
+                        makemkv_out_path, use_make_mkv, protection, transcoded=False):
+    """
+    Transcode and post process a ripped dvd or Blu-ray\n
+    Runs in the ripper process, or in a transcode worker when the job was queued
+    \n
+    :param job: Current job
+    :param logfile: Current logfile
+    :param transcode_in_path: Transcode source (MakeMKV out path|/dev/srX)
+    :param transcode_out_path: Path the transcoder saves files to
+    :param final_directory: Path in COMPLETED_PATH for the finished files
+    :param makemkv_out_path: Path MakeMKV ripped to, None if MakeMKV wasn't used
+    :param use_make_mkv: Was the disc ripped with MakeMKV
+    :param protection: Does the disc have 99 track protection
+    :param transcoded: Titles were already transcoded while ripping
+    :return: None
+    """
     # Begin transcoding section - only transcode if skip_transcode is false
-    start_transcode(job, logfile, transcode_in_path, transcode_out_path, protection)
+    if not transcoded:
+        start_transcode(job, logfile, transcode_in_path, transcode_out_path, protection)
 
     # --------------- POST PROCESSING ---------------
     # If ripped with MakeMKV remove the 'out' folder and set the raw as the output
@@ -83,6 +124,7 @@ def rip_visual_media(have_dupes, job, logfile, protection):
         # Remove the old final dir
         utils.delete_raw_files([final_directory])
         job_title = utils.fix_job_title(job)
+        type_sub_folder = utils.convert_job_type(job.video_type)
         final_directory = os.path.join(job.config.COMPLETED_PATH, type_sub_folder, job_title)
         # Update the job.path with the final directory
         utils.database_updater({'path': final_directory}, job)
@@ -130,12 +172,12 @@ def start_transcode(job, logfile, raw_in_path, transcode_out_path, protection):
         elif job.video_type == "movie" and job.config.MAINFEATURE and job.hasnicetitle:
             logging.debug(f"ffmpeg_main_feature: {raw_in_path}, {transcode_out_path}")
             ffmpeg.ffmpeg_main_feature(raw_in_path, transcode_out_path, job)
-            db.session.commit()
+            db_writer.commit()
         # Finally if it is a series or mainfeature is disabled run ffmpeg_all to transcode all tracks
         else:
             logging.debug(f"ffmpeg_all: {raw_in_path}, {transcode_out_path}")
             ffmpeg.ffmpeg_all(raw_in_path, transcode_out_path, job)
-            db.session.commit()
+            db_writer.commit()
         logging.info("************* Finished Transcode With FFMPEG *************")
         # After transcoding update db status back to active
         utils.database_updater({'status': "active"}, job)
@@ -151,12 +193,12 @@ def start_transcode(job, logfile, raw_in_path, transcode_out_path, protection):
         elif job.video_type == "movie" and job.config.MAINFEATURE and job.hasnicetitle:
             logging.debug(f"handbrake_main_feature: {raw_in_path}, {transcode_out_path}, {logfile}")
             handbrake.handbrake_main_feature(raw_in_path, transcode_out_path, logfile, job)
-            db.session.commit()
+            db_writer.commit()
         # Finally if it is a series or mainfeature is disabled run handbrake_all to transcode all tracks
         else:
             logging.debug(f"handbrake_all: {raw_in_path}, {transcode_out_path}, {logfile}")
             handbrake.handbrake_all(raw_in_path, transcode_out_path, logfile, job)
-            db.session.commit()
+            db_writer.commit()
         logging.info("************* Finished Transcode With HandBrake *************")
         # After transcoding update db status back to active
         utils.database_updater({'status': "active"}, job)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Streaming imager for data discs
+
+Reads the device in large sector aligned chunks on a reader thread while the
+ripper thread hashes the data and writes it straight to the final image file,
+so a disc is read once and written once. Unreadable sectors are retried one by
+one and then handled according to DATA_RIP_BAD_SECTORS.
+"""
+import dataclasses
+import errno
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+
+import arm.config.config as cfg
+
+SECTOR_SIZE = 2048
+# Seconds between progress lines in the job log
+PROGRESS_INTERVAL = 5
+BAD_SECTOR_POLICIES = ("fail", "zero", "skip")
+
+
+class UnreadableSectorError(OSError):
+    """A sector couldn't be read and DATA_RIP_BAD_SECTORS is "fail" """
+
+
+@dataclasses.dataclass
+class ImageResult:
+    """Summary of a finished image"""
+    size: int
+    """Bytes written to the image"""
+    seconds: float
+    """Time taken"""
+    bad_sectors: int
+    """Sectors that were filled with zeros or skipped"""
+    hash_name: str
+    """Name of the hash algorithm, empty if hashing is disabled"""
+    digest: str
+    """Hex digest of the image, empty if hashing is disabled"""
+
+
+def bad_sector_policy():
+    """
+    What to do with sectors that stay unreadable after the retries\n
+    Without DATA_RIP_BAD_SECTORS the dd options in DATA_RIP_PARAMETERS are honoured:
+    conv=noerror skips, conv=noerror,sync fills with zeros.
+    :return str: one of BAD_SECTOR_POLICIES
+    """
+    policy = str(cfg.arm_config.get("DATA_RIP_BAD_SECTORS") or "").lower()
+    if not policy:
+        dd_parameters = str(cfg.arm_config.get("DATA_RIP_PARAMETERS") or "")
+        if "noerror" not in dd_parameters:
+            policy = "fail"
+        else:
+            policy = "zero" if "sync" in dd_parameters else "skip"
+    if policy not in BAD_SECTOR_POLICIES:
+        raise ValueError(f"DATA_RIP_BAD_SECTORS must be one of {', '.join(BAD_SECTOR_POLICIES)}, not '{policy}'")
+    return policy
+
+
+def new_hash(name):
+    """
+    Create a hash object by name\n
+    xxHash algorithms (xxh64, xxh3_64, xxh128) need the optional xxhash module,
+    without it sha256 is used.
+    :param str name: hashlib or xxhash algorithm name, empty to disable hashing
+    :return: (name, hash object) or ("", None)
+    """
+    if not name:
+        return "", None
+    if name.startswith("xxh"):
+        try:
+            import xxhash
+            return name, getattr(xxhash, name)()
+        except (ImportError, AttributeError):
+            logging.warning(f"Hash '{name}' isn't available, install the xxhash module. Using sha256")
+            name = "sha256"
+    return name, hashlib.new(name)
+
+
+def _format_size(size):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+class DiscImager:
+    """
+    Copy a device to an image file, see image()
+    """
+
+    def __init__(self, devpath, chunk_size=None, policy=None, retries=None, hash_name=None, reporter=None):
+        self.devpath = devpath
+        self.reporter = reporter
+        if chunk_size is None:
+            chunk_size = int(cfg.arm_config.get("DATA_RIP_CHUNK_SIZE", 4)) * 1024 * 1024
+        # Whole sectors only, reads stay aligned to the disc
+        self.chunk_size = max(chunk_size - chunk_size % SECTOR_SIZE, SECTOR_SIZE)
+        self.policy = policy or bad_sector_policy()
+        self.retries = int(cfg.arm_config.get("DATA_RIP_RETRIES", 3)) if retries is None else retries
+        self.hash_name = cfg.arm_config.get("DATA_RIP_HASH", "sha256") if hash_name is None else hash_name
+        self.bad_sectors = 0
+        self._stop = threading.Event()
+
+    def _put(self, chunks, item):
+        while not self._stop.is_set():
+            try:
+                chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def _read_sectors(self, fd, offset, length):
+        """Read a chunk that failed sector by sector, applying the bad sector policy"""
+        data = bytearray()
+        for sector_offset in range(offset, offset + length, SECTOR_SIZE):
+            sector_length = min(SECTOR_SIZE, offset + length - sector_offset)
+            for _ in range(self.retries + 1):
+                try:
+                    data += os.pread(fd, sector_length, sector_offset)
+                    break
+                except OSError as error:
+                    if error.errno != errno.EIO:
+                        raise
+            else:
+                sector = sector_offset // SECTOR_SIZE
+                if self.policy == "fail":
+                    raise UnreadableSectorError(errno.EIO, f"Sector {sector} is unreadable", self.devpath)
+                self.bad_sectors += 1
+                if self.policy == "zero":
+                    logging.warning(f"Sector {sector} is unreadable, filled with zeros")
+                    data += bytes(sector_length)
+                else:
+                    logging.warning(f"Sector {sector} is unreadable, skipped")
+        return bytes(data)
+
+    def _reader(self, fd, size, chunks):
+        """Reader thread, puts chunks of data, then None or the error that stopped it"""
+        offset = 0
+        try:
+            while offset < size and not self._stop.is_set():
+                length = min(self.chunk_size, size - offset)
+                try:
+                    data = os.pread(fd, length, offset)
+                except OSError as error:
+                    if error.errno != errno.EIO:
+                        raise
+                    data = self._read_sectors(fd, offset, length)
+                else:
+                    if not data:
+                        # The disc ends before the size the drive reported
+                        break
+                    length = len(data)
+                self._put(chunks, data)
+                offset += length
+        except Exception as error:
+            self._put(chunks, error)
+        else:
+            self._put(chunks, None)
+
+    def image(self, image_file):
+        """
+        Copy the device to image_file\n
+        The data is written to image_file.part and renamed once complete.
+        A file with the digest in sha256sum format is written next to the image.
+        :param image_file: full path of the image
+        :return ImageResult:
+        :raises OSError: the device or image can't be read/written or a sector is unreadable
+        """
+        hash_name, digest = new_hash(self.hash_name)
+        part_file = f"{image_file}.part"
+        start = last_report = time.monotonic()
+        written = 0
+        fd = os.open(self.devpath, os.O_RDONLY)
+        try:
+            size = os.lseek(fd, 0, os.SEEK_END)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            logging.info(f"Imaging {self.devpath} ({_format_size(size)}) to {image_file} "
+                         f"in {_format_size(self.chunk_size)} chunks, bad sectors: {self.policy}")
+            chunks = queue.Queue(maxsize=4)
+            reader = threading.Thread(target=self._reader, args=(fd, size, chunks),
+                                      name="data-imager", daemon=True)
+            reader.start()
+            try:
+                with open(part_file, "wb") as out:
+                    while (data := chunks.get()) is not None:
+                        if isinstance(data, Exception):
+                            raise data
+                        out.write(data)
+                        if digest is not None:
+                            digest.update(data)
+                        written += len(data)
+                        if (now := time.monotonic()) - last_report >= PROGRESS_INTERVAL:
+                            last_report = now
+                            self._log_progress(written, size, now - start)
+                    out.flush()
+                    os.fsync(out.fileno())
+            finally:
+                self._stop.set()
+                reader.join()
+        except BaseException:
+            if os.path.isfile(part_file):
+                os.unlink(part_file)
+            raise
+        finally:
+            os.close(fd)
+        os.replace(part_file, image_file)
+        result = ImageResult(written, time.monotonic() - start, self.bad_sectors, hash_name,
+                             digest.hexdigest() if digest is not None else "")
+        if result.digest:
+            with open(f"{image_file}.{hash_name}", "w", encoding="utf-8") as hash_file:
+                hash_file.write(f"{result.digest}  {os.path.basename(image_file)}\n")
+        self._log_progress(written, size, result.seconds)
+        return result
+
+    def _log_progress(self, written, size, seconds):
+        """Progress line in the job log, published to the UI if there is a reporter"""
+        rate = written / seconds if seconds > 0 else 0
+        percent = 100 * written / size if size else 100
+        eta = int((size - written) / rate) if rate > 0 and size > written else 0
+        hours, remainder = divmod(eta, 3600)
+        eta = f"{hours:d}:{remainder // 60:02d}:{remainder % 60:02d}"
+        logging.info(f"Imaging data disc: {min(percent, 100):.2f}% ({_format_size(written)} of {_format_size(size)}, "
+                     f"{_format_size(rate)}/s, ETA {eta})")
+        if self.reporter is not None:
+            self.reporter.update(percent, eta=eta, rate=rate, rate_unit="B/s",
+                                 title=f"{_format_size(written)} of {_format_size(size)}")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Persistent mapping of optical drives to MakeMKV disc indexes
+
+MakeMKV addresses drives by index (``disc:N``), finding out which index
+belongs to which ``/dev/srN`` takes a full ``makemkvcon info`` scan. The
+result of a scan is kept in SystemDrives.mdisc and in a cache file next to
+the database, together with the sysfs topology of the optical drives at the
+time of the scan. MakeMKV numbers the drives in SCSI generic order, so as
+long as the same drives sit on the same ports with the same sg devices, the
+indexes stay valid and no new scan is needed, even across restarts.
+"""
+import glob
+import json
+import logging
+import os
+
+import arm.config.config as cfg
+from arm.models import SystemDrives
+from arm.ripper import slot_scheduler
+from arm.ui import db, db_writer
+
+CACHE_FILE = "drive_index.json"
+
+
+def cache_path():
+    """Path of the cache file, stored next to the ARM database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), CACHE_FILE)
+
+
+def topology():
+    """
+    Current layout of the optical drives as seen by sysfs\n
+    :return dict: mount point -> "<sysfs device path> <sg devices>", empty if sysfs has no optical drives
+    """
+    drives = {}
+    for block in sorted(glob.glob("/sys/block/sr*")):
+        device = os.path.join(block, "device")
+        try:
+            scsi_generic = sorted(os.listdir(os.path.join(device, "scsi_generic")))
+        except OSError:
+            scsi_generic = []
+        drives[f"/dev/{os.path.basename(block)}"] = f"{os.path.realpath(device)} {','.join(scsi_generic)}"
+    return drives
+
+
+def _load():
+    try:
+        with open(cache_path(), encoding="utf-8") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def is_current():
+    """
+    Check the stored indexes still belong to the drives on the system\n
+    Without a cache or without drives in sysfs there is nothing to compare, the stored indexes are kept.
+    :return bool:
+    """
+    cached = _load().get("topology")
+    current = topology()
+    return not cached or not current or cached == current
+
+
+def restore():
+    """
+    Set SystemDrives.mdisc from the last scan if the drives haven't changed since\n
+    :return bool: True if the indexes were restored
+    """
+    cache = _load()
+    current = topology()
+    if not current or cache.get("topology") != current:
+        return False
+    for mount, index in cache.get("indexes", {}).items():
+        for db_drive in SystemDrives.query.filter_by(mount=mount).all():
+            db_drive.mdisc = index
+    db_writer.commit()
+    logging.debug("Restored MakeMKV disc numbers from the last drive scan")
+    return True
+
+
+def store(indexes):
+    """
+    Save the result of a MakeMKV drive scan\n
+    :param dict indexes: mount point -> MakeMKV disc index
+    :return: None
+    """
+    with db.session.no_autoflush:
+        for mount, index in indexes.items():
+            for db_drive in SystemDrives.query.filter_by(mount=mount).all():
+                db_drive.mdisc = index
+    db_writer.commit()
+    path = cache_path()
+    with open(f"{path}.tmp", "w", encoding="utf-8") as cache_file:
+        json.dump({"topology": topology(), "indexes": indexes}, cache_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def invalidate():
+    """Forget all MakeMKV disc indexes, the next rip scans the drives again"""
+    logging.info("Optical drives changed, MakeMKV disc numbers will be scanned again")
+    for db_drive in SystemDrives.query.filter(SystemDrives.mdisc.isnot(None)).all():
+        db_drive.mdisc = None
+    db_writer.commit()
+    try:
+        os.remove(cache_path())
+    except FileNotFoundError:
+        pass
+
+
+def scan_lock():
+    """
+    Only one process scans the drives, others wait and use its result\n
+    :return: context manager holding the drive scan slot
+    """
+    return slot_scheduler.SlotScheduler(slot_scheduler.DRIVE_INDEX, 1).slot()
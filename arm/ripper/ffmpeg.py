@@ -7,28 +7,34 @@ import subprocess
 import shlex
 import json
 import re
+from contextlib import contextmanager
+from functools import partial
+
 import arm.config.config as cfg
 
-from arm.ripper import utils
-from arm.ui import app, db  # noqa E402
+from arm.ripper import utils, slot_scheduler, transcode_pool, progress
+from arm.ripper.raw_output import RawOutput
+from arm.ui import app, db_writer  # noqa E402
 from arm.models.job import JobState
 
 PROCESS_COMPLETE = "FFMPEG processing complete"
 
 
+@contextmanager
 def ffmpeg_sleep_check(job):
     """
-    Wait until there is a spot to transcode (FFmpeg variant).
+    Wait until there is a spot to transcode and hold it for the with block (FFmpeg variant).
 
-    Mirrors handbrake_sleep_check but uses the FFMPEG_CLI token and
-    updates the job state via the database_updater helper.
+    Mirrors handbrake_sleep_check, FFmpeg and HandBrake share the same
+    transcode slots, and updates the job state via the database_updater helper.
     """
     logging.debug("FFMPEG starting.")
-    utils.database_updater({"status": JobState.TRANSCODE_WAITING.value}, job)
+    utils.database_updater({"status": JobState.TRANSCODE_WAITING.value}, job, coalesce=True)
 
-    utils.sleep_check_process(cfg.arm_config["FFMPEG_CLI"], int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
-    logging.debug(f"Setting job status to '{JobState.TRANSCODE_ACTIVE.value}'")
-    utils.database_updater({"status": JobState.TRANSCODE_ACTIVE.value}, job)
+    with slot_scheduler.transcode_scheduler().slot():
+        logging.debug(f"Setting job status to '{JobState.TRANSCODE_ACTIVE.value}'")
+        utils.database_updater({"status": JobState.TRANSCODE_ACTIVE.value}, job, coalesce=True)
+        yield
 
 
 def correct_ffmpeg_settings(job):
@@ -184,7 +190,7 @@ def evaluate_and_register_tracks(tracks, job):
     if not tracks:
         utils.put_track(job, 1, 0, 0, 0.0, False, "FFmpeg")
         job.no_of_titles = 1
-        db.session.commit()
+        db_writer.commit()
         return
 
     # Loop thrugh the tracks and select main feature as the track with max duration
@@ -196,7 +202,7 @@ def evaluate_and_register_tracks(tracks, job):
             main_title = t.get('title')
 
     job.no_of_titles = len(tracks)
-    db.session.commit()
+    db_writer.commit()
 
     for t in tracks:
         is_main = (t.get('title') == main_title)
@@ -221,53 +227,53 @@ def ffmpeg_main_feature(src_path, out_path, job):
     logging.debug("FFMPEG starting: ")
     logging.debug(f"\n\r{job.pretty_table()}")
 
-    utils.database_updater({'status': "waiting_transcode"}, job)
-    ffmpeg_sleep_check(job)
-    logging.debug("Setting job status to 'transcoding'")
-    utils.database_updater({'status': "transcoding"}, job)
+    utils.database_updater({'status': "waiting_transcode"}, job, coalesce=True)
+    with ffmpeg_sleep_check(job):
+        logging.debug("Setting job status to 'transcoding'")
+        utils.database_updater({'status': "transcoding"}, job, coalesce=True)
 
-    # Prepare output filename
-    filename = os.path.join(job.title + "." + cfg.arm_config["DEST_EXT"])
-    out_file_path = os.path.join(out_path, filename)
-    logging.info(f"Ripping title main_feature to {shlex.quote(out_file_path)}")
+        # Prepare output filename
+        filename = os.path.join(job.title + "." + cfg.arm_config["DEST_EXT"])
+        out_file_path = os.path.join(out_path, filename)
+        logging.info(f"Ripping title main_feature to {shlex.quote(out_file_path)}")
 
-    # Get info about the tracks on the disk and add that info to the job
-    get_track_info(src_path, job)
+        # Get info about the tracks on the disk and add that info to the job
+        get_track_info(src_path, job)
 
-    # Getting the main feature track, selecting based on the info just gathered
-    track = job.tracks.filter_by(main_feature=True).first()
-    if track is None:
-        msg = "No main feature found by FFMPEG. Turn main_feature to false in arm.yml and try again."
-        logging.error(msg)
-        raise RuntimeError(msg)
+        # Getting the main feature track, selecting based on the info just gathered
+        track = job.tracks.filter_by(main_feature=True).first()
+        if track is None:
+            msg = "No main feature found by FFMPEG. Turn main_feature to false in arm.yml and try again."
+            logging.error(msg)
+            raise RuntimeError(msg)
 
-    # Ensuring the filenames are all in sync
-    track.filename = track.orig_filename = filename
-    db.session.commit()
+        # Ensuring the filenames are all in sync
+        track.filename = track.orig_filename = filename
+        db_writer.commit()
 
-    try:
-        # Create the output directory if it doesn't exist
-        subprocess.check_output((f"mkdir -p {shlex.quote(out_path)} "
-                                 f"&& chmod -R 777 {shlex.quote(out_path)}"), shell=True)
-        # Transcode the main feature
-        run_transcode_cmd(src_path, out_file_path, job)
-        logging.info("FFMPEG call successful")
-        # Update the status of the job as succeeded
-        track.status = "success"
-    except subprocess.CalledProcessError as ffmpeg_error:
-        # If it fails mark the job as failed and log it
-        err = f"Call to FFMPEG failed with code: {ffmpeg_error.returncode}"
-        logging.error(err)
-        track.status = "fail"
-        track.error = job.errors = err
-        job.status = "fail"
-        db.session.commit()
-        raise
+        try:
+            # Create the output directory if it doesn't exist
+            subprocess.check_output((f"mkdir -p {shlex.quote(out_path)} "
+                                     f"&& chmod -R 777 {shlex.quote(out_path)}"), shell=True)
+            # Transcode the main feature
+            run_transcode_cmd(src_path, out_file_path, job)
+            logging.info("FFMPEG call successful")
+            # Update the status of the job as succeeded
+            track.status = "success"
+        except subprocess.CalledProcessError as ffmpeg_error:
+            # If it fails mark the job as failed and log it
+            err = f"Call to FFMPEG failed with code: {ffmpeg_error.returncode}"
+            logging.error(err)
+            track.status = "fail"
+            track.error = job.errors = err
+            job.status = "fail"
+            db_writer.commit()
+            raise
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
-    track.ripped = True
-    db.session.commit()
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
+        track.ripped = True
+        db_writer.commit()
 
 
 def ffmpeg_all(src_path, base_path, job):
@@ -279,56 +285,52 @@ def ffmpeg_all(src_path, base_path, job):
     :return: None
     """
     # Wait until there is a spot to transcode, if a limited amount of transcodes can run at once
-    ffmpeg_sleep_check(job)
-    db.session.commit()
-    logging.info("Starting BluRay/DVD transcoding - All titles")
-
-    get_track_info(src_path, job)
-
-    logging.debug(f"Total number of tracks is {job.no_of_titles}")
-
-    for track in job.tracks:
-        # Don't raise error if we past max titles, skip and continue till FFMPEG finishes
-        if int(track.track_number) > job.no_of_titles:
-            continue
-        if track.length < int(cfg.arm_config["MINLENGTH"]):
-            # if track is too short then skip it
-            logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length ({track.length}) is less than minimum length ({cfg.arm_config['MINLENGTH']}). "
-                         f"Skipping...")
-        elif track.length > int(cfg.arm_config["MAXLENGTH"]):
-            # If track is too long then skip it
-            logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length ({track.length}) is greater than maximum length ({cfg.arm_config['MAXLENGTH']}). "
-                         f"Skipping...")
-        else:
-            logging.info(f"Processing track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length is {track.length} seconds.")
+    with ffmpeg_sleep_check(job):
+        db_writer.commit()
+        logging.info("Starting BluRay/DVD transcoding - All titles")
 
-            out_file_name = f"title_{track.track_number}.{cfg.arm_config['DEST_EXT']}"
-            out_file_path = os.path.join(base_path, out_file_name)
+        get_track_info(src_path, job)
 
-            logging.info(f"Transcoding title {track.track_number} to {shlex.quote(out_file_path)}")
+        logging.debug(f"Total number of tracks is {job.no_of_titles}")
 
-            track.filename = track.orig_filename = out_file_name
-            db.session.commit()
+        # Read the job config here, the encodes run in pool threads without database access
+        ff_pre_args, ff_post_args = correct_ffmpeg_settings(job)
+        encodes = []
+        for track in job.tracks:
+            # Don't raise error if we past max titles, skip and continue till FFMPEG finishes
+            if int(track.track_number) > job.no_of_titles:
+                continue
+            if track.length < int(cfg.arm_config["MINLENGTH"]):
+                # if track is too short then skip it
+                logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length ({track.length}) is less than minimum length ({cfg.arm_config['MINLENGTH']}). "
+                             f"Skipping...")
+            elif track.length > int(cfg.arm_config["MAXLENGTH"]):
+                # If track is too long then skip it
+                logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length ({track.length}) is greater than maximum length ({cfg.arm_config['MAXLENGTH']}). "
+                             f"Skipping...")
+            else:
+                logging.info(f"Processing track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length is {track.length} seconds.")
 
-            try:
-                # Transcode the title
-                run_transcode_cmd(src_path, out_file_path, job)
-                track.status = "success"
-            except subprocess.CalledProcessError as ff_error:
-                err = f"FFMPEG encoding of title {track.track_number} failed with code: {ff_error.returncode}"
-                logging.error(err)
-                track.status = "fail"
-                track.error = err
-                db.session.commit()
-                raise
-            track.ripped = True
-            db.session.commit()
-
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
+                out_file_name = f"title_{track.track_number}.{cfg.arm_config['DEST_EXT']}"
+                out_file_path = os.path.join(base_path, out_file_name)
+
+                logging.info(f"Transcoding title {track.track_number} to {shlex.quote(out_file_path)}")
+
+                track.filename = track.orig_filename = out_file_name
+                db_writer.commit()
+
+                reporter = progress.transcoding(job, f"{track.track_number}/{job.no_of_titles}")
+                encodes.append((track, f"FFMPEG encoding of title {track.track_number}",
+                                partial(run_transcode_cmd, src_path, out_file_path, job, ff_pre_args, ff_post_args,
+                                        reporter)))
+
+        transcode_pool.run_encodes(job, encodes)
+
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
 
 
 def ffmpeg_default(src_path, base_path, job):
@@ -341,41 +343,41 @@ def ffmpeg_default(src_path, base_path, job):
     """
     # Wait until there is a spot to transcode (if amount of simultaneous transcodes are limited)
     job.status = "waiting_transcode"
-    db.session.commit()
-    ffmpeg_sleep_check(job)
-    job.status = "transcoding"
-    db.session.commit()
-
-    # This will fail if the directory raw gets deleted
-    for file in os.listdir(src_path):
-        src_path_name = os.path.join(src_path, file)
-        dest_file = os.path.splitext(file)[0]
-
-        # MakeMKV always saves in mkv we need to update the db with the new filename
-        logging.debug(dest_file + ".mkv")
-        job_current_track = job.tracks.filter_by(filename=dest_file + ".mkv")
-        track = None
-
-        # Generating the destination filename and updating the db
-        for track in job_current_track:
-            logging.debug("filename: " + track.filename)
-            track.orig_filename = track.filename
-            track.filename = dest_file + "." + cfg.arm_config["DEST_EXT"]
-            logging.debug("UPDATED filename: " + track.filename)
-            db.session.commit()
-        file_name = os.path.join(base_path, dest_file + "." + cfg.arm_config["DEST_EXT"])
-        out_file_path = os.path.join(base_path, file_name)
-        logging.info(f"Transcoding file {shlex.quote(file)} to {shlex.quote(out_file_path)}")
-
-        # Actually transcoding the file to the output location
-        try:
-            run_transcode_cmd(src_path_name, out_file_path, job)
-            logging.info("Transcode succeeded")
-        except subprocess.CalledProcessError as e:
-            logging.error(f"Transcode failed: {e}")
+    db_writer.commit()
+    with ffmpeg_sleep_check(job):
+        job.status = "transcoding"
+        db_writer.commit()
+
+        # This will fail if the directory raw gets deleted
+        for file in os.listdir(src_path):
+            src_path_name = os.path.join(src_path, file)
+            dest_file = os.path.splitext(file)[0]
+
+            # MakeMKV always saves in mkv we need to update the db with the new filename
+            logging.debug(dest_file + ".mkv")
+            job_current_track = job.tracks.filter_by(filename=dest_file + ".mkv")
+            track = None
+
+            # Generating the destination filename and updating the db
+            for track in job_current_track:
+                logging.debug("filename: " + track.filename)
+                track.orig_filename = track.filename
+                track.filename = dest_file + "." + cfg.arm_config["DEST_EXT"]
+                logging.debug("UPDATED filename: " + track.filename)
+                db_writer.commit()
+            file_name = os.path.join(base_path, dest_file + "." + cfg.arm_config["DEST_EXT"])
+            out_file_path = os.path.join(base_path, file_name)
+            logging.info(f"Transcoding file {shlex.quote(file)} to {shlex.quote(out_file_path)}")
+
+            # Actually transcoding the file to the output location
+            try:
+                run_transcode_cmd(src_path_name, out_file_path, job)
+                logging.info("Transcode succeeded")
+            except subprocess.CalledProcessError as e:
+                logging.error(f"Transcode failed: {e}")
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
 
 
 def get_track_info(src_path, job):
@@ -414,68 +416,113 @@ def ffmpeg_mkv(src_path, base_path, job):
     """
     # Added to limit number of transcodes
     job.status = "waiting_transcode"
-    db.session.commit()
-    ffmpeg_sleep_check(job)
-    job.status = "transcoding"
-    db.session.commit()
-
-    # This will fail if the directory raw gets deleted
-    for files in os.listdir(src_path):
-        src_files_path = os.path.join(src_path, files)
-        dest_file = os.path.splitext(files)[0]
-        # MakeMKV always saves in mkv we need to update the db with the new filename
-        logging.debug(dest_file + ".mkv")
-        job_current_track = job.tracks.filter_by(filename=dest_file + ".mkv")
-        track = None
-        # Generating the destination filename and updating the db
-        for track in job_current_track:
-            logging.debug("filename: " + track.filename)
-            track.orig_filename = track.filename
-            track.filename = dest_file + "." + cfg.arm_config["DEST_EXT"]
-            logging.debug("UPDATED filename: " + track.filename)
-            db.session.commit()
-
-        # Use filename relative to basepath
-        file_name = dest_file + "." + cfg.arm_config["DEST_EXT"]
-        file_path_name = os.path.join(base_path, file_name)
-
-        logging.info(f"Transcoding file {shlex.quote(files)} to {shlex.quote(file_path_name)}")
+    db_writer.commit()
+    with ffmpeg_sleep_check(job):
+        job.status = "transcoding"
+        db_writer.commit()
+
+        # Making the output directory if it doesn't exist
+        subprocess.check_output((f"mkdir -p {shlex.quote(base_path)} "
+                                 f"&& chmod -R 777 {shlex.quote(base_path)}"), shell=True)
+        ff_pre_args, ff_post_args = correct_ffmpeg_settings(job)
 
+        # This will fail if the directory raw gets deleted
+        encodes = []
+        for files in os.listdir(src_path):
+            track, src_files_path, file_path_name = ffmpeg_mkv_file_paths(src_path, base_path, job, files)
+            encodes.append((track, f"FFmpeg encoding of {files}",
+                            partial(run_transcode_cmd, src_files_path, file_path_name, job, ff_pre_args, ff_post_args,
+                                    progress.transcoding(job, files))))
         try:
-            # Making the output directory if it doesn't exist
-            subprocess.check_output((f"mkdir -p {shlex.quote(base_path)} "
-                                     f"&& chmod -R 777 {shlex.quote(base_path)}"), shell=True)
-
-            # Actually transcoding the file to the output location & updating the db with the status
-            run_transcode_cmd(src_files_path, file_path_name, job)
-            logging.info("FFmpeg call successful")
-            if track is not None:
-                track.status = "success"
-                db.session.commit()
-            else:
-                logging.debug("No matching DB track found to mark success")
+            transcode_pool.run_encodes(job, encodes)
         except subprocess.CalledProcessError as ff_error:
-            # Mark track and job as failed if ffmpeg fails
+            # Mark the job as failed if ffmpeg fails, the tracks were marked by the pool
             err = f"Call to FFmpeg failed with code: {ff_error.returncode}"
             logging.error(err)
-            if track is not None:
-                track.status = "fail"
-                track.error = err
             job.errors = err
             job.status = "fail"
-            db.session.commit()
+            db_writer.commit()
             raise
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
+
+
+def ffmpeg_mkv_file(src_path, base_path, job, files):
+    """
+    Transcode a single mkv file ripped by MakeMKV.\n\n
+    :param src_path: Directory holding the mkv file\n
+    :param base_path: Path where FFMpeg will save trancoded files\n
+    :param job: Disc object\n
+    :param files: Filename of the mkv file in src_path\n
+    :return: None
+    """
+    track, src_files_path, file_path_name = ffmpeg_mkv_file_paths(src_path, base_path, job, files)
+
+    try:
+        # Making the output directory if it doesn't exist
+        subprocess.check_output((f"mkdir -p {shlex.quote(base_path)} "
+                                 f"&& chmod -R 777 {shlex.quote(base_path)}"), shell=True)
+
+        # Actually transcoding the file to the output location & updating the db with the status
+        run_transcode_cmd(src_files_path, file_path_name, job)
+        logging.info("FFmpeg call successful")
+        if track is not None:
+            track.status = "success"
+            db_writer.commit()
+        else:
+            logging.debug("No matching DB track found to mark success")
+    except subprocess.CalledProcessError as ff_error:
+        # Mark track and job as failed if ffmpeg fails
+        err = f"Call to FFmpeg failed with code: {ff_error.returncode}"
+        logging.error(err)
+        if track is not None:
+            track.status = "fail"
+            track.error = err
+        job.errors = err
+        job.status = "fail"
+        db_writer.commit()
+        raise
 
 
-def run_transcode_cmd(src_file, out_file, job, ff_pre_args="", ff_post_args=""):
+def ffmpeg_mkv_file_paths(src_path, base_path, job, files):
+    """
+    Rename the track of a mkv file ripped by MakeMKV and work out where to transcode it to.\n\n
+    Parameters are the same as for ffmpeg_mkv_file\n
+    :return: (track or None if the file has no track, source file path, output file path)
+    """
+    src_files_path = os.path.join(src_path, files)
+    dest_file = os.path.splitext(files)[0]
+    # MakeMKV always saves in mkv we need to update the db with the new filename
+    logging.debug(dest_file + ".mkv")
+    job_current_track = job.tracks.filter_by(filename=dest_file + ".mkv")
+    track = None
+    # Generating the destination filename and updating the db
+    for track in job_current_track:
+        logging.debug("filename: " + track.filename)
+        track.orig_filename = track.filename
+        track.filename = dest_file + "." + cfg.arm_config["DEST_EXT"]
+        logging.debug("UPDATED filename: " + track.filename)
+        db_writer.commit()
+
+    # Use filename relative to basepath
+    file_name = dest_file + "." + cfg.arm_config["DEST_EXT"]
+    file_path_name = os.path.join(base_path, file_name)
+
+    logging.info(f"Transcoding file {shlex.quote(files)} to {shlex.quote(file_path_name)}")
+    return track, src_files_path, file_path_name
+
+
+def run_transcode_cmd(src_file, out_file, job, ff_pre_args="", ff_post_args="", reporter=None):
     """
     Run the FFmpeg command and capture the progress for the progress bar in the ui
+
+    The reporter has to be created up front when this runs on a transcode pool thread.
     """
     if not ff_pre_args or not ff_post_args:
         ff_pre_args, ff_post_args = correct_ffmpeg_settings(job)
+    if reporter is None:
+        reporter = progress.transcoding(job, os.path.basename(src_file))
 
     # Get the total duration of the source file using ffprobe for progress calculation (in microseconds)
     total_duration = 0
@@ -500,22 +547,23 @@ def run_transcode_cmd(src_file, out_file, job, ff_pre_args="", ff_post_args=""):
     process = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
                                universal_newlines=True, bufsize=1)
 
-    for line in process.stdout:  # type: ignore
-        if logging.getLogger().isEnabledFor(logging.DEBUG):
-            logging.debug(line.strip())
-            if total_duration > 0 and "out_time_us" in line:
-                parts = line.strip().split("=")
-                if len(parts) == 2 and parts[0] == "out_time_us":
-                    try:
-                        out_time_us = int(parts[1])
-                        percentage = (out_time_us / total_duration) * 100
-                        # Clamp percentage between 0 and 100
-                        percentage = max(0, min(100, percentage))
-                        logging.info(f"ARM: Transcoding progress: {percentage:.2f}%")
-                    except ValueError:
-                        pass
-        else:
-            if total_duration > 0 and "time=" in line:
+    name = f"FFmpeg {reporter.title}".rstrip()
+    with RawOutput("ffmpeg", label=reporter.title) as raw:
+        for line in process.stdout:  # type: ignore
+            line = line.strip()
+            raw.write(line)
+            if total_duration <= 0:
+                continue
+            if line.startswith("out_time_us="):
+                try:
+                    out_time_us = int(line.split("=", 1)[1])
+                except ValueError:
+                    continue
+                # Clamp percentage between 0 and 100
+                percentage = max(0, min(100, (out_time_us / total_duration) * 100))
+                raw.summary(f"{name}: transcoding progress {percentage:.2f}%")
+                reporter.update(percentage)
+            elif "time=" in line:
                 time_search = re.search(r'time=(\d{2}):(\d{2}):(\d{2})\.(\d{2})', line)
                 if time_search:
                     hours = int(time_search.group(1))
@@ -525,11 +573,13 @@ def run_transcode_cmd(src_file, out_file, job, ff_pre_args="", ff_post_args=""):
                     out_time_us = (hours * 3600 + minutes * 60 + seconds) * 1000000 + milliseconds * 10000
                     percentage = (out_time_us / total_duration) * 100
                     percentage = max(0, min(100, percentage))
-                    logging.info(f"ARM: {line.strip()} - {percentage:.2f}%")
-            else:
-                logging.debug(line.strip())
+                    raw.summary(f"{name}: {line} - {percentage:.2f}%")
+                    fps_search = re.search(r'fps=\s*([\d.]+)', line)
+                    reporter.update(percentage, rate=float(fps_search.group(1)) if fps_search else None,
+                                    rate_unit="fps")
 
     process.wait()
+    reporter.finish()
 
     if process.returncode != 0:
         raise subprocess.CalledProcessError(process.returncode, cmd)
@@ -6,51 +6,89 @@ import logging
 import subprocess
 import re
 import shlex
+from contextlib import contextmanager
+from functools import partial
+
 import arm.config.config as cfg
 
-from arm.ripper import utils
-from arm.ui import app, db  # noqa E402
+from arm.ripper import utils, slot_scheduler, transcode_pool, progress
+from arm.ripper.raw_output import RawOutput
+from arm.ui import app, db_writer  # noqa E402
 from arm.models.job import JobState
 
 PROCESS_COMPLETE = "Handbrake processing complete"
+HB_PROGRESS_RE = re.compile(r"Encoding: task (\d+ of \d+), (\d{1,3}\.\d{2}) %"
+                            r"(?: \((?:([\d.]+) fps, avg [\d.]+ fps, ETA ([\dhms]+))?)?")
 
 
-def run_handbrake_command(cmd, track=None, track_number=None):
+def run_handbrake_command(cmd, track=None, track_number=None, reporter=None, logfile=None):
     """
     Execute a HandBrake command and handle errors consistently.
 
+    HandBrake prints its progress on stdout, which is read here and published
+    through the reporter. Its log on stderr goes to the raw HandBrake output of
+    the logfile.
+
     :param cmd: The HandBrake command to execute
     :param track: Optional track object to update status
     :param track_number: Optional track number for error messages
-    :return: Output from HandBrake command
+    :param reporter: Optional arm.ripper.progress.Reporter for the progress bar in the ui
+    :param logfile: Job log the raw output belongs to, the current log file if None
+    :return: None
     :raises subprocess.CalledProcessError: If HandBrake fails
     """
     logging.debug(f"Sending command: {cmd}")
 
-    try:
-        hand_brake_output = subprocess.check_output(
-            cmd,
-            shell=True
-        ).decode("utf-8")
-        logging.debug(f"Handbrake exit code: {hand_brake_output}")
+    label = reporter.title if reporter is not None else str(track_number or "")
+    name = f"HandBrake {label}".rstrip()
+    # RawOutput is the inner one: its exit waits for the stderr pump before Popen closes the pipes
+    with subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc, \
+            RawOutput("handbrake", logfile, label) as raw:
+        raw.capture(proc.stderr)
+        for line in read_progress_lines(proc.stdout):
+            progress_search = HB_PROGRESS_RE.search(line)
+            if progress_search is None:
+                raw.write(line)
+                continue
+            task, percent, fps, eta = progress_search.groups()
+            raw.summary(f"{name}: {line}")
+            if reporter is not None:
+                reporter.update(float(percent), eta=eta, rate=float(fps) if fps else None, rate_unit="fps",
+                                stage=f"Encoding: task {task}")
+    if reporter is not None:
+        reporter.finish()
+    logging.debug(f"Handbrake exit code: {proc.returncode}")
+    if proc.returncode == 0:
         if track:
             track.status = "success"
-        return hand_brake_output
-    except subprocess.CalledProcessError as hb_error:
-        if track_number:
-            err = f"Handbrake encoding of title {track_number} failed with code: {hb_error.returncode}" \
-                  f"({hb_error.output})"
-        else:
-            err = f"Call to handbrake failed with code: {hb_error.returncode}({hb_error.output})"
-        logging.error(err)
-        if track:
-            track.status = "fail"
-            track.error = err
-        raise subprocess.CalledProcessError(hb_error.returncode, cmd)
+        return
+    if track_number:
+        err = f"Handbrake encoding of title {track_number} failed with code: {proc.returncode}"
+    else:
+        err = f"Call to handbrake failed with code: {proc.returncode}"
+    logging.error(err)
+    if track:
+        track.status = "fail"
+        track.error = err
+    raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
+def read_progress_lines(stream):
+    """
+    Split HandBrake output into lines as soon as it arrives, progress updates end with a carriage return\n
+    :param stream: binary stdout of the HandBrake process
+    :return: generator of lines without line endings
+    """
+    buffer = ""
+    while chunk := stream.read1(4096):
+        buffer += chunk.decode("utf-8", errors="ignore")
+        *lines, buffer = re.split(r"[\r\n]", buffer)
+        yield from (line for line in lines if line)
+    if buffer:
+        yield buffer
 
 
-def build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, logfile,
-                            track_number=None, main_feature=False):
+def build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, track_number=None, main_feature=False):
     """
     Build a HandBrake command string with consistent formatting.
 
@@ -58,7 +96,6 @@ def build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, logfile,
     :param filepathname: Full output path including filename
     :param hb_preset: HandBrake preset to use
     :param hb_args: Additional HandBrake arguments
-    :param logfile: Logfile for HB to redirect output to
     :param track_number: Optional track number to encode
     :param main_feature: Whether to use --main-feature flag
     :return: Formatted command string
@@ -76,25 +113,27 @@ def build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, logfile,
     if track_number is not None:
         cmd += f"-t {track_number} "
 
-    cmd += f"{hb_args} " \
-           f">> {logfile} 2>&1"
+    # stdout carries the progress and stderr the log, both read by run_handbrake_command
+    cmd += f"{hb_args}"
 
     return cmd
 
 
+@contextmanager
 def handbrake_sleep_check(job):
-    """Wait until there is a spot to transcode.
+    """Wait until there is a spot to transcode and hold it for the with block.
 
     If handbrake is used as a ripping utility (the source path is a device),
     this means that the drive is blocked. If we transcode after makemkv, the
     drive associated to the job is ejected at this point.
     """
     logging.debug("Handbrake starting.")
-    utils.database_updater({"status": JobState.TRANSCODE_WAITING.value}, job)
+    utils.database_updater({"status": JobState.TRANSCODE_WAITING.value}, job, coalesce=True)
     # TODO: send a notification that jobs are waiting ?
-    utils.sleep_check_process("HandBrakeCLI", int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
-    logging.debug(f"Setting job status to '{JobState.TRANSCODE_ACTIVE.value}'")
-    utils.database_updater({"status": JobState.TRANSCODE_ACTIVE.value}, job)
+    with slot_scheduler.transcode_scheduler().slot():
+        logging.debug(f"Setting job status to '{JobState.TRANSCODE_ACTIVE.value}'")
+        utils.database_updater({"status": JobState.TRANSCODE_ACTIVE.value}, job, coalesce=True)
+        yield
 
 
 def handbrake_main_feature(srcpath, basepath, logfile, job):
@@ -102,44 +141,44 @@ def handbrake_main_feature(srcpath, basepath, logfile, job):
     Process dvd with main_feature enabled.\n\n
     :param srcpath: Path to source for HB (dvd or files)\n
     :param basepath: Path where HB will save trancoded files\n
-    :param logfile: Logfile for HB to redirect output to\n
+    :param logfile: Job log, the raw HandBrake output is kept next to it\n
     :param job: Disc object\n
     :return: None
     """
-    handbrake_sleep_check(job)
-    logging.info("Starting DVD Movie main_feature processing")
+    with handbrake_sleep_check(job):
+        logging.info("Starting DVD Movie main_feature processing")
 
-    filename = job.title + "." + cfg.arm_config["DEST_EXT"]
-    filepathname = os.path.join(basepath, filename)
-    logging.info(f"Ripping title main_feature to {shlex.quote(filepathname)}")
+        filename = job.title + "." + cfg.arm_config["DEST_EXT"]
+        filepathname = os.path.join(basepath, filename)
+        logging.info(f"Ripping title main_feature to {shlex.quote(filepathname)}")
 
-    get_track_info(srcpath, job)
+        get_track_info(srcpath, job)
 
-    track = job.tracks.filter_by(main_feature=True).first()
-    if track is None:
-        msg = "No main feature found by Handbrake. Turn main_feature to false in arm.yml and try again."
-        logging.error(msg)
-        raise RuntimeError(msg)
+        track = job.tracks.filter_by(main_feature=True).first()
+        if track is None:
+            msg = "No main feature found by Handbrake. Turn main_feature to false in arm.yml and try again."
+            logging.error(msg)
+            raise RuntimeError(msg)
 
-    track.filename = track.orig_filename = filename
-    db.session.commit()
+        track.filename = track.orig_filename = filename
+        db_writer.commit()
 
-    hb_args, hb_preset = correct_hb_settings(job)
-    cmd = build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, logfile, main_feature=True)
+        hb_args, hb_preset = correct_hb_settings(job)
+        cmd = build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, main_feature=True)
 
-    try:
-        run_handbrake_command(cmd, track)
-        logging.info("Handbrake call successful")
-    except subprocess.CalledProcessError:
-        job.errors = track.error
-        job.status = JobState.FAILURE.value
-        db.session.commit()
-        raise
+        try:
+            run_handbrake_command(cmd, track, reporter=progress.transcoding(job, "main feature"), logfile=logfile)
+            logging.info("Handbrake call successful")
+        except subprocess.CalledProcessError:
+            job.errors = track.error
+            job.status = JobState.FAILURE.value
+            db_writer.commit()
+            raise
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
-    track.ripped = True
-    db.session.commit()
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
+        track.ripped = True
+        db_writer.commit()
 
 
 def handbrake_all(srcpath, basepath, logfile, job):
@@ -147,58 +186,55 @@ def handbrake_all(srcpath, basepath, logfile, job):
     Process all titles on the dvd\n
     :param srcpath: Path to source for HB (dvd or files)\n
     :param basepath: Path where HB will save trancoded files\n
-    :param logfile: Logfile for HB to redirect output to\n
+    :param logfile: Job log, the raw HandBrake output is kept next to it\n
     :param job: Disc object\n
     :return: None
     """
-    handbrake_sleep_check(job)
-    logging.info("Starting BluRay/DVD transcoding - All titles")
-
-    hb_args, hb_preset = correct_hb_settings(job)
-    get_track_info(srcpath, job)
+    with handbrake_sleep_check(job):
+        logging.info("Starting BluRay/DVD transcoding - All titles")
 
-    logging.debug(f"Total number of tracks is {job.no_of_titles}")
+        hb_args, hb_preset = correct_hb_settings(job)
+        get_track_info(srcpath, job)
 
-    for track in job.tracks:
-        # Don't raise error if we past max titles, skip and continue till HandBrake finishes
-        if int(track.track_number) > job.no_of_titles:
-            continue
-        if track.length < int(cfg.arm_config["MINLENGTH"]):
-            # too short
-            logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length ({track.length}) is less than minimum length ({cfg.arm_config['MINLENGTH']}). "
-                         f"Skipping...")
-        elif track.length > int(cfg.arm_config["MAXLENGTH"]):
-            # too long
-            logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length ({track.length}) is greater than maximum length ({cfg.arm_config['MAXLENGTH']}). "
-                         f"Skipping...")
-        else:
-            # just right
-            logging.info(f"Processing track #{track.track_number} of {job.no_of_titles}. "
-                         f"Length is {track.length} seconds.")
+        logging.debug(f"Total number of tracks is {job.no_of_titles}")
 
-            track.filename = track.orig_filename = f"title_{track.track_number}.{cfg.arm_config['DEST_EXT']}"
-            filepathname = os.path.join(basepath, track.filename)
+        encodes = []
+        for track in job.tracks:
+            # Don't raise error if we past max titles, skip and continue till HandBrake finishes
+            if int(track.track_number) > job.no_of_titles:
+                continue
+            if track.length < int(cfg.arm_config["MINLENGTH"]):
+                # too short
+                logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length ({track.length}) is less than minimum length ({cfg.arm_config['MINLENGTH']}). "
+                             f"Skipping...")
+            elif track.length > int(cfg.arm_config["MAXLENGTH"]):
+                # too long
+                logging.info(f"Track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length ({track.length}) is greater than maximum length ({cfg.arm_config['MAXLENGTH']}). "
+                             f"Skipping...")
+            else:
+                # just right
+                logging.info(f"Processing track #{track.track_number} of {job.no_of_titles}. "
+                             f"Length is {track.length} seconds.")
 
-            logging.info(f"Transcoding title {track.track_number} to {shlex.quote(filepathname)}")
+                track.filename = track.orig_filename = f"title_{track.track_number}.{cfg.arm_config['DEST_EXT']}"
+                filepathname = os.path.join(basepath, track.filename)
 
-            db.session.commit()
+                logging.info(f"Transcoding title {track.track_number} to {shlex.quote(filepathname)}")
 
-            cmd = build_handbrake_command(srcpath, filepathname, hb_preset, hb_args, logfile,
-                                          track_number=track.track_number)
+                db_writer.commit()
 
-            try:
-                run_handbrake_command(cmd, track, track.track_number)
-            except subprocess.CalledProcessError:
-                db.session.commit()
-                raise
+                cmd = build_handbrake_command(srcpath, filepathname, hb_preset, hb_args,
+                                              track_number=track.track_number)
+                reporter = progress.transcoding(job, f"{track.track_number}/{job.no_of_titles}")
+                encodes.append((track, f"Handbrake encoding of title {track.track_number}",
+                                partial(run_handbrake_command, cmd, None, track.track_number, reporter, logfile)))
 
-            track.ripped = True
-            db.session.commit()
+        transcode_pool.run_encodes(job, encodes)
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
 
 
 def correct_hb_settings(job):
@@ -223,38 +259,71 @@ def handbrake_mkv(srcpath, basepath, logfile, job):
     Process all mkv files in a directory.\n\n
     :param srcpath: Path to source for HB (dvd or files)\n
     :param basepath: Path where HB will save trancoded files\n
-    :param logfile: Logfile for HB to redirect output to\n
+    :param logfile: Job log, the raw HandBrake output is kept next to it\n
     :param job: Disc object\n
     :return: None
     """
     # Added to limit number of transcodes
-    handbrake_sleep_check(job)
-    logging.info("Starting Handbrake for MKV files.")
-    hb_args, hb_preset = correct_hb_settings(job)
-
-    # This will fail if the directory raw gets deleted
-    for files in os.listdir(srcpath):
-        srcpathname = os.path.join(srcpath, files)
-        destfile = os.path.splitext(files)[0]
-        # MakeMKV always saves in mkv we need to update the db with the new filename
-        logging.debug(destfile + ".mkv")
-        job_current_track = job.tracks.filter_by(filename=destfile + ".mkv")
-        for track in job_current_track:
-            logging.debug("filename: " + track.filename)
-            track.orig_filename = track.filename
-            track.filename = destfile + "." + cfg.arm_config["DEST_EXT"]
-            logging.debug("UPDATED filename: " + track.filename)
-            db.session.commit()
-        filename = destfile + "." + cfg.arm_config["DEST_EXT"]
-        filepathname = os.path.join(basepath, filename)
+    with handbrake_sleep_check(job):
+        logging.info("Starting Handbrake for MKV files.")
+        hb_args, hb_preset = correct_hb_settings(job)
+
+        # This will fail if the directory raw gets deleted
+        encodes = []
+        for files in os.listdir(srcpath):
+            track, cmd = handbrake_mkv_file_command(srcpath, basepath, job, files, hb_preset, hb_args)
+            encodes.append((track, f"Handbrake encoding of {files}",
+                            partial(run_handbrake_command, cmd, reporter=progress.transcoding(job, files),
+                                    logfile=logfile)))
+        transcode_pool.run_encodes(job, encodes)
+
+        logging.info(PROCESS_COMPLETE)
+        logging.debug(f"\n\r{job.pretty_table()}")
 
-        logging.info(f"Transcoding file {shlex.quote(files)} to {shlex.quote(filepathname)}")
 
-        cmd = build_handbrake_command(srcpathname, filepathname, hb_preset, hb_args, logfile)
-        run_handbrake_command(cmd)
+def handbrake_mkv_file(srcpath, basepath, logfile, job, files, hb_preset, hb_args):
+    """
+    Transcode a single mkv file ripped by MakeMKV.\n\n
+    :param srcpath: Directory holding the mkv file\n
+    :param basepath: Path where HB will save trancoded files\n
+    :param logfile: Job log, the raw HandBrake output is kept next to it\n
+    :param job: Disc object\n
+    :param files: Filename of the mkv file in srcpath\n
+    :param hb_preset: HandBrake preset from correct_hb_settings\n
+    :param hb_args: HandBrake arguments from correct_hb_settings\n
+    :return: None
+    """
+    track, cmd = handbrake_mkv_file_command(srcpath, basepath, job, files, hb_preset, hb_args)
+    try:
+        run_handbrake_command(cmd, track, reporter=progress.transcoding(job, files), logfile=logfile)
+    finally:
+        db_writer.commit()
+
+
+def handbrake_mkv_file_command(srcpath, basepath, job, files, hb_preset, hb_args):
+    """
+    Rename the track of a mkv file ripped by MakeMKV and build the command to transcode it.\n\n
+    Parameters are the same as for handbrake_mkv_file, without the logfile\n
+    :return: (track or None if the file has no track, HandBrake command)
+    """
+    srcpathname = os.path.join(srcpath, files)
+    destfile = os.path.splitext(files)[0]
+    # MakeMKV always saves in mkv we need to update the db with the new filename
+    logging.debug(destfile + ".mkv")
+    job_current_track = job.tracks.filter_by(filename=destfile + ".mkv")
+    track = None
+    for track in job_current_track:
+        logging.debug("filename: " + track.filename)
+        track.orig_filename = track.filename
+        track.filename = destfile + "." + cfg.arm_config["DEST_EXT"]
+        logging.debug("UPDATED filename: " + track.filename)
+        db_writer.commit()
+    filename = destfile + "." + cfg.arm_config["DEST_EXT"]
+    filepathname = os.path.join(basepath, filename)
+
+    logging.info(f"Transcoding file {shlex.quote(files)} to {shlex.quote(filepathname)}")
 
-    logging.info(PROCESS_COMPLETE)
-    logging.debug(f"\n\r{job.pretty_table()}")
+    return track, build_handbrake_command(srcpathname, filepathname, hb_preset, hb_args)
 
 
 def get_track_info(srcpath, job):
@@ -291,7 +360,7 @@ def get_track_info(srcpath, job):
                     logging.debug(f"Line found is: {line}")
                     logging.info(f"Found {titles} titles")
                     job.no_of_titles = titles
-                    db.session.commit()
+                    db_writer.commit()
 
             main_feature, t_no = title_finder(aspect, fps, job, line, main_feature, seconds, t_no, t_pattern)
             seconds = seconds_builder(line, pattern, seconds)
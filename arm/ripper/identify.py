@@ -3,7 +3,8 @@
 
 import os
 import logging
-import urllib
+import concurrent.futures
+import time
 import re
 import datetime
 import unicodedata
@@ -15,13 +16,16 @@ import xmltodict
 import arm.config.config as cfg
 from arm.models import Job
 
-from arm.ripper import utils
+from arm.ripper import known_discs, utils
 from arm.ripper.ProcessHandler import arm_subprocess
-from arm.ui import db
+from arm.ui import db_writer, http_client, title_dataset
 
 # flake8: noqa: W605
 from arm.ui import utils as ui_utils
 
+# Title searches sent to the metadata provider at the same time
+IDENTIFY_WORKERS = 4
+
 
 def find_mount(devpath: str) -> str | None:
     """
@@ -83,7 +87,7 @@ def identify(job):
                 get_video_details(job)
             else:
                 job.hasnicetitle = False
-                db.session.commit()
+                db_writer.commit()
 
             logging.info(f"Disc title Post ident -  title:{job.title} "
                          f"year:{job.year} video_type:{job.video_type} "
@@ -108,7 +112,7 @@ def identify_bluray(job):
         if str(job.label) == "":
             job.title = str(job.label)
             job.year = ""
-            db.session.commit()
+            db_writer.commit()
             return False
         else:
             bluray_title = str(job.label)
@@ -116,7 +120,7 @@ def identify_bluray(job):
             bluray_title = bluray_title.title()
             job.title = job.title_auto = bluray_title
             job.year = ""
-            db.session.commit()
+            db_writer.commit()
             return True
 
     try:
@@ -142,7 +146,7 @@ def identify_bluray(job):
 
     job.title = job.title_auto = bluray_title
     job.year = job.year_auto = bluray_year
-    db.session.commit()
+    db_writer.commit()
 
     return True
 
@@ -155,34 +159,40 @@ def identify_dvd(job):
     # Some older DVDs aren't actually labelled
     if not job.label or job.label == "":
         job.label = "not identified"
+    known_disc = None
     try:
         crc64 = pydvdid.compute(str(job.mountpoint))
         dvd_title = f"{job.label}_{crc64}"
         logging.info(f"DVD CRC64 hash is: {crc64}")
         job.crc_id = str(crc64)
-        urlstring = f"https://1337server.pythonanywhere.com/api/v1/?mode=s&crc64={crc64}"
-        logging.debug(urlstring)
-        dvd_info_xml = urllib.request.urlopen(urlstring).read()
-        arm_api_json = json.loads(dvd_info_xml)
-        logging.debug(f"dvd xml - {arm_api_json}")
-        logging.debug(f"results = {arm_api_json['results']}")
-        if arm_api_json['success']:
-            logging.info("Found crc64 id from online API")
-            logging.info(f"title is {arm_api_json['results']['0']['title']}")
-            args = {
-                'title': arm_api_json['results']['0']['title'],
-                'title_auto': arm_api_json['results']['0']['title'],
-                'year': arm_api_json['results']['0']['year'],
-                'year_auto': arm_api_json['results']['0']['year'],
-                'imdb_id': arm_api_json['results']['0']['imdb_id'],
-                'imdb_id_auto': arm_api_json['results']['0']['imdb_id'],
-                'video_type': arm_api_json['results']['0']['video_type'],
-                'video_type_auto': arm_api_json['results']['0']['video_type'],
-                'poster_url': arm_api_json['results']['0']['poster_img'],
-                'poster_url_auto': arm_api_json['results']['0']['poster_img'],
-                'hasnicetitle': True
-            }
-            utils.database_updater(args, job)
+        known_disc = known_discs.lookup(crc64)
+        if known_disc is not None:
+            logging.info(f"Found crc64 id in the local disc index, title is {known_disc.title}, "
+                         f"ripped titles were {known_disc.titles}")
+            utils.database_updater(known_discs.job_args(known_disc), job)
+        else:
+            urlstring = f"https://1337server.pythonanywhere.com/api/v1/?mode=s&crc64={crc64}"
+            logging.debug(urlstring)
+            arm_api_json = http_client.get(urlstring).json()
+            logging.debug(f"dvd xml - {arm_api_json}")
+            logging.debug(f"results = {arm_api_json['results']}")
+            if arm_api_json['success']:
+                logging.info("Found crc64 id from online API")
+                logging.info(f"title is {arm_api_json['results']['0']['title']}")
+                args = {
+                    'title': arm_api_json['results']['0']['title'],
+                    'title_auto': arm_api_json['results']['0']['title'],
+                    'year': arm_api_json['results']['0']['year'],
+                    'year_auto': arm_api_json['results']['0']['year'],
+                    'imdb_id': arm_api_json['results']['0']['imdb_id'],
+                    'imdb_id_auto': arm_api_json['results']['0']['imdb_id'],
+                    'video_type': arm_api_json['results']['0']['video_type'],
+                    'video_type_auto': arm_api_json['results']['0']['video_type'],
+                    'poster_url': arm_api_json['results']['0']['poster_img'],
+                    'poster_url_auto': arm_api_json['results']['0']['poster_img'],
+                    'hasnicetitle': True
+                }
+                utils.database_updater(args, job)
     except Exception as error:
         logging.error(f"Pydvdid failed with the error: {error}")
         dvd_title = str(job.label)
@@ -199,13 +209,14 @@ def identify_dvd(job):
     logging.debug(f"dvd_title SKU$: {dvd_title}")
 
     # Do we really need metaselector if we have got from ARM online db?
-    try:
-        dvd_info_xml = metadata_selector(job, dvd_title, year)
-        logging.debug(f"DVD_INFO_XML: {dvd_info_xml}")
-        identify_loop(job, dvd_info_xml, dvd_title, year)
-    except Exception:
-        dvd_info_xml = None
-        logging.debug("Cant connect to online service!")
+    # A disc we identified before is taken as it is, no need to ask online
+    if known_disc is None:
+        try:
+            dvd_info_xml = metadata_selector(job, dvd_title, year)
+            logging.debug(f"DVD_INFO_XML: {dvd_info_xml}")
+            identify_loop(job, dvd_info_xml, dvd_title, year)
+        except Exception:
+            logging.debug("Cant connect to online service!")
     # Failsafe so that we always have a title.
     if job.title is None or job.title == "None":
         job.title = str(job.label)
@@ -289,12 +300,11 @@ def update_job(job, search_results):
     return utils.database_updater(args, job)
 
 
-def metadata_selector(job, title=None, year=None):
+def metadata_search(title=None, year=None):
     """
-    Used to switch between OMDB or TMDB as the metadata provider\n
+    Ask the selected metadata provider about one title\n
     - TMDB returned queries are converted into the OMDB format
 
-    :param job: The job class
     :param title: this can either be a search string or movie/show title
     :param year: the year of movie/show release
 
@@ -304,89 +314,100 @@ def metadata_selector(job, title=None, year=None):
     if cfg.arm_config['METADATA_PROVIDER'].lower() == "tmdb":
         logging.debug("provider tmdb")
         search_results = ui_utils.tmdb_search(title, year)
-        if search_results is not None:
-            update_job(job, search_results)
     elif cfg.arm_config['METADATA_PROVIDER'].lower() == "omdb":
         logging.debug("provider omdb")
         search_results = ui_utils.call_omdb_api(str(title), str(year))
-        if search_results is not None:
-            update_job(job, search_results)
+    elif cfg.arm_config['METADATA_PROVIDER'].lower() == "local":
+        logging.debug("provider local")
+        search_results = title_dataset.search(title, year)
     else:
         logging.debug(cfg.arm_config['METADATA_PROVIDER'])
         logging.debug("unknown provider - doing nothing, saying nothing. Getting Kryten")
     return search_results
 
 
-def identify_loop(job, response, title, year):
+def metadata_selector(job, title=None, year=None):
     """
+    Used to switch between OMDB or TMDB as the metadata provider\n
+    - TMDB returned queries are converted into the OMDB format
 
-    :param job:
-    :param response:
-    :param title:
-    :param year:
+    :param job: The job class
+    :param title: this can either be a search string or movie/show title
+    :param year: the year of movie/show release
+
+    :return: json/dict object or None
     """
-    # handle failures
-    # this is a little kludgy, but it kind of works...
-    logging.debug(f"Response = {response}")
-    if response is None:
-        # try with year first
-        response = try_with_year(job, response, title, year)
-        # try submitting without the year
-        response = try_without_year(job, response, title)
-
-        if response is None:
-            while response is None and title.find("-") > 0:
-                title = title.rsplit('-', 1)[0]
-                logging.debug(f"Trying title: {title}")
-                response = metadata_selector(job, title, year)
-                logging.debug(f"response: {response}")
-
-            # if still fail, then try slicing off the last word in a loop
-            while response is None and title.count('+') > 0:
-                title = title.rsplit('+', 1)[0]
-                logging.debug(f"Trying title: {title}")
-                response = metadata_selector(job, title, year)
-                logging.debug(f"response: {response}")
-                if response is None:
-                    # Still failing - try the words we have without year
-                    logging.debug("Removing year...")
-                    response = metadata_selector(job, title)
-
-
-def try_without_year(job, response, title):
+    search_results = metadata_search(title, year)
+    if search_results is not None:
+        update_job(job, search_results)
+    return search_results
+
+
+def title_candidates(title, year):
     """
+    All (title, year) searches tried for a disc, in order of preference\n
+    With the year, the year before (the disc is often released the year after the movie),
+    without the year, then shorter and shorter titles cut at "-" and "+".
 
-    :param job:
-    :param response:
-    :param title:
-    :return:
+    :param str title: title with the words joined by "+"
+    :param str year: year of release, may be ""
+    :return list: (title, year) tuples without duplicates
     """
-    if response is None:
-        logging.debug("Removing year...")
-        response = metadata_selector(job, title)
-        logging.debug(f"response: {response}")
-    return response
+    candidates = []
+    if year:
+        candidates.append((title, str(year)))
+        candidates.append((title, str(int(year) - 1)))
+    candidates.append((title, None))
+    while title.find("-") > 0:
+        title = title.rsplit('-', 1)[0]
+        candidates.append((title, year))
+    while title.count('+') > 0:
+        title = title.rsplit('+', 1)[0]
+        candidates.append((title, year))
+        candidates.append((title, None))
+    return list(dict.fromkeys(candidates))
+
+
+def _search_candidate(title, year):
+    try:
+        return metadata_search(title, year)
+    except Exception as error:
+        logging.debug(f"Search for {title} ({year}) failed: {error}")
+        return None
 
 
-def try_with_year(job, response, title, year):
+def identify_loop(job, response, title, year):
     """
+    Search all title candidates at once and keep the most preferred one that was found\n
+    Up to IDENTIFY_WORKERS searches run together, the ones after the winner are dropped.
+    The whole search gives up after IDENTIFY_TIMEOUT seconds, keeping the best result so far.
 
     :param job:
-    :param response:
+    :param response: result of an earlier search, nothing is searched if it isn't None
     :param title:
     :param year:
-    :return:
     """
-    # If we have a response don't overwrite it
+    logging.debug(f"Response = {response}")
     if response is not None:
-        return response
-    if year:
-        response = metadata_selector(job, title, str(year))
-        logging.debug(f"response: {response}")
-    # If we still don't have a response try removing a year off
-    if response is None and year:
-        # This accounts for when
-        # the dvd release date is the year following the movie release date
-        logging.debug("Subtracting 1 year...")
-        response = metadata_selector(job, title, str(int(year) - 1))
-    return response
+        return
+    candidates = title_candidates(title, year)
+    logging.debug(f"Trying titles: {candidates}")
+    deadline = time.monotonic() + float(cfg.arm_config.get('IDENTIFY_TIMEOUT', 30))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=IDENTIFY_WORKERS, thread_name_prefix="identify")
+    futures = [executor.submit(_search_candidate, *candidate) for candidate in candidates]
+    try:
+        for candidate, future in zip(candidates, futures):
+            try:
+                response = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except concurrent.futures.TimeoutError:
+                logging.info(f"Identification took longer than {cfg.arm_config.get('IDENTIFY_TIMEOUT', 30)}s, "
+                             f"keeping the best result so far")
+                response = next((f.result() for f in futures if f.done() and f.result() is not None), None)
+                break
+            logging.debug(f"{candidate}: {response}")
+            if response is not None:
+                break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    if response is not None:
+        update_job(job, response)
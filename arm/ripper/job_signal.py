@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Wake up rippers that wait for user input on a job
+
+A ripper waiting in manual mode listens on a fifo named after its job, next
+to the ARM database. The UI writes to that fifo whenever it changes the job,
+so the ripper re-reads the job straight away instead of on its next poll.
+Without a listener the UI write is a no-op.
+"""
+import errno
+import logging
+import os
+import select
+import time
+from contextlib import contextmanager, suppress
+
+import arm.config.config as cfg
+from arm.ui import db
+
+
+def signal_path(job_id):
+    """
+    Fifo of a job\n
+    :param job_id: id of the job
+    :return str: absolute path, stored next to the ARM database
+    """
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), "signals", f"job.{int(job_id)}")
+
+
+def post(job_id):
+    """
+    Tell the ripper of a job that the job was changed, nobody listening is fine\n
+    :param job_id: id of the changed job
+    :return: None
+    """
+    try:
+        fd = os.open(signal_path(job_id), os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as error:
+        if error.errno not in (errno.ENXIO, errno.ENOENT):
+            logging.warning(f"Could not signal job {job_id}: {error}")
+        return
+    try:
+        os.write(fd, b"\n")
+    except BlockingIOError:
+        # The listener has unread signals, one more doesn't change anything
+        pass
+    finally:
+        os.close(fd)
+
+
+class JobListener:
+    """
+    Open fifo of a waiting job, see listen()
+    """
+
+    def __init__(self, job, fd):
+        self.job = job
+        self.fd = fd
+
+    def wait(self, timeout, ready):
+        """
+        Wait up to timeout seconds for ready() to return True\n
+        The job is refreshed from the database when the UI signals a change and when the time is up.
+        :param timeout: seconds to wait
+        :param ready: callable without arguments, checked after every refresh
+        :return bool: result of the last ready() call
+        """
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            readable, _, _ = select.select([self.fd], [], [], remaining)
+            if not readable:
+                break
+            with suppress(BlockingIOError):
+                os.read(self.fd, 512)
+            db.session.refresh(self.job)
+            if ready():
+                return True
+        db.session.refresh(self.job)
+        return ready()
+
+
+@contextmanager
+def listen(job):
+    """
+    Listen for UI changes of a job for the duration of the with block\n
+    :param job: Current job
+    :return: JobListener
+    """
+    path = signal_path(job.job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with suppress(FileExistsError):
+        os.mkfifo(path, 0o660)
+    # Opened read/write so the fifo never reports EOF and signals sent
+    # between two waits are kept until the next one
+    fd = os.open(path, os.O_RDWR | os.O_NONBLOCK)
+    try:
+        yield JobListener(job, fd)
+    finally:
+        os.close(fd)
+        with suppress(FileNotFoundError):
+            os.unlink(path)
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Local index of the DVDs ARM has identified, keyed on the pydvdid CRC64
+
+A DVD ripped successfully with a proper title is remembered with its title,
+year, imdb id, type, poster and the tracks that were ripped. When the same disc
+comes back, identify_dvd takes all of it from here, without asking the online
+CRC64 database or the metadata provider. Discs learnt from own jobs win over
+imported ones. The index can be moved between installs as a CSV dump:
+    python3 arm/ripper/known_discs.py export discs.csv
+    python3 arm/ripper/known_discs.py import discs.csv
+"""
+import argparse
+import csv
+import datetime
+import logging
+import sys
+from importlib.util import find_spec
+from pathlib import Path
+
+# If the arm module can't be found, add the folder this file is in to PYTHONPATH
+if find_spec("arm") is None:
+    sys.path.append(str(Path(__file__).parents[2]))
+
+from arm.models.job import JobState  # noqa: E402
+from arm.models.known_disc import KnownDisc  # noqa: E402
+from arm.ui import app, db, db_writer  # noqa: E402
+
+DUMP_FIELDS = ("crc_id", "title", "year", "imdb_id", "video_type", "poster_url", "titles")
+
+
+def lookup(crc_id):
+    """
+    Known disc with this CRC64\n
+    :param crc_id: pydvdid CRC64 of the disc
+    :return KnownDisc: None if the disc was never seen
+    """
+    if not crc_id:
+        return None
+    return KnownDisc.query.get(str(crc_id))
+
+
+def job_args(disc):
+    """
+    database_updater() arguments that identify a job as disc\n
+    :param KnownDisc disc:
+    :return dict:
+    """
+    return {
+        'title': disc.title,
+        'title_auto': disc.title,
+        'year': disc.year,
+        'year_auto': disc.year,
+        'imdb_id': disc.imdb_id,
+        'imdb_id_auto': disc.imdb_id,
+        'video_type': disc.video_type,
+        'video_type_auto': disc.video_type,
+        'poster_url': disc.poster_url,
+        'poster_url_auto': disc.poster_url,
+        'hasnicetitle': True
+    }
+
+
+def remember(job):
+    """
+    Add or update the disc of a successful, nicely titled DVD job\n
+    Called when a job finishes and when the title of a finished job is corrected.
+    :param job: Job
+    :return bool: True if the disc was stored
+    """
+    if job.disctype != "dvd" or not job.crc_id or not job.hasnicetitle or job.status != JobState.SUCCESS.value:
+        return False
+    disc = KnownDisc.query.get(job.crc_id) or KnownDisc(job.crc_id)
+    for field in ("title", "year", "imdb_id", "video_type", "poster_url"):
+        setattr(disc, field, getattr(job, field))
+    disc.titles = ",".join(str(track.track_number) for track in job.tracks if track.ripped)
+    disc.source = "job"
+    disc.job_id = job.job_id
+    disc.updated = datetime.datetime.now()
+    db.session.add(disc)
+    db_writer.commit()
+    logging.info(f"Remembered disc {job.crc_id} as {job.title} ({job.year})")
+    return True
+
+
+def import_dump(path):
+    """
+    Add the discs of a CSV dump, discs learnt from own jobs are kept\n
+    :param path: CSV file with a header of DUMP_FIELDS, extra columns are ignored
+    :return int: number of discs added or updated
+    """
+    count = 0
+    with open(path, newline="", encoding="utf-8") as dump_file:
+        for row in csv.DictReader(dump_file):
+            crc_id = (row.get("crc_id") or "").strip()
+            if not crc_id or not row.get("title"):
+                continue
+            disc = KnownDisc.query.get(crc_id)
+            if disc is not None and disc.source == "job":
+                continue
+            disc = disc or KnownDisc(crc_id)
+            for field in DUMP_FIELDS[1:]:
+                setattr(disc, field, row.get(field) or None)
+            disc.source = "import"
+            disc.job_id = None
+            disc.updated = datetime.datetime.now()
+            db.session.add(disc)
+            count += 1
+    db_writer.commit()
+    return count
+
+
+def export_dump(path):
+    """
+    Write all known discs to a CSV dump\n
+    :return int: number of discs written
+    """
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as dump_file:
+        writer = csv.DictWriter(dump_file, fieldnames=DUMP_FIELDS)
+        writer.writeheader()
+        for disc in KnownDisc.query.order_by(KnownDisc.crc_id):
+            writer.writerow(disc.get_d())
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export the known DVDs of ARM")
+    parser.add_argument("action", choices=("import", "export"))
+    parser.add_argument("file", help="CSV dump")
+    args = parser.parse_args()
+    with app.app_context():
+        if args.action == "import":
+            print(f"Imported {import_dump(args.file)} discs")
+        else:
+            print(f"Exported {export_dump(args.file)} discs")
+
+
+if __name__ == "__main__":
+    main()
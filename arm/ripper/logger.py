@@ -45,7 +45,34 @@ def setup_job_log(job):
     log_full = os.path.join(cfg.arm_config['LOGPATH'], log_file)
 
     job.logfile = log_file
+    _set_job_file_handler(log_file)
 
+    # Return the full logfile location to the logs
+    return log_full
+
+
+def attach_job_log(job):
+    """
+    Continue logging to the existing logfile of a job\n
+    Used by processes that pick up a job after the ripper has exited (e.g. transcode workers)
+    :return: full path to the job logfile
+    """
+    _set_job_file_handler(job.logfile)
+    return os.path.join(cfg.arm_config['LOGPATH'], job.logfile)
+
+
+def current_log_file():
+    """
+    Full path of the log file the messages currently go to, the job log once it is set up\n
+    :return str: None before any file handler was added
+    """
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler.baseFilename
+    return None
+
+
+def _set_job_file_handler(log_file):
     # If a more specific log file is created, the messages are not also logged to
     # arm.log, but they are still logged to stdout and syslog
     logger = logging.getLogger()
@@ -60,9 +87,6 @@ def setup_job_log(job):
     logging.getLogger("requests").setLevel(logging.WARN)
     logging.getLogger("urllib3").setLevel(logging.WARN)
 
-    # Return the full logfile location to the logs
-    return log_full
-
 
 def clean_up_logs(logpath, loglife):
     """
@@ -78,7 +102,7 @@ def clean_up_logs(logpath, loglife):
     now = time.time()
     logging.info(f"Looking for log files older than {loglife} days old.")
 
-    logs_folders = [logpath, os.path.join(logpath, 'progress')]
+    logs_folders = [logpath, os.path.join(logpath, 'progress'), os.path.join(logpath, 'raw')]
     # Loop through each log path
     for log_dir in logs_folders:
         logging.info(f"Checking path {log_dir} for old log files...")
@@ -88,7 +112,7 @@ def clean_up_logs(logpath, loglife):
             continue
         for filename in os.listdir(log_dir):
             fullname = os.path.join(log_dir, filename)
-            if fullname.endswith(".log") and os.stat(fullname).st_mtime < now - loglife * 86400:
+            if fullname.endswith((".log", ".log.gz")) and os.stat(fullname).st_mtime < now - loglife * 86400:
                 logging.info(f"Deleting log file: {filename}")
                 os.remove(fullname)
     return True
@@ -27,10 +27,10 @@ import arm.config.config as cfg  # noqa E402
 from arm.models.config import Config  # noqa: E402
 from arm.models.job import Job, JobState  # noqa: E402
 from arm.models.system_drives import SystemDrives  # noqa: E402
-from arm.ripper import (arm_ripper, identify, logger,  # noqa: E402
-                        music_brainz, utils)
+from arm.ripper import (arm_ripper, identify, known_discs, logger,  # noqa: E402
+                        music_brainz, progress, utils)
 from arm.ripper.ARMInfo import ARMInfo  # noqa E402
-from arm.ui import app, constants, db  # noqa E402
+from arm.ui import app, constants, db_writer, http_client, metadata_cache  # noqa E402
 from arm.ui.settings import DriveUtils as drive_utils  # noqa E402
 
 job: Optional[Job] = None
@@ -80,7 +80,11 @@ def log_arm_params(job):
                 "FFMPEG_ARGS", "RAW_PATH", "TRANSCODE_PATH",
                 "COMPLETED_PATH", "EXTRAS_SUB", "EMBY_REFRESH", "EMBY_SERVER",
                 "EMBY_PORT", "NOTIFY_RIP", "NOTIFY_TRANSCODE",
-                "MAX_CONCURRENT_TRANSCODES", "MAX_CONCURRENT_MAKEMKVINFO"):
+                "MAX_CONCURRENT_TRANSCODES", "MAX_CONCURRENT_MAKEMKVINFO", "TRANSCODE_WORKERS",
+                "PIPELINE_TRANSCODE", "TRANSCODE_JOB_PARALLELISM", "TRANSCODE_CPU_BUDGET",
+                "DATA_RIP_BAD_SECTORS", "DATA_RIP_HASH", "METADATA_CACHE_TTL",
+                "METADATA_CACHE_NEGATIVE_TTL", "METADATA_CACHE_SIZE", "METADATA_TIMEOUT", "IDENTIFY_TIMEOUT",
+                "HTTP_TIMEOUT", "RAW_OUTPUT_MAX_SIZE", "RAW_OUTPUT_COMPRESS"):
         logging.info(f"{key.lower()}: {str(cfg.arm_config.get(key, '<not given>'))}")
     logging.info("******************* End of config parameters *******************")
 
@@ -104,7 +108,10 @@ def check_fstab():
 
 
 def main():
-    """main disc processing function"""
+    """
+    main disc processing function\n
+    :return: True if the job was handed to the transcode queue and is not finished yet
+    """
     logging.info("Starting Disc identification")
     identify.identify(job)
 
@@ -122,22 +129,24 @@ def main():
     # Ripper type assessment for the various media types
     # Type: dvd/bluray
     if job.disctype in ["dvd", "bluray"]:
-        arm_ripper.rip_visual_media(have_dupes, job, log_file, job.has_track_99)
+        return arm_ripper.rip_visual_media(have_dupes, job, log_file, job.has_track_99)
 
     # Type: Music
     elif job.disctype == "music":
         # Try to recheck music disc for auto ident
         music_brainz.main(job)
-        if utils.rip_music(job, log_file):
+        rip_ok = utils.rip_music(job, log_file)
+        music_brainz.wait_for_cd_art(job)
+        if rip_ok:
             utils.notify(job, constants.NOTIFY_TITLE, f"Music CD: {job.title} {constants.PROCESS_COMPLETE}")
             utils.scan_emby()
             # This shouldn't be needed. but to be safe
             job.status = JobState.SUCCESS.value
-            db.session.commit()
+            db_writer.commit()
         else:
             logging.critical("Music rip failed.  See previous errors.  Exiting. ")
             job.status = JobState.FAILURE.value
-            db.session.commit()
+            db_writer.commit()
 
     # Type: Data
     elif job.disctype == "data":
@@ -150,6 +159,7 @@ def main():
     # Type: undefined
     else:
         logging.critical("Couldn't identify the disc type. Exiting without any action.")
+    return False
 
 
 def setup():
@@ -215,10 +225,10 @@ def setup():
     logging.debug(f"drive_mode: {drive.drive_mode}")
     if drive.drive_mode == 'manual':
         job.manual_mode = True
-        db.session.commit()
+        db_writer.commit()
     else:
         job.manual_mode = False
-        db.session.commit()
+        db_writer.commit()
     utils.database_adder(config)
 
     try:
@@ -236,9 +246,10 @@ def setup():
 
 if __name__ == "__main__":
     job = None
+    queued = False
     try:
         setup()
-        main()
+        queued = main()
     except Exception as error:
         logging.critical("A fatal error has occurred and ARM is exiting.")
         print_stacktrace = (
@@ -265,7 +276,9 @@ if __name__ == "__main__":
         job.errors = str(error)
         # Possibly add cleanup section here for failed job files
     else:
-        job.status = JobState.SUCCESS.value
+        # Queued jobs are finished by the transcode worker
+        if not queued:
+            job.status = JobState.SUCCESS.value
     finally:
         if job:
             job.eject()  # each job stores its eject status, so it is safe to call.
@@ -274,4 +287,15 @@ if __name__ == "__main__":
             minutes, seconds = divmod(job_length.seconds + job_length.days * 86400, 60)
             hours, minutes = divmod(minutes, 60)
             job.job_length = f'{hours:d}:{minutes:02d}:{seconds:02d}'
-        db.session.commit()
+            if job.status == JobState.SUCCESS.value:
+                job.measure_output()
+        if job:
+            progress.clear(job.job_id)
+        # Pending status updates are older than the final state of the job
+        db_writer.flush()
+        db_writer.commit()
+        if job:
+            known_discs.remember(job)
+        logging.debug(f"Database writes: {db_writer.stats()}")
+        logging.debug(f"Metadata cache: {metadata_cache.stats()}")
+        logging.debug(f"Outbound requests: {http_client.stats()}")
@@ -7,10 +7,9 @@ Reference:
 - https://github.com/automatic-ripping-machine/automatic-ripping-machine/wiki/MakeMKV-Codes
 """
 
-import collections
+import contextlib
 import dataclasses
 import enum
-import itertools
 import logging
 import os
 import re
@@ -19,15 +18,16 @@ import shutil
 import subprocess
 from pathlib import Path
 from time import sleep
-from urllib.error import URLError
-from urllib.request import Request, urlopen
+
+import requests
 
 import arm.config.config as cfg
-from arm.models import SystemDrives, Track
+from arm.models import Track
 from arm.models.job import JobState
-from arm.ripper import utils
+from arm.ripper import utils, slot_scheduler, drive_index, job_signal, progress
+from arm.ripper.raw_output import RawOutput
 from arm.ripper.utils import notify
-from arm.ui import db
+from arm.ui import db, db_writer, http_client
 
 MAKEMKV_INFO_WAIT_TIME = 60  # [s]
 """Wait for concurrent MakeMKV info processes.
@@ -196,6 +196,8 @@ class MakeMKVMessage:
 
     `MSG:code,flags,count,message,format,param0,param1,...`
     """
+    __slots__ = ("code", "flags", "count", "message", "sprintf")
+
     code: int
     """Unique Message Code"""
     flags: int
@@ -204,18 +206,15 @@ class MakeMKVMessage:
     """Number of Parameters"""
     message: str
     """Formatted Message"""
-    sprintf: str
-    """Unformatted Message"""
-
-    def __post_init__(self):
-        self.code = int(self.code)
-        self.flags = int(self.flags)
-        self.count = int(self.count)
+    sprintf: list
+    """Unformatted Message and its parameters"""
 
 
 @dataclasses.dataclass
 class MakeMKVErrorMessage(MakeMKVMessage):
     """Error Message"""
+    __slots__ = ("error",)
+
     error: str
 
     def __post_init__(self):
@@ -232,12 +231,11 @@ class Titles:
 
     `TCOUT:count`
     """
+    __slots__ = ("count",)
+
     count: int
     """Titles Count"""
 
-    def __post_init__(self):
-        self.count = int(self.count)
-
 
 @dataclasses.dataclass
 class CInfo:
@@ -247,6 +245,8 @@ class CInfo:
     `CINFO:id,code,value`
     ```
     """
+    __slots__ = ("id", "code", "value")
+
     id: int  # pylint: disable=C0103
     """Attribute ID, see AP_ItemAttributeId in apdefs.h"""
     code: int
@@ -254,10 +254,6 @@ class CInfo:
     value: str
     """Attribute Value"""
 
-    def __post_init__(self):
-        self.id = int(self.id)
-        self.code = int(self.code)
-
 
 @dataclasses.dataclass
 class TInfo(CInfo):
@@ -266,27 +262,23 @@ class TInfo(CInfo):
 
     `TINFO:tid,id,code,value`
     """
+    __slots__ = ("tid",)
+
     tid: int
     """Title ID"""
 
-    def __post_init__(self):
-        super().__post_init__()
-        self.tid = int(self.tid)
-
 
 @dataclasses.dataclass
 class SInfo(TInfo):
     """
     Stream Information
 
-    `SINFO:id,code,value`
-
+    `SINFO:tid,sid,id,code,value`
     """
-    sid: int
+    __slots__ = ("sid",)
 
-    def __post_init__(self):
-        super().__post_init__()
-        self.sid = int(self.sid)
+    sid: int
+    """Stream ID"""
 
 
 @dataclasses.dataclass
@@ -296,6 +288,8 @@ class ProgressBarValues:
 
     PRGV:current,total,max
     """
+    __slots__ = ("current", "total", "maximum")
+
     current: int
     """current progress value"""
     total: int
@@ -303,17 +297,14 @@ class ProgressBarValues:
     maximum: int
     """maximum possible value for a progress bar, constant"""
 
-    def __post_init__(self):
-        self.current = int(self.current)
-        self.total = int(self.total)
-        self.maximum = int(self.maximum)
-
 
 @dataclasses.dataclass
 class ProgressBarTitle:
     """
     Progress Bar Information
     """
+    __slots__ = ("code", "oid", "name")
+
     code: int
     """unique message code"""
     oid: int
@@ -321,10 +312,6 @@ class ProgressBarTitle:
     name: str
     """name string"""
 
-    def __post_init__(self):
-        self.code = int(self.code)
-        self.oid = int(self.oid)
-
 
 @dataclasses.dataclass
 class ProgressBarCurrent(ProgressBarTitle):
@@ -333,6 +320,7 @@ class ProgressBarCurrent(ProgressBarTitle):
 
     PRGC:code,id,name
     """
+    __slots__ = ()
 
 
 @dataclasses.dataclass
@@ -342,6 +330,7 @@ class ProgressBarTotal(ProgressBarTitle):
 
     PRGT:code,id,name
     """
+    __slots__ = ()
 
 
 @dataclasses.dataclass(order=True)
@@ -442,69 +431,117 @@ class MakeMkvRuntimeError(RuntimeError):
         super().__init__(self.message)
 
 
-def parse_content(content, num_header, num_message):
-    """
-    Helper Function to parse the MakeMKV Messages
-
-    >>> msg = '1005,0,1,"MakeMKV v1.17.8 linux(x64-release) started","%1 started","MakeMKV v1.17.8 linux(x64-release)"'
-    >>> list(parse_content(msg, 3, -1))  # MSG
-    ['1005', '0', '1', 'MakeMKV v1.17.8 linux(x64-release) started', '%1 started', 'MakeMKV v1.17.8 linux(x64-release)']
-    >>> msg = '0'
-    >>> list(parse_content(msg, 0, 0))  # TCOUT
-    ['0']
-    >>> msg = '6,256,999,0,"BD-Drive","THE TITLE","/dev/sr0"'
-    >>> list(parse_content(msg, 4, 2))  # DRV
-    ['6', '256', '999', '0', 'BD-Drive', 'THE TITLE', '/dev/sr0']
-    >>> msg = '1,6209,"Blu-ray disc"'
-    >>> list(parse_content(msg, 2, 0))  # CINFO
-    ['1', '6209', 'Blu-ray disc']
-    >>> msg = '1,26,0,"155,156,157"'
-    >>> list(parse_content(msg, 3, 0))  # TINFO
-    ['1', '26', '0', '155,156,157']
-    >>> msg = '0,0,28,0,"ger"'
-    >>> list(parse_content(msg, 4, 0))  # SINFO
-    ['0', '0', '28', '0', 'ger']
-    """
-    # The header is considered as the first n non-string entries
-    header = content.split(",", maxsplit=num_header)
-    # (str) messages wrapped in double quotes *may* contain comma
-    message = header[-1].split('","', maxsplit=num_message)
-    return itertools.chain(header[:-1], (x.strip('"') for x in message))
-
-
-def parse_line(line):
-    """Parse MakeMkv Output Line to DataClasses"""
-    if ":" not in line:
-        raise MakeMkvParserError("No Message Type Detected")
-    msg_type, content = line.split(":", maxsplit=1)
-    if msg_type not in OutputType.__members__:
-        raise MakeMkvParserError(f"Cannot parse '{msg_type}':'{content}'")
-    msg_type = OutputType[msg_type]
-    if msg_type == OutputType.MSG:
-        temp = parse_content(content, 3, -1)
-        data = MakeMKVMessage(*itertools.islice(temp, 4), list(temp))
-        message = MakeMKVOutputChecker(data).check()
-    elif msg_type == OutputType.PRGV:
-        message = ProgressBarValues(*parse_content(content, 2, 0))
-    elif msg_type == OutputType.PRGC:
-        message = ProgressBarCurrent(*parse_content(content, 2, 0))
-    elif msg_type == OutputType.PRGT:
-        message = ProgressBarTotal(*parse_content(content, 2, 0))
-    elif msg_type == OutputType.SINFO:
-        tid, sid, *info = parse_content(content, 4, 0)
-        message = SInfo(*info, tid, sid)
-    elif msg_type == OutputType.TINFO:
-        tid, *info = parse_content(content, 3, 0)
-        message = TInfo(*info, tid)
-    elif msg_type == OutputType.CINFO:
-        message = CInfo(*parse_content(content, 2, 0))
-    elif msg_type == OutputType.DRV:
-        message = Drive(*reversed(list(parse_content(content, 4, 2))))
-    elif msg_type == OutputType.TCOUNT:
-        message = Titles(*parse_content(content, 0, 0))
+# Numeric header of each message type, the rest of the line is kept as one string
+_HEADER_2 = re.compile(r"(-?\d+),(-?\d+),(.*)", re.DOTALL)
+_HEADER_3 = re.compile(r"(-?\d+),(-?\d+),(-?\d+),(.*)", re.DOTALL)
+_HEADER_4 = re.compile(r"(-?\d+),(-?\d+),(-?\d+),(-?\d+),(.*)", re.DOTALL)
+
+
+def _strings(rest, maxsplit=-1):
+    """Split the (str) fields at the end of a line, wrapped in double quotes they *may* contain comma"""
+    return [x.strip('"') for x in rest.split('","', maxsplit)]
+
+
+def _parse_msg(content):
+    code, flags, count, rest = _HEADER_3.fullmatch(content).groups()
+    strings = _strings(rest)
+    data = MakeMKVMessage(int(code), int(flags), int(count), strings[0], strings[1:])
+    return MakeMKVOutputChecker(data).check()
+
+
+def _parse_prgv(content):
+    current, total, maximum = content.split(",")
+    return ProgressBarValues(int(current), int(total), int(maximum))
+
+
+def _parse_prgc(content):
+    code, oid, name = _HEADER_2.fullmatch(content).groups()
+    return ProgressBarCurrent(int(code), int(oid), name.strip('"'))
+
+
+def _parse_prgt(content):
+    code, oid, name = _HEADER_2.fullmatch(content).groups()
+    return ProgressBarTotal(int(code), int(oid), name.strip('"'))
+
+
+def _parse_sinfo(content):
+    tid, sid, attribute, code, value = _HEADER_4.fullmatch(content).groups()
+    return SInfo(int(attribute), int(code), value.strip('"'), int(tid), int(sid))
+
+
+def _parse_tinfo(content):
+    tid, attribute, code, value = _HEADER_3.fullmatch(content).groups()
+    return TInfo(int(attribute), int(code), value.strip('"'), int(tid))
+
+
+def _parse_cinfo(content):
+    attribute, code, value = _HEADER_2.fullmatch(content).groups()
+    return CInfo(int(attribute), int(code), value.strip('"'))
+
+
+def _parse_drv(content):
+    index, visible, enabled, flags, rest = _HEADER_4.fullmatch(content).groups()
+    info, disc, mount = _strings(rest, 2)
+    return Drive(mount, disc, info, flags, enabled, visible, index)
+
+
+def _parse_tcount(content):
+    return Titles(int(content.strip('"')))
+
+
+_PARSERS = {
+    "MSG": (OutputType.MSG, _parse_msg),
+    "PRGV": (OutputType.PRGV, _parse_prgv),
+    "PRGC": (OutputType.PRGC, _parse_prgc),
+    "PRGT": (OutputType.PRGT, _parse_prgt),
+    "SINFO": (OutputType.SINFO, _parse_sinfo),
+    "TINFO": (OutputType.TINFO, _parse_tinfo),
+    "CINFO": (OutputType.CINFO, _parse_cinfo),
+    "DRV": (OutputType.DRV, _parse_drv),
+    "TCOUNT": (OutputType.TCOUNT, _parse_tcount),
+}
+"""Message type prefix: OutputType and the parser of the content after the colon"""
+
+
+def parse_line(line, select=None):
+    """
+    Parse MakeMkv Output Line to DataClasses
+
+    >>> parse_line('TINFO:1,26,0,"155,156,157"')
+    (<OutputType.TINFO: 32>, TInfo(id=26, code=0, value='155,156,157', tid=1))
+    >>> parse_line('SINFO:0,0,28,0,"ger"')
+    (<OutputType.SINFO: 8>, SInfo(id=28, code=0, value='ger', tid=0, sid=0))
+    >>> parse_line('PRGV:1024,2048,65536', select=OutputType.MSG)
+    (<OutputType.PRGV: 64>, None)
+
+    Parameters:
+        line (str): stdout line of makemkvcon --robot
+        select (OutputType): only these types are turned into dataclasses, the
+            others give None (default: all). MSG lines are always checked for errors.
+    Returns:
+        tuple of the OutputType and the dataclass
+    Raises:
+        MakeMkvParserError when the line can't be parsed
+    """
+    # Progress values are most of the output, so they are looked at first
+    if line.startswith("PRGV:"):
+        if select is not None and OutputType.PRGV not in select:
+            return OutputType.PRGV, None
+        msg_type, parser = _PARSERS["PRGV"]
+        content = line[5:]
     else:
-        raise MakeMkvParserError(f"Cannot handle '{msg_type}':'{content}'")
-    return msg_type, message
+        prefix, colon, content = line.partition(":")
+        if not colon:
+            raise MakeMkvParserError("No Message Type Detected")
+        if prefix not in _PARSERS:
+            raise MakeMkvParserError(f"Cannot parse '{prefix}':'{content}'")
+        msg_type, parser = _PARSERS[prefix]
+        if select is not None and msg_type not in select and msg_type != OutputType.MSG:
+            return msg_type, None
+    try:
+        return msg_type, parser(content)
+    except (AttributeError, TypeError, ValueError) as error:
+        raise MakeMkvParserError(f"Cannot parse '{msg_type.name}':'{content}'") from error
 
 
 def makemkv_info(job, select=None, index=9999, options=None):
@@ -556,27 +593,24 @@ def makemkv_info(job, select=None, index=9999, options=None):
     # 1MB cache size to get info on the specified disc(s)
     info_options = ["info", "--cache=1"] + options + [f"disc:{index:d}", "--minlength=0"]
     wait_time = job.config.MANUAL_WAIT_TIME
-    max_processes = cfg.arm_config["MAX_CONCURRENT_MAKEMKVINFO"]
-    job.status = JobState.VIDEO_WAITING.value
-    db.session.commit()
-    utils.sleep_check_process("makemkvcon", max_processes, sleep=(10, wait_time, 10))
-    job.status = JobState.VIDEO_INFO.value
-    db.session.commit()
+    scheduler = slot_scheduler.makemkv_info_scheduler()
+    utils.database_updater({"status": JobState.VIDEO_WAITING.value}, job, coalesce=True)
     try:
-        yield from run(info_options, select)
+        with scheduler.slot():
+            utils.database_updater({"status": JobState.VIDEO_INFO.value}, job, coalesce=True)
+            yield from run(info_options, select)
     finally:
         logging.info("MakeMKV info exits.")
-        job.status = JobState.VIDEO_WAITING.value
-        db.session.commit()
-        if max_processes:
+        utils.database_updater({"status": JobState.VIDEO_WAITING.value}, job, coalesce=True)
+        if scheduler.max_slots > 0:
             logging.info(f"Penalty {wait_time}s")
             # makemkvcon info tends to crash makemkvcon backup|mkv
             # give other processes time to use this function.
             sleep(wait_time)
-        # sleep here until all processes finish (hopefully)
-        utils.sleep_check_process("makemkvcon", max_processes, sleep=wait_time)
-        job.status = JobState.VIDEO_RIPPING.value
-        db.session.commit()
+            # wait until the info scans queued in the meantime have finished
+            with scheduler.slot():
+                pass
+        utils.database_updater({"status": JobState.VIDEO_RIPPING.value}, job, coalesce=True)
 
 
 def get_drives(job):
@@ -606,21 +640,22 @@ def makemkv_backup(job, rawpath):
     cmd += shlex.split(job.config.MKV_ARGS)
     cmd += [
         f"--minlength={job.config.MINLENGTH}",
-        f"--progress={progress_log(job)}",
+        "--progress=-same",
         f"disc:{job.drive.mdisc:d}",
         rawpath,
     ]
     logging.info("Backing up disc")
-    collections.deque(run(cmd, OutputType.MSG), maxlen=0)
+    run_rip(job, cmd)
 
 
-def makemkv_mkv(job, rawpath):
+def makemkv_mkv(job, rawpath, pipeline=None):
     """
     Rip Blu-ray without enhanced protection or dvd disc
 
     Parameters:
         job: arm.models.job.Job
         rawpath:
+        pipeline: arm.ripper.transcode_pipeline.TranscodePipeline, transcode titles while ripping (default: None)
     """
     # Get drive mode for the current drive
     mode = utils.get_drive_mode(job.devpath)
@@ -636,13 +671,13 @@ def makemkv_mkv(job, rawpath):
     elif mode == 'manual':  # Run if mode is manual, user selects tracks
         # Set job status to waiting
         job.status = JobState.VIDEO_WAITING.value
-        db.session.commit()
+        db_writer.commit()
         # Process Tracks
         if manual_wait(job):  # Alert user: tracks are ready and wait for 30 minutes
             # Response from user provided, process requested tracks
             job.status = JobState.VIDEO_RIPPING.value
-            db.session.commit()
-            process_single_tracks(job, rawpath, mode)
+            db_writer.commit()
+            process_single_tracks(job, rawpath, mode, pipeline)
         else:
             # Notify User: no action was taken
             title = "ARM is Sad - Job Abandoned"
@@ -652,30 +687,68 @@ def makemkv_mkv(job, rawpath):
             raise utils.RipperException("Manual mode: Timed out waiting for user input")
 
     # if no maximum length, process the whole disc in one command
-    elif int(job.config.MAXLENGTH) > 99998:
+    # unless titles are transcoded as soon as they are ripped
+    elif int(job.config.MAXLENGTH) > 99998 and pipeline is None:
         cmd = [
             "mkv",
         ]
         cmd += shlex.split(job.config.MKV_ARGS)
         cmd += [
-            f"--progress={progress_log(job)}",
+            "--progress=-same",
             f"dev:{job.devpath}",
             "all",
             rawpath,
             f"--minlength={job.config.MINLENGTH}",
         ]
         logging.info("Process all tracks from disc.")
-        collections.deque(run(cmd, OutputType.MSG), maxlen=0)
+        run_rip(job, cmd)
     else:
-        process_single_tracks(job, rawpath, 'auto')
+        process_single_tracks(job, rawpath, 'auto', pipeline)
 
 
-def makemkv(job):
+def resolve_drive_index(job):
+    """
+    Find the MakeMKV disc numbers of the drives and store them in the database
+
+    The last drive scan is reused if the drives haven't changed since. Otherwise
+    all drives are scanned with makemkv info, jobs started at the same time wait
+    for that scan instead of running their own.
+
+    Parameters:
+        job: arm.models.job.Job
+    Raises:
+        ValueError: the job has no drive
+    """
+    disc_index = None
+    with drive_index.scan_lock():
+        # Another job may have scanned the drives while we were waiting
+        db_writer.commit()
+        if job.drive is None or job.drive.mdisc is None:
+            drive_index.restore()
+        if job.drive is None or job.drive.mdisc is None:
+            logging.debug("Storing new MakeMKV disc numbers to database.")
+            indexes = {drive.mount: drive.index for drive in get_drives(job)}
+            drive_index.store(indexes)
+            # Track disc index for current job's device
+            disc_index = indexes.get(job.devpath)
+            # Refresh job to get updated drive relationship
+            db.session.refresh(job)
+    # If job.drive is still None after refresh, log warning with available info
+    if job.drive is None:
+        if disc_index is not None:
+            logging.warning(f"job.drive is None but found disc index {disc_index} for {job.devpath}")
+        else:
+            logging.error(f"Could not find drive for {job.devpath}")
+            raise ValueError(f"No drive found for device {job.devpath}")
+
+
+def makemkv(job, pipeline=None):
     """
     Rip Blu-rays/DVDs with MakeMKV
 
     Parameters:
         job: arm.models.job.Job
+        pipeline: arm.ripper.transcode_pipeline.TranscodePipeline, transcode titles while ripping (default: None)
     Returns:
         str: path to ripped files.
     """
@@ -683,28 +756,11 @@ def makemkv(job):
 
     logging.info(f"Starting MakeMKV rip. Method is {job.config.RIPMETHOD}")
     # get MakeMKV disc number
+    if not drive_index.is_current():
+        drive_index.invalidate()
     # Fix: Check if job.drive is None before accessing job.drive.mdisc
     if job.drive is None or job.drive.mdisc is None:
-        logging.debug("Storing new MakeMKV disc numbers to database.")
-        disc_index = None
-        with db.session.no_autoflush:
-            for drive in get_drives(job):
-                for db_drive in SystemDrives.query.filter_by(mount=drive.mount).all():
-                    db_drive.mdisc = drive.index
-                    db.session.add(db_drive)
-                    # Track disc index for current job's device
-                    if drive.mount == job.devpath:
-                        disc_index = drive.index
-        db.session.commit()
-        # Refresh job to get updated drive relationship
-        db.session.refresh(job)
-        # If job.drive is still None after refresh, log warning with available info
-        if job.drive is None:
-            if disc_index is not None:
-                logging.warning(f"job.drive is None but found disc index {disc_index} for {job.devpath}")
-            else:
-                logging.error(f"Could not find drive for {job.devpath}")
-                raise ValueError(f"No drive found for device {job.devpath}")
+        resolve_drive_index(job)
     logging.info(f"MakeMKV disc number: {job.drive.mdisc:d}")
     # get filesystem in order
     rawpath = setup_rawpath(job, os.path.join(str(job.config.RAW_PATH), str(job.title)))
@@ -714,7 +770,7 @@ def makemkv(job):
         makemkv_backup(job, rawpath)
     # Rip BluRay or DVD
     elif job.config.RIPMETHOD == "mkv" or job.disctype == "dvd":
-        makemkv_mkv(job, rawpath)
+        makemkv_mkv(job, rawpath, pipeline)
     else:
         logging.info("I'm confused what to do....  Passing on MakeMKV")
     job.eject()
@@ -738,7 +794,7 @@ def rip_mainfeature(job, track, rawpath):
     ]
     cmd += shlex.split(job.config.MKV_ARGS)
     cmd += [
-        f"--progress={progress_log(job)}",
+        "--progress=-same",
         f"dev:{job.devpath}",
         track.track_number,
         rawpath,
@@ -746,10 +802,10 @@ def rip_mainfeature(job, track, rawpath):
     ]
     logging.info("Ripping main feature")
     # Possibly update db to say track was ripped
-    collections.deque(run(cmd, OutputType.MSG), maxlen=0)
+    run_rip(job, cmd)
 
 
-def process_single_tracks(job, rawpath, mode: str):
+def process_single_tracks(job, rawpath, mode: str, pipeline=None):
     """
     Process single tracks by MakeMKV one at a time
 
@@ -757,6 +813,7 @@ def process_single_tracks(job, rawpath, mode: str):
         job: arm.models.job.Job
         rawpath:
         mode: drive mode (auto or manual)
+        pipeline: arm.ripper.transcode_pipeline.TranscodePipeline, gets every title once it is ripped
     """
     # process one track at a time based on track length
     for track in job.tracks:
@@ -791,13 +848,19 @@ def process_single_tracks(job, rawpath, mode: str):
             cmd += shlex.split(job.config.MKV_ARGS)
             cmd += [
                 f"--minlength={job.config.MINLENGTH}",
-                f"--progress={progress_log(job)}",
+                "--progress=-same",
                 f"dev:{job.devpath}",
                 track.track_number,
                 rawpath,
             ]
             logging.debug("Starting to rip single track.")
-            collections.deque(run(cmd, OutputType.MSG), maxlen=0)
+            track.status = "ripping"
+            db_writer.commit()
+            run_rip(job, cmd, f"{track.track_number}/{job.no_of_titles - 1}")
+            track.status = "ripped"
+            db_writer.commit()
+            if pipeline is not None:
+                pipeline.submit(track, rawpath)
 
 
 def setup_rawpath(job, raw_path):
@@ -843,12 +906,12 @@ def update_key() -> None:
             logging.info("Fetching latest MakeMKV beta key...")
             key = re.search(
                 key_pattern,
-                urlopen(Request(
-                    url="https://forum.makemkv.com/forum/viewtopic.php?f=5&t=1053",
+                http_client.get(
+                    "https://forum.makemkv.com/forum/viewtopic.php?f=5&t=1053",
                     headers={
                         "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/51.0.2704.103 Safari/537.36"
                     }
-                )).read().decode("utf-8")
+                ).text
             )[0]
             logging.debug(f"Using beta key {key}")
         key = f'app_Key = "{key}"\n'
@@ -873,30 +936,10 @@ def update_key() -> None:
 
         logging.info("MakeMKV key has been set.")
 
-    except (UnicodeDecodeError, URLError, OSError, IndexError) as e:
+    except (requests.RequestException, OSError, IndexError, TypeError) as e:
         logging.error(f"Failed to update MakeMKV Key: {e}")
 
 
-def progress_log(job):
-    """
-    Retrieve the path to the progress log file
-
-    The file path is expected like this by the frontend.
-
-    ToDo: move to Job() class since this is mainly a db wrapper. Then allow the
-          front end to pick up the same method.
-
-    Parameters:
-        job: arm.models.job.Job
-    Returns:
-        str: log file
-
-    """
-    logfile = os.path.join(job.config.LOGPATH, "progress", f"{job.job_id:d}.log")
-    logging.debug(f"logging progress to '{logfile}'")
-    return shlex.quote(logfile)
-
-
 class TrackInfoProcessor:
     """
     Processes MakeMKV track info messages to update Track class.
@@ -1131,13 +1174,40 @@ class MakeMKVOutputChecker:
         return self.data
 
 
-def run(options, select):
+def run_rip(job, cmd, title=""):
+    """
+    Run a MakeMKV backup or mkv command and publish its progress
+
+    Parameters:
+        job: arm.models.job.Job
+        cmd (list): makemkvcon cli options, with --progress=-same
+        title (str): title being ripped, e.g. "2/5", empty for the whole disc
+    Raises:
+        MakeMkvRuntimeError on makemkvcon exit code
+    """
+    reporter = progress.Reporter(job.job_id, JobState.VIDEO_RIPPING.value, "Ripping", title)
+    name = f"MakeMKV {title}".rstrip()
+    stage = ""
+    with RawOutput("makemkv") as raw:
+        for data in run(cmd, OutputType.MSG | OutputType.PRGC | OutputType.PRGV, raw):
+            if isinstance(data, ProgressBarCurrent):
+                stage = data.name
+                reporter.update(0, stage=stage)
+                raw.summary(f"{name}: {stage}", force=True)
+            elif isinstance(data, ProgressBarValues) and data.maximum:
+                percent = 100 * data.total / data.maximum
+                reporter.update(percent)
+                raw.summary(f"{name}: {stage} {percent:.0f}%")
+
+
+def run(options, select, raw=None):
     """
     Run makemkv with input cli options and yield selected messages
 
     Parameters:
         options (list): makemkvcon cli options
         select (OutputType): output Message Type(s)
+        raw (RawOutput): where the output lines are kept, a new "makemkv" one if None
     Yields:
         dataclasses of selected type
     Raises:
@@ -1158,21 +1228,24 @@ def run(options, select):
     cmd += list(options)
     buffer = []
     logging.debug(f"command: '{' '.join(cmd)}'")
-    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as proc:
+    with (RawOutput("makemkv") if raw is None else contextlib.nullcontext(raw)) as raw_output, \
+            subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as proc:
         logging.debug(f"PID {proc.pid}: command: '{' '.join(cmd)}'")
         for line in proc.stdout:
             line = line.rstrip(os.linesep)
-            logging.debug(line)  # Maybe write the raw output to a separate log
+            # Every line goes to the raw output, the job log only gets the messages
+            raw_output.write(line)
             if proc.returncode:
                 buffer.append(line)
                 continue
             try:
-                msg_type, data = parse_line(line)
+                msg_type, data = parse_line(line, select)
             except MakeMkvParserError as err:
                 logging.warning(err)
                 buffer.append(line)
                 continue
-            logging.debug(data)
+            if msg_type == OutputType.MSG:
+                logging.debug(data.message)
             if msg_type in select:
                 yield data
     if proc.returncode:
@@ -1201,7 +1274,8 @@ def manual_wait(job) -> bool:
               within the wait time, otherwise `False`.
 
     Notes:
-        - The function checks in one minute intervals for state changes
+        - The function wakes up as soon as the UI changes the job and otherwise
+          checks in one minute intervals for state changes
         - A reminder is sent every 10 minutes.
         - A final notification is sent when one minute is left, warning of potential
           cancellation.
@@ -1215,29 +1289,27 @@ def manual_wait(job) -> bool:
 
     # Wait for the user to set the files and then start
     title = "Waiting for input on job!"
-    for i in range(wait_time, 0, -1):
-        # Wait for a minute
-        sleep(60)
-
-        # Refresh job data
-        db.session.refresh(job)
-        logging.debug(f"Wait time logging: [{i}] mins - Ready: [{job.manual_start}]")
-
-        # Check the job state (true once ready)
-        if job.manual_start:
-            user_ready = True
-            title = "The Wait is Over"
-            message = "Thanks for not forgetting me, I am now processing your job."
-            notify(job, title, message)
-            break
-        else:
-            # If nothing has happened, remind the user every 5 minutes
-            if i % 5 == 0 and i != wait_time:
-                body = f"Don't forget me, I need your help to continue doing ARM things!. You have {i} minutes."
-                notify(job, title, body)
-
-            if i == 1:
-                body = "ARM is about to cancel this job!!! You have less than 1 minute left!"
-                notify(job, title, body)
+    with job_signal.listen(job) as listener:
+        for i in range(wait_time, 0, -1):
+            # Wait for a minute, the UI wakes us as soon as the job is started
+            ready = listener.wait(60, lambda: bool(job.manual_start))
+            logging.debug(f"Wait time logging: [{i}] mins - Ready: [{job.manual_start}]")
+
+            # Check the job state (true once ready)
+            if ready:
+                user_ready = True
+                title = "The Wait is Over"
+                message = "Thanks for not forgetting me, I am now processing your job."
+                notify(job, title, message)
+                break
+            else:
+                # If nothing has happened, remind the user every 5 minutes
+                if i % 5 == 0 and i != wait_time:
+                    body = f"Don't forget me, I need your help to continue doing ARM things!. You have {i} minutes."
+                    notify(job, title, body)
+
+                if i == 1:
+                    body = "ARM is about to cancel this job!!! You have less than 1 minute left!"
+                    notify(job, title, body)
 
     return user_ready
@@ -1,18 +1,102 @@
 #!/usr/bin/env python3
-"""Module to connect to A.R.M to MusicBrainz API"""
+"""
+Module to connect to A.R.M to MusicBrainz API
+
+An audio CD is probed once per job: its TOC is read with discid the first time it
+is needed and kept in the AudioProbe of the job, together with the MusicBrainz
+release data. Release data and cover art lists are also kept in the metadata
+cache, so a disc that comes back doesn't ask MusicBrainz again. Cover art is
+looked up in the background while abcde starts reading the disc, with a Job
+loaded in the session of the lookup thread.
+"""
 
 import logging
 import re
+import threading
+import weakref
+
 import musicbrainzngs as mb
 import werkzeug
 from discid import read, Disc
 
 import arm.config.config as cfg
 from arm.ripper import utils as u
+from arm.ui import app, db, http_client, metadata_cache
 
 
 werkzeug.cached_property = werkzeug.utils.cached_property
 
+# Asked once for everything get_title() and check_musicbrainz_data() need
+RELEASE_INCLUDES = ['artist-credits', 'recordings']
+
+# AudioProbe of each job, kept off the Job so get_d() and pretty_table() don't list it
+_probes = weakref.WeakKeyDictionary()
+
+
+class AudioProbe:
+    """
+    What is known about the audio CD of a job, read at most once\n
+    disc is the discid.Disc with the TOC, releases the MusicBrainz answer for it.
+    """
+
+    def __init__(self, devpath):
+        self.devpath = devpath
+        self._disc = None
+        self.releases = None
+        self.art = None
+
+    @property
+    def disc(self):
+        if self._disc is None:
+            self._disc = read(self.devpath)
+        return self._disc
+
+
+def probe(job):
+    """
+    The AudioProbe of a job, created on first use\n
+    :param job: Job of an audio CD
+    :return AudioProbe:
+    """
+    audio_probe = _probes.get(job)
+    if audio_probe is None or audio_probe.devpath != job.devpath:
+        audio_probe = _probes[job] = AudioProbe(job.devpath)
+    return audio_probe
+
+
+def _not_found(error):
+    return isinstance(error, mb.ResponseError) and getattr(error.cause, "code", None) == 404
+
+
+def _fetch_releases(discid):
+    try:
+        return http_client.call("musicbrainz.org", mb.get_releases_by_discid, discid, includes=RELEASE_INCLUDES)
+    except mb.ResponseError as error:
+        if _not_found(error):
+            return {}
+        raise
+
+
+def get_releases(job, discid) -> dict:
+    """
+    MusicBrainz releases of a disc, from the job, the metadata cache or MusicBrainz\n
+    :param job: Job, keeps the answer for the next call
+    :param discid: disc id from the discid package
+    :return dict: empty if MusicBrainz doesn't know the disc
+    :raises mb.WebServiceError, TimeoutError: MusicBrainz couldn't be asked
+    """
+    audio_probe = probe(job)
+    if audio_probe.releases is None or audio_probe.releases[0] != str(discid):
+        # Tell musicbrainz what your app is, and how to contact you
+        # (this step is required, as per the webservice access rules
+        # at http://wiki.musicbrainz.org/XML_Web_Service/Rate_Limiting )
+        mb.set_useragent(app="arm", version=str(job.arm_version),
+                         contact="https://github.com/automatic-ripping-machine")
+        releases = metadata_cache.lookup("musicbrainz:discid", str(discid), None, lambda: _fetch_releases(discid),
+                                         lambda disc_info: 'disc' in disc_info or 'cdstub' in disc_info)
+        audio_probe.releases = (str(discid), releases)
+    return audio_probe.releases[1]
+
 
 def main(disc):
     """
@@ -31,9 +115,9 @@ def get_disc_id(disc):
     Calculates the identifier of the disc
 
     return:
-    identification object from discid package
+    identification object from discid package, read once per job
     """
-    return read(disc.devpath)
+    return probe(disc).disc
 
 
 def music_brainz(discid: str, job) -> str:
@@ -98,19 +182,14 @@ def get_disc_info(job, discid: str) -> str:
         Returns an empty string if an error occurs (e.g., network error, invalid disc ID).
     """
 
-    # Tell musicbrainz what your app is, and how to contact you
-    # (this step is required, as per the webservice access rules
-    # at http://wiki.musicbrainz.org/XML_Web_Service/Rate_Limiting )
-    mb.set_useragent(app="arm", version=str(job.arm_version), contact="https://github.com/automatic-ripping-machine")
-
     # Get CD info from musicbrainz and catch any errors
     try:
-        disc_info = mb.get_releases_by_discid(discid, includes=['artist-credits', 'recordings'])
+        disc_info = get_releases(job, discid)
         logging.debug(f"discid: [{discid}]")
         # Debugging, will dump the entire xml/json data from musicbrainz
         # logging.debug(f"disc_info: {disc_info}")
 
-    except mb.WebServiceError as exc:
+    except (mb.WebServiceError, TimeoutError) as exc:
         logging.error(f"Cant reach MB or cd not found ? - ERROR: {exc}")
         u.database_updater(False, job)
         disc_info = ""
@@ -201,12 +280,9 @@ def check_musicbrainz_data(job, disc_info: dict) -> str:
                     u.database_updater(args, job)
                     logging.debug(f"musicbrain works -  New title is {title}  New Year is: {new_year}")
 
-                    # Get album art work
+                    # Get album art work, abcde doesn't wait for it
                     logging.info(f"do have artwork?======{release['cover-art-archive']['artwork']}")
-                    if get_cd_art(job, disc_info):
-                        logging.debug("we got an art image")
-                    else:
-                        logging.debug("we didnt get art image")
+                    fetch_cd_art(job, disc_info)
                     music_data = artist_title
 
     # Run if not a disc, but a cdstub (limited data)
@@ -298,12 +374,8 @@ def get_title(discid: str, job) -> str:
     as it may interfere with ARM’s logger initialization.
     """
 
-    # Tell musicbrainz what your app is, and how to contact you
-    # (this step is required, as per the webservice access rules
-    # at http://wiki.musicbrainz.org/XML_Web_Service/Rate_Limiting )
-    mb.set_useragent("arm", version=str(job.arm_version), contact="https://github.com/automatic-ripping-machine")
     try:
-        disc_info = mb.get_releases_by_discid(discid, includes=['artist-credits'])
+        disc_info = get_releases(job, discid)
         logging.debug(f"disc_info: {disc_info}")
         logging.debug(f"discid = {discid}")
         if 'disc' in disc_info:
@@ -329,11 +401,58 @@ def get_title(discid: str, job) -> str:
         }
         u.database_updater(args, job)
         return clean_title
-    except (mb.WebServiceError, KeyError):
+    except (mb.WebServiceError, TimeoutError, KeyError):
         u.database_updater(False, job)
         return "not identified"
 
 
+def _fetch_image_list(release_id):
+    try:
+        return http_client.call("coverartarchive.org", mb.get_image_list, release_id)
+    except mb.ResponseError as error:
+        if _not_found(error):
+            return {"images": []}
+        raise
+
+
+def fetch_cd_art(job, disc_info: dict):
+    """
+    Look for the CD artwork on a background thread, once per job\n
+    The thread writes the poster to its own copy of the job, the instance of the caller
+    is never touched from it. Jobs that aren't in the database yet are looked up straight away.
+    """
+    audio_probe = probe(job)
+    if audio_probe.art is not None:
+        return
+    if job.job_id is None:
+        audio_probe.art = get_cd_art(job, disc_info)
+        return
+    audio_probe.art = threading.Thread(target=_cd_art_thread, args=(type(job), job.job_id, disc_info),
+                                       name="cover-art", daemon=True)
+    audio_probe.art.start()
+
+
+def _cd_art_thread(model, job_id, disc_info):
+    with app.app_context():
+        try:
+            job = model.query.get(job_id)
+            if job is not None:
+                get_cd_art(job, disc_info)
+        except Exception as error:
+            logging.error(f"Cover art lookup of job #{job_id} failed: {error}")
+        finally:
+            db.session.remove()
+
+
+def wait_for_cd_art(job):
+    """Let the background artwork lookup of a job finish, so its poster is written before ARM exits"""
+    art = probe(job).art
+    if isinstance(art, threading.Thread):
+        art.join()
+        # The poster was written by the session of the lookup thread
+        db.session.expire(job, ["poster_url", "poster_url_auto"])
+
+
 def get_cd_art(job, disc_info: str) -> bool:
     """
     Retrieve and store CD artwork from MusicBrainz if available.
@@ -379,7 +498,10 @@ def get_cd_art(job, disc_info: str) -> bool:
                 # 400: Releaseid is not a valid UUID
                 # 404: No release exists with an MBID of releaseid
                 # 503: Ratelimit exceeded
-                artlist = mb.get_image_list(first_release_with_artwork['id'])
+                release_id = first_release_with_artwork['id']
+                artlist = metadata_cache.lookup("coverart:release", release_id, None,
+                                                lambda: _fetch_image_list(release_id),
+                                                lambda image_list: bool(image_list.get("images")))
                 logging.debug(f"artlist: {artlist}")
 
                 for image in artlist["images"]:
@@ -392,8 +514,9 @@ def get_cd_art(job, disc_info: str) -> bool:
                         u.database_updater(args, job)
                         logging.debug(f"poster_url: {args['poster_url']} poster_url_auto: {args['poster_url_auto']}")
                         return True
+        logging.debug("we didnt get art image")
         return False
-    except mb.WebServiceError as exc:
+    except (mb.WebServiceError, TimeoutError) as exc:
         u.database_updater(False, job)
         logging.error(f"get_cd_art ERROR: {exc}")
         return False
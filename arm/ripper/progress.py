@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Live progress of running jobs
+
+Rippers and transcode workers publish what they are doing as small JSON
+records in LOGPATH/progress, written atomically and at most once per
+PUBLISH_INTERVAL. Each Reporter has a record of its own, so titles encoded
+side by side don't overwrite each other, read() merges the records of a job.
+The UI reads them instead of scanning the job log on every poll, so a poll
+costs a few small file reads per active job.
+"""
+import glob
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import suppress
+
+import arm.config.config as cfg
+from arm.models.job import JobState
+
+# Seconds between two writes of a reporter, changes of stage or title are written at once
+PUBLISH_INTERVAL = 1.0
+
+# Tells the records of the reporters of one process apart
+_parts = itertools.count(1)
+
+
+def record_path(job_id, part):
+    """
+    Progress record of one reporter of a job\n
+    :param job_id: id of the job
+    :param str part: the reporter, "*" matches all records of the job
+    :return str: absolute path in the progress folder of LOGPATH
+    """
+    return os.path.join(cfg.arm_config['LOGPATH'], "progress", f"{int(job_id)}.{part}.json")
+
+
+def _read_records(job_id):
+    records = []
+    for path in glob.glob(record_path(job_id, "*")):
+        try:
+            with open(path, encoding="utf-8") as record_file:
+                records.append(json.load(record_file))
+        except (OSError, ValueError):
+            # Removed by clear() since the glob
+            continue
+    return records
+
+
+def read(job_id):
+    """
+    Last progress published for a job, merged from the records of its reporters\n
+    Only the records with the status of the newest one count, e.g. the rip is over
+    once the transcode publishes. Titles encoded side by side are combined: progress
+    is their average, eta the one of the title furthest behind, title lists the
+    titles still running and titles holds their records.
+    :param job_id: id of the job
+    :return dict: the record, see Reporter.update(), or None without one
+    """
+    records = _read_records(job_id)
+    if not records:
+        return None
+    latest = max(records, key=lambda record: record["updated"])
+    records = sorted((record for record in records if record["status"] == latest["status"]),
+                     key=lambda record: record["started"])
+    running = [record for record in records if not record["done"]] or [latest]
+    behind = min(running, key=lambda record: record["progress"])
+    rate_units = {record["rate_unit"] for record in running if record["rate"] is not None}
+    return {
+        "job_id": latest["job_id"],
+        "status": latest["status"],
+        "stage": max(running, key=lambda record: record["updated"])["stage"],
+        "title": ", ".join(record["title"] for record in running if record["title"]),
+        "titles": running,
+        "progress": round(sum(record["progress"] for record in records) / len(records), 2),
+        "eta": behind["eta"],
+        "rate": sum(record["rate"] or 0 for record in running) if len(rate_units) == 1 else None,
+        "rate_unit": rate_units.pop() if len(rate_units) == 1 else "",
+        "updated": latest["updated"],
+    }
+
+
+def clear(job_id):
+    """Remove the progress records of a finished job"""
+    for path in glob.glob(record_path(job_id, "*")):
+        with suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def _format_eta(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    return f"{hours:d}:{remainder // 60:02d}:{remainder % 60:02d}"
+
+
+class Reporter:
+    """
+    Publishes the progress of one step of a job, e.g. the rip of a disc or the encode of a title
+    """
+
+    def __init__(self, job_id, status, stage, title=""):
+        """
+        :param job_id: id of the job
+        :param status: JobState value of the job while this step runs, the UI ignores records of other states
+        :param stage: what is running, e.g. "Transcoding"
+        :param title: which part of the job, e.g. "2/5"
+        """
+        self.job_id = int(job_id)
+        self.status = status
+        self.stage = stage
+        self.title = title
+        self._part = f"{os.getpid()}-{next(_parts)}"
+        self._started = time.time()
+        self._start = time.monotonic()
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, percent, eta=None, rate=None, rate_unit="", stage=None, title=None):
+        """
+        Publish the current progress, skipped if the last write is less than PUBLISH_INTERVAL ago\n
+        :param float percent: 0-100
+        :param str eta: time left, estimated from the elapsed time if not given
+        :param float rate: current speed, e.g. bytes/s or frames/s
+        :param str rate_unit: unit of rate, e.g. "B/s" or "fps"
+        :param str stage: new stage, written straight away
+        :param str title: new title, written straight away
+        :return: None
+        """
+        now = time.monotonic()
+        with self._lock:
+            changed = (stage is not None and stage != self.stage) or (title is not None and title != self.title)
+            if not changed and now - self._last < PUBLISH_INTERVAL:
+                return
+            self._last = now
+            self.stage = self.stage if stage is None else stage
+            self.title = self.title if title is None else title
+        percent = max(0.0, min(100.0, float(percent)))
+        if eta is None:
+            elapsed = now - self._start
+            eta = _format_eta(elapsed / percent * (100 - percent)) if percent > 0 else ""
+        self._write(self._record(percent, eta, rate, rate_unit))
+
+    def finish(self):
+        """
+        Publish that this step is over, whether it worked or not\n
+        The job keeps counting it as done while other titles are still encoded.
+        """
+        with self._lock:
+            self._last = time.monotonic()
+        self._write(self._record(100.0, "", None, "", done=True))
+
+    def _record(self, percent, eta, rate, rate_unit, done=False):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "title": self.title,
+            "progress": round(percent, 2),
+            "eta": eta,
+            "rate": rate,
+            "rate_unit": rate_unit,
+            "done": done,
+            "started": self._started,
+            "updated": time.time(),
+        }
+
+    def _write(self, record):
+        path = record_path(self.job_id, self._part)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as record_file:
+                json.dump(record, record_file)
+            os.replace(tmp_path, path)
+        except OSError as error:
+            logging.debug(f"Could not publish progress of job {self.job_id}: {error}")
+
+
+def transcoding(job, title):
+    """
+    Reporter for one HandBrake or FFmpeg transcode of a job\n
+    Create it on the thread that owns the job, the reporter itself can be used from any thread.
+    :param job: Current job
+    :param title: what is transcoded, e.g. "2/5" or the file name
+    :return: Reporter
+    """
+    return Reporter(job.job_id, JobState.TRANSCODE_ACTIVE.value, "Transcoding", title)
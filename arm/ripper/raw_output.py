@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Raw output of the external tools of a job
+
+Each makemkvcon, HandBrakeCLI, ffmpeg or abcde process gets a RawOutput. The
+loop reading the tool only queues its lines, a background thread writes them to
+LOGPATH/raw/<job log>.<tool>.log, so no log record is formatted or written per
+line. The job log gets the parsed messages and summaries instead, at most one
+summary per SUMMARY_INTERVAL.
+- a file grows to RAW_OUTPUT_MAX_SIZE MB, later lines are counted but dropped,
+  0 keeps no raw output at all
+- RAW_OUTPUT_COMPRESS writes the file with gzip (.log.gz)
+"""
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import arm.config.config as cfg
+from arm.ripper import logger
+
+RAW_DIR = "raw"
+# Seconds between two summaries in the job log, unless forced
+SUMMARY_INTERVAL = 30
+
+_CLOSE = object()
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def raw_path(tool, log_file=None):
+    """
+    Raw output file of a tool\n
+    :param str tool: name of the tool, e.g. makemkv
+    :param log_file: job log the raw output belongs to, the current log file if None
+    :return str: None when no raw output is kept
+    """
+    if float(cfg.arm_config.get('RAW_OUTPUT_MAX_SIZE', 50)) <= 0:
+        return None
+    log_file = log_file or logger.current_log_file() or "arm.log"
+    name = f"{Path(log_file).stem}.{tool}.log"
+    if cfg.arm_config.get('RAW_OUTPUT_COMPRESS', False):
+        name += ".gz"
+    return os.path.join(cfg.arm_config['LOGPATH'], RAW_DIR, name)
+
+
+class _Writer:
+    """
+    Background thread appending the lines of every open channel of one raw output file\n
+    Encodes running side by side share the file, their lines are written whole.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.channels = 0
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self._loop, name=f"raw-{Path(path).name}", daemon=True)
+        self.thread.start()
+
+    def _loop(self):
+        max_bytes = float(cfg.arm_config.get('RAW_OUTPUT_MAX_SIZE', 50)) * 1024 * 1024
+        compress = self.path.endswith(".gz")
+        batch = []
+        closing = False
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            with (gzip.open(self.path, "at", encoding="utf-8") if compress
+                  else open(self.path, "a", encoding="utf-8")) as raw_file:
+                while not closing:
+                    batch = [self.queue.get()]
+                    while not self.queue.empty():
+                        batch.append(self.queue.get())
+                    for item in batch:
+                        if item is _CLOSE:
+                            closing = True
+                            continue
+                        channel, line = item
+                        if isinstance(line, threading.Event):
+                            # Everything the channel queued before is written
+                            line.set()
+                            continue
+                        if size >= max_bytes:
+                            channel.dropped += 1
+                            continue
+                        if channel.label:
+                            line = f"[{channel.label}] {line}"
+                        raw_file.write(f"{line}\n")
+                        size += len(line) + 1
+                        channel.written += 1
+                    if not compress:
+                        # The raw output can be followed while the tool runs
+                        raw_file.flush()
+        except OSError as error:
+            logging.warning(f"Couldn't write the raw output to {self.path}: {error}")
+        except Exception:
+            # Any error, or close() of the channels would wait for this thread forever
+            logging.exception(f"Writing the raw output to {self.path} failed")
+        else:
+            return
+        self.path = None
+        for item in batch:
+            if item is not _CLOSE and isinstance(item[1], threading.Event):
+                item[1].set()
+        if not closing:
+            self._drain()
+
+    def _drain(self):
+        """Throw away what is queued after the raw output file failed"""
+        while (item := self.queue.get()) is not _CLOSE:
+            if isinstance(item[1], threading.Event):
+                item[1].set()
+
+
+def _open_writer(path):
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = _Writer(path)
+        writer.channels += 1
+        return writer
+
+
+def _close_writer(writer, path):
+    with _writers_lock:
+        writer.channels -= 1
+        if writer.channels:
+            return
+        del _writers[path]
+        writer.queue.put(_CLOSE)
+        writer.thread.join()
+
+
+class RawOutput:
+    """
+    Raw output channel of one external process, use it as a context manager\n
+    write() the lines read from the process or capture() a stream of it,
+    summary() puts a rate limited line into the job log.
+    """
+
+    def __init__(self, tool, log_file=None, label=""):
+        """
+        :param str tool: name of the tool, names the raw output file
+        :param log_file: job log the output belongs to, the current log file if None
+        :param str label: put in front of each line, for processes that share the file, e.g. "2/5"
+        """
+        self.tool = tool
+        self.label = label
+        self.path = raw_path(tool, log_file)
+        self.lines = 0
+        self.written = 0
+        self.dropped = 0
+        self._last_summary = 0.0
+        self._pumps = []
+        self._writer = _open_writer(self.path) if self.path is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def write(self, line):
+        """Queue one line of output, without line ending"""
+        self.lines += 1
+        if self._writer is not None:
+            self._writer.queue.put((self, line))
+
+    def capture(self, stream):
+        """
+        Copy a stream of the process on a thread of its own, e.g. stderr while stdout is parsed\n
+        :param stream: text or binary file object, read until it is closed
+        """
+        pump = threading.Thread(target=self._pump, args=(stream,), name=f"raw-{self.tool}-pump", daemon=True)
+        pump.start()
+        self._pumps.append(pump)
+
+    def _pump(self, stream):
+        for line in stream:
+            if isinstance(line, bytes):
+                line = line.decode("utf-8", errors="replace")
+            self.write(line.rstrip("\r\n"))
+
+    def summary(self, message, force=False):
+        """
+        Log message to the job log, unless the last summary is less than SUMMARY_INTERVAL ago\n
+        :param str message:
+        :param bool force: log it anyway, e.g. when the stage changes
+        :return bool: True if it was logged
+        """
+        now = time.monotonic()
+        if not force and now - self._last_summary < SUMMARY_INTERVAL:
+            return False
+        self._last_summary = now
+        logging.info(message)
+        return True
+
+    def close(self):
+        """Wait until the output of this process is written and note where it went in the job log"""
+        for pump in self._pumps:
+            pump.join()
+        self._pumps = []
+        if self._writer is None:
+            return
+        writer, self._writer = self._writer, None
+        written = threading.Event()
+        writer.queue.put((self, written))
+        written.wait()
+        _close_writer(writer, self.path)
+        if writer.path is None:
+            logging.debug(f"{self.tool}: {self.lines} lines of output, not kept")
+            return
+        message = f"{self.tool}{f' {self.label}' if self.label else ''}: {self.written} lines of output in {self.path}"
+        if self.dropped:
+            message += f", {self.dropped} more over RAW_OUTPUT_MAX_SIZE dropped"
+        logging.info(message)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Cross-process slot scheduler used to limit concurrent external tools
+
+Every limited resource (e.g. transcodes, makemkv info scans) gets its own
+directory holding:
+
+- ``slot.<n>`` one lock file per slot, held with ``flock`` while in use
+- ``ticket.<n>`` one lock file per waiting process, numbers give FIFO order
+- ``counter`` the last handed out ticket number
+- ``doorbell`` a fifo, written to whenever a slot is released
+
+Waiters block on the ticket of the process in front of them, the head of the
+queue blocks on the doorbell. A process that dies releases its locks through
+the kernel, so no stale state can block the queue forever.
+"""
+import errno
+import fcntl
+import logging
+import os
+import select
+import time
+from contextlib import contextmanager, suppress
+
+import arm.config.config as cfg
+
+# Fallback wake up for the head of the queue, covers holders that crashed before ringing the doorbell
+RECHECK_INTERVAL = 30
+
+TRANSCODE = "transcode"
+ENCODER = "encoder"
+MAKEMKV_INFO = "makemkvinfo"
+DRIVE_INDEX = "driveindex"
+
+
+def slot_path(name):
+    """
+    Directory of the slot files for the named scheduler\n
+    :param str name: scheduler name
+    :return str: absolute path, stored next to the ARM database
+    """
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), "slots", name)
+
+
+class SlotScheduler:
+    """
+    Counting semaphore with FIFO tickets shared between all ARM processes
+    """
+
+    def __init__(self, name, max_slots, path=None):
+        self.name = name
+        self.max_slots = int(max_slots)
+        self.path = path or slot_path(name)
+        self.doorbell = os.path.join(self.path, "doorbell")
+
+    def _ticket_file(self, ticket):
+        return os.path.join(self.path, f"ticket.{ticket:012d}")
+
+    def _slot_file(self, index):
+        return os.path.join(self.path, f"slot.{index}")
+
+    def _setup(self):
+        os.makedirs(self.path, exist_ok=True)
+        with suppress(FileExistsError):
+            os.mkfifo(self.doorbell, 0o660)
+
+    def _tickets(self):
+        """Sorted list of all ticket numbers currently on disk"""
+        tickets = []
+        for entry in os.listdir(self.path):
+            if entry.startswith("ticket."):
+                with suppress(ValueError):
+                    tickets.append(int(entry.split(".", 1)[1]))
+        return sorted(tickets)
+
+    def _take_ticket(self):
+        """
+        Draw the next ticket number and hold its lock file\n
+        The ticket file is created while the counter is locked, so a later
+        waiter can never miss a process in front of it.
+        :return: (ticket number, fd of the held ticket file)
+        """
+        counter_fd = os.open(os.path.join(self.path, "counter"), os.O_RDWR | os.O_CREAT, 0o660)
+        try:
+            fcntl.flock(counter_fd, fcntl.LOCK_EX)
+            ticket = int(os.read(counter_fd, 32) or b"0") + 1
+            os.lseek(counter_fd, 0, os.SEEK_SET)
+            os.ftruncate(counter_fd, 0)
+            os.write(counter_fd, str(ticket).encode())
+            ticket_fd = os.open(self._ticket_file(ticket), os.O_RDWR | os.O_CREAT, 0o660)
+            fcntl.flock(ticket_fd, fcntl.LOCK_EX)
+        finally:
+            os.close(counter_fd)
+        return ticket, ticket_fd
+
+    def _wait_for_turn(self, ticket):
+        """Block until every ticket in front of ``ticket`` has left the queue"""
+        while ahead := [number for number in self._tickets() if number < ticket]:
+            previous = self._ticket_file(ahead[-1])
+            try:
+                fd = os.open(previous, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                # Blocks until the previous waiter holds a slot, gave up or died
+                fcntl.flock(fd, fcntl.LOCK_SH)
+            finally:
+                os.close(fd)
+            # Clean up after waiters that died in the queue
+            with suppress(FileNotFoundError):
+                os.unlink(previous)
+
+    def _try_slots(self):
+        """
+        Try to lock any free slot without blocking\n
+        :return: fd of the held slot file or None
+        """
+        for index in range(self.max_slots):
+            fd = os.open(self._slot_file(index), os.O_RDWR | os.O_CREAT, 0o660)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            os.ftruncate(fd, 0)
+            os.write(fd, str(os.getpid()).encode())
+            return fd
+        return None
+
+    def _acquire_slot(self):
+        """Head of the queue: wait for the doorbell until a slot can be locked"""
+        # Opened read/write so the fifo never reports EOF and a release
+        # between our check and the select can't be missed
+        bell_fd = os.open(self.doorbell, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            while (slot_fd := self._try_slots()) is None:
+                readable, _, _ = select.select([bell_fd], [], [], RECHECK_INTERVAL)
+                if readable:
+                    with suppress(BlockingIOError):
+                        os.read(bell_fd, 512)
+            return slot_fd
+        finally:
+            os.close(bell_fd)
+
+    def _ring(self):
+        """Wake the head of the queue, nobody listening is fine"""
+        try:
+            fd = os.open(self.doorbell, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            if error.errno not in (errno.ENXIO, errno.ENOENT):
+                raise
+            return
+        try:
+            os.write(fd, b"\n")
+        except BlockingIOError:
+            pass
+        finally:
+            os.close(fd)
+
+    def _count_locked(self, paths):
+        """Count files that are currently locked by a live process"""
+        count = 0
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            except BlockingIOError:
+                count += 1
+            finally:
+                os.close(fd)
+        return count
+
+    def queue_depth(self):
+        """Number of processes waiting for a slot"""
+        if not os.path.isdir(self.path):
+            return 0
+        return self._count_locked(self._ticket_file(ticket) for ticket in self._tickets())
+
+    def active(self):
+        """Number of slots currently held"""
+        if not os.path.isdir(self.path):
+            return 0
+        return self._count_locked(self._slot_file(index) for index in range(self.max_slots))
+
+    def last_wait(self):
+        """Seconds the last process waited for its slot, None if unknown"""
+        try:
+            with open(os.path.join(self.path, "last_wait"), encoding="utf-8") as wait_file:
+                return float(wait_file.read())
+        except (OSError, ValueError):
+            return None
+
+    def status(self):
+        """
+        Current state of the scheduler\n
+        :return dict: name, max_slots, active, queued, last_wait
+        """
+        return {
+            "name": self.name,
+            "max_slots": self.max_slots,
+            "active": self.active(),
+            "queued": self.queue_depth(),
+            "last_wait": self.last_wait(),
+        }
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold one slot for the duration of the with block\n
+        Waiters are served in arrival order and woken as soon as a slot is released.
+        A limit of 0 or less disables the scheduler.
+        :return: seconds spent waiting for the slot
+        """
+        if self.max_slots <= 0:
+            yield 0.0
+            return
+        self._setup()
+        start = time.monotonic()
+        ticket, ticket_fd = self._take_ticket()
+        try:
+            queued = self.queue_depth() - 1
+            logging.info(f"Waiting for {self.name} slot, {self.active()}/{self.max_slots} in use, "
+                         f"{max(queued, 0)} queued in front")
+            self._wait_for_turn(ticket)
+            slot_fd = self._acquire_slot()
+        finally:
+            with suppress(FileNotFoundError):
+                os.unlink(self._ticket_file(ticket))
+            os.close(ticket_fd)
+        wait_time = time.monotonic() - start
+        with open(os.path.join(self.path, "last_wait"), "w", encoding="utf-8") as wait_file:
+            wait_file.write(f"{wait_time:.1f}")
+        logging.info(f"Got {self.name} slot after waiting {wait_time:.1f}s")
+        try:
+            yield wait_time
+        finally:
+            os.close(slot_fd)
+            self._ring()
+            logging.debug(f"Released {self.name} slot")
+
+
+def transcode_scheduler():
+    """Scheduler shared by HandBrake and FFmpeg, limited by MAX_CONCURRENT_TRANSCODES"""
+    return SlotScheduler(TRANSCODE, int(cfg.arm_config["MAX_CONCURRENT_TRANSCODES"]))
+
+
+def encoder_scheduler():
+    """Scheduler for single HandBrake/FFmpeg processes across all jobs, limited by TRANSCODE_CPU_BUDGET"""
+    return SlotScheduler(ENCODER, int(cfg.arm_config.get("TRANSCODE_CPU_BUDGET", 0)))
+
+
+def makemkv_info_scheduler():
+    """Scheduler for makemkvcon info scans, limited by MAX_CONCURRENT_MAKEMKVINFO"""
+    return SlotScheduler(MAKEMKV_INFO, int(cfg.arm_config["MAX_CONCURRENT_MAKEMKVINFO"]))
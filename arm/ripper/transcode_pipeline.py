@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Pipelined rip and transcode
+
+MakeMKV rips titles one at a time in process_single_tracks, every finished
+title is handed to a transcode thread straight away. While HandBrake or
+FFmpeg works on title n, MakeMKV is already ripping title n+1, so a disc
+takes roughly max(rip, transcode) instead of rip + transcode.
+"""
+import logging
+import os
+import queue
+import threading
+
+import arm.config.config as cfg
+from arm.models.job import Job
+from arm.ripper import handbrake, ffmpeg, slot_scheduler
+from arm.ui import app, db
+
+
+def can_pipeline(job):
+    """
+    Check if the job can be transcoded per title while ripping\n
+    Only MakeMKV rips in mkv mode, that aren't main feature rips, are ripped title by title
+    :param job: Current job
+    :return bool:
+    """
+    return (bool(cfg.arm_config.get("PIPELINE_TRANSCODE", False))
+            and not job.config.SKIP_TRANSCODE
+            and not job.config.MAINFEATURE
+            and job.config.RIPMETHOD == "mkv")
+
+
+class TranscodePipeline:
+    """
+    Transcode thread fed with the titles MakeMKV has finished writing
+    """
+
+    def __init__(self, job, logfile, transcode_out_path):
+        self.job_id = job.job_id
+        self.logfile = logfile
+        self.transcode_out_path = transcode_out_path
+        self.error = None
+        self.submitted = set()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"transcode-pipeline-{job.job_id}", daemon=True)
+        self._thread.start()
+
+    def submit(self, track, rawpath):
+        """
+        Hand a ripped title to the transcode thread\n
+        :param track: arm.models.track.Track that MakeMKV has finished
+        :param rawpath: Directory MakeMKV ripped to
+        :return: None
+        """
+        if not os.path.isfile(os.path.join(rawpath, track.filename)):
+            logging.warning(f"Track #{track.track_number} was ripped but {track.filename} is missing")
+            return
+        logging.info(f"Queueing {track.filename} for transcoding")
+        self.submitted.add(track.filename)
+        self._queue.put((rawpath, track.filename))
+
+    def finish(self, rawpath):
+        """
+        Transcode anything MakeMKV wrote but wasn't submitted, then wait for the transcode thread\n
+        :param rawpath: Directory MakeMKV ripped to
+        :raises: the first error raised by a transcode
+        """
+        if rawpath and os.path.isdir(rawpath):
+            for files in sorted(os.listdir(rawpath)):
+                if files not in self.submitted:
+                    self._queue.put((rawpath, files))
+        self._queue.put(None)
+        self._thread.join()
+        # The transcode thread updated the tracks in its own session
+        db.session.expire_all()
+        if self.error is not None:
+            raise self.error
+
+    def cancel(self):
+        """Stop the transcode thread after the current title, used when the rip failed"""
+        self._queue.put(None)
+
+    def _run(self):
+        with app.app_context():
+            try:
+                job = Job.query.get(self.job_id)
+                item = self._queue.get()
+                if item is None:
+                    return
+                # Hold a transcode slot from the first title until the disc is done
+                with slot_scheduler.transcode_scheduler().slot():
+                    hb_args, hb_preset = handbrake.correct_hb_settings(job)
+                    while item is not None:
+                        rawpath, files = item
+                        if job.config.USE_FFMPEG:
+                            ffmpeg.ffmpeg_mkv_file(rawpath, self.transcode_out_path, job, files)
+                        else:
+                            handbrake.handbrake_mkv_file(rawpath, self.transcode_out_path, self.logfile,
+                                                         job, files, hb_preset, hb_args)
+                        item = self._queue.get()
+            except Exception as error:
+                logging.error(f"Pipelined transcode failed: {error}")
+                # Titles still queued are skipped, finish() raises the error
+                self.error = error
+            finally:
+                db.session.remove()
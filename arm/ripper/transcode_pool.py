@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Per job pool for transcoding several titles at once
+
+A single HandBrake or FFmpeg process rarely keeps a big machine busy on DVD
+sized titles. The titles of a job are handed to a thread pool of
+TRANSCODE_JOB_PARALLELISM threads, every encoder process also holds a slot of
+the encoder scheduler, which caps the encoders of all jobs together at
+TRANSCODE_CPU_BUDGET.
+
+The threads only run the encoder, the database is updated by the calling
+thread as the encodes finish, in whatever order that happens.
+"""
+import logging
+import subprocess
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+
+import arm.config.config as cfg
+from arm.ripper import slot_scheduler
+from arm.ui import db_writer
+
+
+def job_parallelism():
+    """Number of titles of one job that are transcoded at the same time"""
+    return max(int(cfg.arm_config.get("TRANSCODE_JOB_PARALLELISM", 1)), 1)
+
+
+def run_encodes(job, encodes):
+    """
+    Run the encodes of a job, up to TRANSCODE_JOB_PARALLELISM at once\n
+    After the first failure no new titles are started, the running encodes are left to finish.
+    :param job: Current job
+    :param encodes: list of (track, label, encode). encode is called without arguments in a pool
+                    thread and must not use the database. label names the title in the track error.
+                    track may be None if the file has no matching track
+    :return: None
+    :raises: the error of the first failed encode
+    """
+    if not encodes:
+        return
+    workers = min(job_parallelism(), len(encodes))
+    scheduler = slot_scheduler.encoder_scheduler()
+    logging.info(f"Transcoding {len(encodes)} title(s), {workers} at a time")
+
+    failed = threading.Event()
+
+    def encode_in_slot(encode):
+        with scheduler.slot():
+            # Checked once the slot is ours, the wait for it can be long
+            if failed.is_set():
+                raise CancelledError()
+            try:
+                encode()
+            except Exception:
+                failed.set()
+                raise
+
+    first_error = None
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"transcode-{job.job_id}") as pool:
+        futures = {pool.submit(encode_in_slot, encode): (track, label) for track, label, encode in encodes}
+        for future in as_completed(futures):
+            track, label = futures[future]
+            try:
+                future.result()
+            except CancelledError:
+                # Not started because another title failed
+                continue
+            except Exception as error:
+                if isinstance(error, subprocess.CalledProcessError):
+                    err = f"{label} failed with code: {error.returncode}"
+                else:
+                    err = f"{label} failed: {error}"
+                logging.error(err)
+                if first_error is None:
+                    first_error = error
+                if track is not None:
+                    track.status = "fail"
+                    track.error = err
+            else:
+                logging.info(f"{label} finished")
+                if track is not None:
+                    track.status = "success"
+                    track.ripped = True
+            db_writer.commit()
+    if first_error is not None:
+        raise first_error
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Durable transcode queue shared between the ripper and the transcode workers
+
+The ripper adds an item once MakeMKV has written the raw files, the worker
+pool (see transcode_worker.py) claims items in arrival order.
+"""
+import datetime
+import logging
+
+import psutil
+
+import arm.config.config as cfg
+from arm.models.config import hidden_attribs
+from arm.models.job import JobState
+from arm.models.transcode_queue import TranscodeQueue, TranscodeState
+from arm.ripper import known_discs, utils
+from arm.ui import db, db_writer
+
+# Items that crashed a worker this many times are marked as failed instead of being retried
+MAX_ATTEMPTS = 3
+
+
+def enqueue(job, raw_path, transcode_out_path, final_directory, use_make_mkv, protection):
+    """
+    Add a transcode work item for a ripped job\n
+    :param job: Current job
+    :param raw_path: Path MakeMKV ripped to
+    :param transcode_out_path: Path the transcoder saves files to
+    :param final_directory: Path in COMPLETED_PATH for the finished files
+    :param use_make_mkv: Was the disc ripped with MakeMKV
+    :param protection: Does the disc have 99 track protection
+    :return: the new TranscodeQueue item
+    """
+    tracks = [track.filename for track in job.tracks.filter_by(ripped=True)]
+    config = {key: value for key, value in cfg.arm_config.items() if key not in hidden_attribs}
+    item = TranscodeQueue(job.job_id, raw_path, transcode_out_path, final_directory,
+                          use_make_mkv, bool(protection), tracks, config)
+    utils.database_adder(item)
+    utils.database_updater({'status': JobState.TRANSCODE_WAITING.value}, job)
+    logging.info(f"Job #{job.job_id} added to the transcode queue with {len(tracks)} track(s), "
+                 f"{queue_depth()} item(s) waiting")
+    return item
+
+
+def queue_depth():
+    """Number of items waiting for a worker"""
+    return TranscodeQueue.query.filter_by(status=TranscodeState.QUEUED.value).count()
+
+
+def claim_next(worker_pid):
+    """
+    Claim the oldest queued item for a worker\n
+    The status check in the update makes the claim atomic between processes.
+    :param worker_pid: pid of the process that works on the item
+    :return: claimed TranscodeQueue item or None if the queue is empty
+    """
+    while True:
+        item = TranscodeQueue.query.filter_by(status=TranscodeState.QUEUED.value) \
+            .order_by(TranscodeQueue.id).first()
+        if item is None:
+            return None
+        claimed = TranscodeQueue.query.filter_by(id=item.id, status=TranscodeState.QUEUED.value) \
+            .update({'status': TranscodeState.ACTIVE.value,
+                     'worker_pid': worker_pid,
+                     'attempts': TranscodeQueue.attempts + 1,
+                     'start_time': datetime.datetime.now()})
+        db_writer.commit()
+        if claimed:
+            db.session.refresh(item)
+            return item
+
+
+def _worker_alive(pid):
+    """Check pid belongs to a running transcode worker, not a recycled pid"""
+    if not pid or not psutil.pid_exists(pid):
+        return False
+    try:
+        return any("transcode_worker" in part for part in psutil.Process(pid).cmdline())
+    except psutil.Error:
+        return False
+
+
+def recover_stale():
+    """
+    Put items back in the queue whose worker died mid transcode\n
+    Items that keep killing their workers are failed after MAX_ATTEMPTS.
+    :return: number of recovered items
+    """
+    recovered = 0
+    for item in TranscodeQueue.query.filter_by(status=TranscodeState.ACTIVE.value).all():
+        if _worker_alive(item.worker_pid):
+            continue
+        if item.attempts >= MAX_ATTEMPTS:
+            logging.error(f"Transcode of job #{item.job_id} failed {item.attempts} times, giving up")
+            finish(item, f"Transcode worker died {item.attempts} times")
+            continue
+        logging.info(f"Worker {item.worker_pid} of job #{item.job_id} is gone, re-queueing transcode")
+        item.status = TranscodeState.QUEUED.value
+        item.worker_pid = None
+        db_writer.commit()
+        recovered += 1
+    return recovered
+
+
+def finish(item, error=None):
+    """
+    Mark an item and its job as finished\n
+    :param item: TranscodeQueue item
+    :param error: error message if the transcode failed
+    :return: None
+    """
+    item.status = TranscodeState.FAILED.value if error else TranscodeState.DONE.value
+    item.error = error
+    item.stop_time = datetime.datetime.now()
+    job = item.job
+    if job is None:
+        # The job was deleted from the UI, there is nothing else to update
+        db_writer.commit()
+        return
+    job.status = JobState.FAILURE.value if error else JobState.SUCCESS.value
+    if error:
+        job.errors = error
+    job.stop_time = item.stop_time
+    if job.start_time:
+        job_length = job.stop_time - job.start_time
+        minutes, seconds = divmod(job_length.seconds + job_length.days * 86400, 60)
+        hours, minutes = divmod(minutes, 60)
+        job.job_length = f'{hours:d}:{minutes:02d}:{seconds:02d}'
+    if not error:
+        job.measure_output()
+    db_writer.commit()
+    known_discs.remember(job)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Transcode worker pool for Automatic Ripping Machine
+
+Runs as a service next to the ARM UI. The supervisor keeps up to
+TRANSCODE_WORKERS worker processes running, each worker transcodes and post
+processes a single item from the transcode queue and exits. Items of workers
+that died are put back in the queue on the next poll, including after a
+restart of the service.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+from importlib.util import find_spec
+from pathlib import Path
+from signal import signal, SIGTERM
+
+# If the arm module can't be found, add the folder this file is in to PYTHONPATH
+# This is a bad workaround for non-existent packaging
+if find_spec("arm") is None:
+    sys.path.append(str(Path(__file__).parents[2]))
+
+import arm.config.config as cfg  # noqa E402
+from arm.models.job import JobState  # noqa E402
+from arm.models.transcode_queue import TranscodeQueue, TranscodeState  # noqa E402
+from arm.ripper import arm_ripper, logger, progress, transcode_queue, utils  # noqa E402
+from arm.ui import constants, db, db_writer  # noqa E402
+
+# Seconds between checks of the queue when all workers are idle
+POLL_INTERVAL = 10
+
+
+def entry():
+    """ Entry to program, parses arguments"""
+    parser = argparse.ArgumentParser(description='ARM transcode worker pool')
+    parser.add_argument('--item', type=int, help='Transcode a single queue item and exit', required=False)
+    return parser.parse_args()
+
+
+def run_item(item_id):
+    """
+    Transcode and post process one queued job\n
+    :param item_id: id of the claimed TranscodeQueue item
+    :return: exit code for the worker process
+    """
+    item = TranscodeQueue.query.get(item_id)
+    if item is None:
+        logging.error(f"Transcode queue item {item_id} was removed before a worker picked it up")
+        return 0
+    job = item.job
+    if job is None or job.status == JobState.FAILURE.value:
+        # Deleted or abandoned from the UI while waiting in the queue
+        item.status = TranscodeState.FAILED.value
+        item.error = "Job was deleted" if job is None else "Job was abandoned"
+        db_writer.commit()
+        return 0
+    # Transcode with the settings the job was ripped with
+    cfg.arm_config.update(item.get_config())
+    log_file = logger.attach_job_log(job)
+    # Take over the job so clean_old_jobs and abandon see the worker as its process
+    job.get_pid()
+    db_writer.commit()
+    logging.info(f"************* Transcode worker {job.pid} picked up job #{job.job_id} "
+                 f"(attempt {item.attempts}) *************")
+    try:
+        arm_ripper.finish_visual_media(job, log_file, item.raw_path, item.transcode_out_path,
+                                       item.final_directory, item.raw_path, item.use_make_mkv,
+                                       item.protection)
+    except Exception as error:
+        logging.critical("A fatal error has occurred while transcoding.", exc_info=error)
+        utils.notify(job, constants.NOTIFY_TITLE,
+                     f"ARM encountered a fatal error transcoding {job.title}. "
+                     f"Check the logs for more details. {error}")
+        db_writer.flush()
+        transcode_queue.finish(item, str(error))
+        return 1
+    finally:
+        progress.clear(item.job_id)
+    db_writer.flush()
+    transcode_queue.finish(item)
+    logging.debug(f"Database writes: {db_writer.stats()}")
+    return 0
+
+
+def supervise():
+    """
+    Keep the worker pool filled with queued items until the service is stopped
+    """
+    # Leftover items still need a worker, even if queueing was switched off since
+    pool_size = max(int(cfg.arm_config.get("TRANSCODE_WORKERS", 0)), 1)
+    logging.info(f"Starting transcode worker pool with {pool_size} worker(s)")
+    workers = {}
+    while True:
+        for item_id, process in list(workers.items()):
+            if process.poll() is not None:
+                logging.info(f"Worker {process.pid} finished queue item {item_id} with code {process.returncode}")
+                del workers[item_id]
+        try:
+            fill_pool(workers, pool_size)
+        except Exception as error:
+            # A bad item must not take the service down, the next poll tries again
+            logging.error("Checking the transcode queue failed", exc_info=error)
+            db.session.rollback()
+        finally:
+            # End the read transaction so the next poll sees new items
+            db.session.remove()
+        time.sleep(POLL_INTERVAL)
+
+
+def fill_pool(workers, pool_size):
+    """
+    Re-queue the items of dead workers and start workers on queued items\n
+    :param dict workers: running worker processes by item id, updated in place
+    :param int pool_size: most workers running at once
+    :return: None
+    """
+    if recovered := transcode_queue.recover_stale():
+        logging.info(f"Re-queued {recovered} transcode(s) of dead workers")
+    while len(workers) < pool_size and (item := transcode_queue.claim_next(os.getpid())):
+        process = subprocess.Popen([sys.executable, __file__, "--item", str(item.id)])
+        item.worker_pid = process.pid
+        db_writer.commit()
+        workers[item.id] = process
+        logging.info(f"Worker {process.pid} started on job #{item.job_id}, "
+                     f"{transcode_queue.queue_depth()} item(s) left in the queue")
+
+
+if __name__ == "__main__":
+    def signal_handler(_signal, _frame_type):
+        sys.exit(0)
+
+    signal(SIGTERM, signal_handler)
+    args = entry()
+    if args.item is not None:
+        sys.exit(run_item(args.item))
+    supervise()
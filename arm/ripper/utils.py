@@ -6,7 +6,6 @@ import logging
 import subprocess
 import shutil
 import time
-import random
 import re
 from logging import Logger
 from pathlib import Path, PurePath
@@ -21,13 +20,15 @@ from netifaces import interfaces, ifaddresses, AF_INET
 
 import arm.config.config as cfg
 from arm.ripper.ProcessHandler import arm_subprocess
-from arm.ui import db  # needs to be imported before models
+from arm.ui import db, db_writer, http_client  # needs to be imported before models
 from arm.models.job import Job, JobState
 from arm.models.notifications import Notifications
 from arm.models.track import Track
 from arm.models.user import User
 from arm.models.system_drives import SystemDrives
-from arm.ripper import apprise_bulk
+from arm.models.transcode_queue import TranscodeQueue, TRANSCODE_QUEUE_PENDING
+from arm.ripper import apprise_bulk, data_imager, job_signal, progress
+from arm.ripper.raw_output import RawOutput
 
 NOTIFY_TITLE = "ARM notification"
 
@@ -119,39 +120,6 @@ def notify_entry(job):
         raise RipperException("Could not determine disc type")
 
 
-def sleep_check_process(process_str, max_processes, sleep=(20, 120, 10)):
-    """
-    New function to check for max_transcode from job.config and force obey limits\n
-    :param str process_str: The process string from arm.yaml
-    :param int max_processes: The user defined limit for maximum transcodes
-    :param (tuple, int) sleep: tuple: (min sleep time, max sleep time, step) or sleep time as int.
-    :return bool: when we have space in the transcode queue
-    """
-    if max_processes <= 0:
-        return False  # sleep limit disabled
-    if isinstance(sleep, int):
-        sleep = (sleep, sleep + 1, 1)
-    if not isinstance(sleep, tuple):
-        raise TypeError(sleep)
-    loop_count = max_processes + 1
-    logging.info(f"Starting sleep check of {process_str}")
-    while loop_count >= max_processes:
-        # The process might disappear during loops, so we need to query the
-        # name upfront.
-        loop_count = sum(
-            1 for proc in psutil.process_iter(['name'])
-            if proc.info.get('name') == process_str
-        )
-        if max_processes > loop_count:
-            break
-        # Try to make each check at different times
-        random_time = random.randrange(*sleep)
-        logging.debug(f"{loop_count} processes running. Sleeping for {random_time}s.")
-        time.sleep(random_time)
-    logging.info(f"Exiting sleep check of {process_str}")
-    return True
-
-
 def convert_job_type(video_type):
     """
     Converts the job_type to the correct sub-folder
@@ -355,12 +323,14 @@ def scan_emby():
         logging.info("Sending Emby library scan request")
         url = f"http://{cfg.arm_config['EMBY_SERVER']}:{cfg.arm_config['EMBY_PORT']}/Library/Refresh?api_key={cfg.arm_config['EMBY_API_KEY']}"  # noqa: E501
         try:
-            req = requests.post(url)
+            req = http_client.post(url)
             if req.status_code > 299:
                 req.raise_for_status()
             logging.info("Emby Library Scan request successful")
         except requests.exceptions.HTTPError:
             logging.error(f"Emby Library Scan request failed with status code: {req.status_code}")
+        except requests.RequestException as error:
+            logging.error(f"Emby Library Scan request failed: {error}")
     else:
         logging.info("EMBY_REFRESH config parameter is false.  Skipping emby scan.")
 
@@ -454,9 +424,9 @@ def rip_music(job, logfile):
         logging.info("Disc identified as music")
         # If user has set a cfg.arm_config file with ARM use it
         if os.path.isfile(abcfile):
-            cmd = f'abcde -d "{job.devpath}" -c {abcfile} >> "{os.path.join(job.config.LOGPATH, logfile)}" 2>&1'
+            cmd = f'abcde -d "{job.devpath}" -c {abcfile}'
         else:
-            cmd = f'abcde -d "{job.devpath}" >> "{os.path.join(job.config.LOGPATH, logfile)}" 2>&1'
+            cmd = f'abcde -d "{job.devpath}"'
 
         logging.debug(f"Sending command: {cmd}")
         args = {"status": JobState.AUDIO_RIPPING.value}
@@ -464,7 +434,8 @@ def rip_music(job, logfile):
 
         try:
             # TODO check output and confirm all tracks ripped; find "Finished\.$"
-            subprocess.check_output(cmd, shell=True).decode("utf-8")
+            run_abcde(cmd, os.path.join(job.config.LOGPATH, logfile),
+                      progress.Reporter(job.job_id, JobState.AUDIO_RIPPING.value, "Ripping"), job.no_of_titles)
             logging.info("abcde call successful")
             args = {"status": JobState.IDLE.value}
             database_updater(args, job)
@@ -477,9 +448,34 @@ def rip_music(job, logfile):
     return False
 
 
+def run_abcde(cmd, log_path, reporter, no_of_titles):
+    """
+    Run abcde, keep its output as the raw abcde output of the job log and publish the track being ripped\n
+    :param cmd: abcde command
+    :param log_path: full path of the job log
+    :param reporter: arm.ripper.progress.Reporter of the job
+    :param no_of_titles: tracks on the disc
+    :return: None
+    :raises subprocess.CalledProcessError: abcde failed
+    """
+    track = None
+    with RawOutput("abcde", log_path) as raw, \
+            subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             text=True, errors="ignore") as proc:
+        for line in proc.stdout:
+            raw.write(line.rstrip("\n"))
+            # cdparanoia: "Ripping from sector   12345 (track  3 [0:00.00])"
+            if (track_search := re.search(r"\(track\s*(\d+)", line)) and int(track_search.group(1)) != track:
+                track = int(track_search.group(1))
+                reporter.update(100 * track / (no_of_titles + 1), title=f"{track}/{no_of_titles}")
+                raw.summary(f"abcde: ripping track {track}/{no_of_titles}", force=True)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+
 def rip_data(job):
     """
-    Rip data disc using dd on the command line\n
+    Rip data disc to an iso image in the completed path\n
     :param job: Current job
     :return: True/False for success/fail
     """
@@ -487,42 +483,34 @@ def rip_data(job):
     if job.label == "" or job.label is None:
         job.label = "data-disc"
     # get filesystem in order
-    raw_path = os.path.join(job.config.RAW_PATH, str(job.label))
     final_path = os.path.join(job.config.COMPLETED_PATH, convert_job_type(job.video_type))
     final_file_name = str(job.label)
 
-    if (make_dir(raw_path)) is False:
+    if os.path.isfile(os.path.join(final_path, final_file_name, f"{job.label}.iso")):
         random_time = str(round(time.time() * 100))
-        raw_path = os.path.join(job.config.RAW_PATH, str(job.label) + "_" + random_time)
         final_file_name = f"{job.label}_{random_time}"
-        make_dir(raw_path, False)
 
     final_path = os.path.join(final_path, final_file_name)
-    incomplete_filename = os.path.join(raw_path, str(job.label) + ".part")
+    full_final_file = os.path.join(final_path, f"{str(job.label)}.iso")
     make_dir(final_path)
-    logging.info(f"Ripping data disc to: {incomplete_filename}")
-    # Added from pull 366
-    cmd = f'dd if="{job.devpath}" of="{incomplete_filename}" {cfg.arm_config["DATA_RIP_PARAMETERS"]} 2>> ' \
-          f'{os.path.join(job.config.LOGPATH, job.logfile)}'
-    logging.debug(f"Sending command: {cmd}")
+    logging.info(f"Ripping data disc to: {full_final_file}")
+    database_updater({"status": JobState.VIDEO_RIPPING.value}, job)
     try:
-        subprocess.check_output(cmd, shell=True).decode("utf-8")
-        full_final_file = os.path.join(final_path, f"{str(job.label)}.iso")
-        logging.info(f"Moving data-disc from '{incomplete_filename}' to '{full_final_file}'")
-        move_files_main(incomplete_filename, full_final_file, final_path)
+        reporter = progress.Reporter(job.job_id, JobState.VIDEO_RIPPING.value, "Imaging data disc")
+        imager = data_imager.DiscImager(job.devpath, reporter=reporter)
+        result = imager.image(full_final_file)
+        if result.digest:
+            logging.info(f"{result.hash_name} of {full_final_file}: {result.digest}")
+        if result.bad_sectors:
+            logging.warning(f"{result.bad_sectors} unreadable sector(s) were "
+                            f"{'filled with zeros' if imager.policy == 'zero' else 'skipped'}")
         logging.info("Data rip call successful")
         success = True
-    except subprocess.CalledProcessError as dd_error:
-        err = f"Data rip failed with code: {dd_error.returncode}({dd_error.output})"
+    except (OSError, ValueError) as error:
+        err = f"Data rip failed: {error}"
         logging.error(err)
-        os.unlink(incomplete_filename)
         args = {"status": JobState.FAILURE.value, "errors": err}
         database_updater(args, job)
-    try:
-        logging.info(f"Trying to remove raw_path: '{raw_path}'")
-        shutil.rmtree(raw_path)
-    except OSError as error:
-        logging.error(f"Error: {error.filename} - {error.strerror}.")
     return success
 
 
@@ -635,36 +623,24 @@ def arm_setup(arm_log: Logger) -> None:
             arm_log.critical(f"Can't write to folder: {folder}")
 
 
-def database_updater(args, job, wait_time=90):
+def database_updater(args, job, coalesce=False):
     """
-    Try to update our db for x seconds and handle it nicely if we can't
+    Update our db, retrying with backoff while the database is locked
     If args isn't a dict assume we are wanting a rollback\n
 
     :param args: This needs to be a Dict with the key being the job.method
     you want to change and the value being
     the new value.
     :param job: This is the job object
-    :param int wait_time: Number of times to try(1 sec sleep between try)
+    :param bool coalesce: Write in the background, for frequent status changes
     :return: Success
     """
     if not isinstance(args, dict):
         db.session.rollback()
         return False
-    # Loop through our args and try to set any of our job variables
     for (key, value) in args.items():
-        setattr(job, key, value)
         logging.debug(f"ID:{job.job_id} {key}={value}:{type(value)}")
-
-    for i in range(wait_time):  # give up after the users wait period in seconds
-        try:
-            db.session.commit()
-        except Exception as error:
-            if "locked" in str(error):
-                time.sleep(1)
-                logging.debug(f"database is locked - try {i}/{wait_time}")
-            else:
-                logging.debug(f"Error: {error}")
-                raise RuntimeError(str(error)) from error
+    db_writer.update(job, args, coalesce)
     logging.debug("successfully written to the database")
     return True
 
@@ -676,19 +652,8 @@ def database_adder(obj_class):
     :param obj_class: Job/Config/Track/ etc
     :return: True if success
     """
-    for i in range(90):  # give up after the users wait period in seconds
-        try:
-            logging.debug(f"Trying to add {type(obj_class).__name__}")
-            db.session.add(obj_class)
-            db.session.commit()
-            break
-        except Exception as error:
-            if "locked" in str(error):
-                time.sleep(1)
-                logging.debug(f"database is locked - try {i}/90")
-            else:
-                logging.error(f"Error: {error}")
-                raise RuntimeError(str(error)) from error
+    logging.debug(f"Trying to add {type(obj_class).__name__}")
+    db_writer.add(obj_class)
     logging.debug(f"successfully written {type(obj_class).__name__} to the database")
     return True
 
@@ -698,10 +663,15 @@ def clean_old_jobs():
     Check for running jobs - Update failed jobs that are no longer running\n
     :return: None
     """
-    active_jobs = db.session.query(Job).filter(Job.status.notin_(['fail', 'success'])).all()
+    active_jobs = db.session.query(Job).filter(Job.active).all()
+    # Jobs waiting for a transcode worker have no process until a worker picks them up
+    pending = [state.value for state in TRANSCODE_QUEUE_PENDING]
+    queued_jobs = {item.job_id for item in TranscodeQueue.query.filter(TranscodeQueue.status.in_(pending))}
     # Clean up abandoned jobs
     for job in active_jobs:
-        if psutil.pid_exists(job.pid):
+        if job.job_id in queued_jobs:
+            logging.info(f"Job #{job.job_id} is waiting in the transcode queue.")
+        elif psutil.pid_exists(job.pid):
             job_process = psutil.Process(job.pid)
             if job.pid_hash == hash(job_process):
                 logging.info(f"Job #{job.job_id} with PID {job.pid} is currently running.")
@@ -709,7 +679,7 @@ def clean_old_jobs():
             logging.info(f"Job #{job.job_id} with PID {job.pid} has been abandoned."
                          f"Updating job status to fail.")
             job.status = JobState.FAILURE.value
-            db.session.commit()
+            db_writer.commit()
             database_updater({'status': JobState.FAILURE.value}, job)
 
 
@@ -885,17 +855,14 @@ def check_for_wait(job):
     if job.config.MANUAL_WAIT:
         logging.info(f"Waiting {job.config.MANUAL_WAIT_TIME} seconds for manual override.")
         database_updater({"status": JobState.MANUAL_WAIT_STARTED.value}, job)
-        sleep_time = 0
-        while sleep_time < job.config.MANUAL_WAIT_TIME:
-            time.sleep(5)
-            sleep_time += 5
-            db.session.refresh(job)
-            if job.title_manual:
-                logging.info("Manual override found.  Overriding auto identification values.")
-                job.updated = True
-                job.hasnicetitle = True
-                database_updater({"hasnicetitle": True, "updated": True}, job)
-                break
+        # Woken by the UI as soon as the title is changed
+        with job_signal.listen(job) as listener:
+            overridden = listener.wait(int(job.config.MANUAL_WAIT_TIME), lambda: bool(job.title_manual))
+        if overridden:
+            logging.info("Manual override found.  Overriding auto identification values.")
+            job.updated = True
+            job.hasnicetitle = True
+            database_updater({"hasnicetitle": True, "updated": True}, job)
         database_updater({"status": JobState.IDLE.value}, job)
 
 
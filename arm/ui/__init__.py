@@ -65,6 +65,8 @@ app.logger.debug("Debugging pin: " + os.environ["WERKZEUG_DEBUG_PIN"])
 
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+# WAL mode, busy timeout and lock counters for every connection
+from arm.ui import db_writer  # noqa: E402,F401
 
 # Register route blueprints
 # loaded post database declaration to avoid circular loops
@@ -4,19 +4,17 @@ Covers
 - database [GET]
 - dbupdate [POST]
 - import_movies [JSON]
+- import_movies/status [JSON]
 """
 
 import os
 import json
-import re
 from flask_login import LoginManager, login_required  # noqa: F401
 from flask import render_template, request, Blueprint, flash, redirect, session
 
 import arm.ui.utils as ui_utils
-from arm.ui import app, db, constants
-from arm.models.job import Job
+from arm.ui import app, constants, job_pages, library_import, stats_collector
 import arm.config.config as cfg
-from arm.ui.metadata import get_omdb_poster
 from arm.ui.forms import DBUpdate
 
 app.app_context().push()
@@ -34,24 +32,22 @@ def view_database():
     """
     The main database page
 
-    Outputs every job from the database
-     this can cause serious slow-downs with + 3/4000 entries
+    Outputs the jobs from the database a page at a time, newest first
     """
     # regenerate the armui_cfg we don't want old settings
     armui_cfg = ui_utils.arm_db_cfg()
 
-    page = request.args.get('page', 1, type=int)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     app.logger.debug(armui_cfg)
 
     # Check for database file
     if os.path.isfile(cfg.arm_config['DBFILE']):
-        jobs = Job.query.order_by(db.desc(Job.job_id)).paginate(page=page,
-                                                                max_per_page=int(
-                                                                    armui_cfg.database_limit),
-                                                                error_out=False)
+        jobs = job_pages.get_page(job_pages.DATABASE_FIELDS, int(armui_cfg.database_limit),
+                                  before=before, after=after, with_config=True)
     else:
         app.logger.error('ERROR: /database no database, file doesnt exist')
-        jobs = {}
+        jobs = job_pages.JobPage([], 0, None, None)
 
     session["page_title"] = "Database"
 
@@ -82,6 +78,7 @@ def update_database():
 
         # Update the arm UI config from DB post update
         ui_utils.arm_db_cfg()
+        stats_collector.reset_db_check()
 
         return redirect('/index')
     else:
@@ -93,63 +90,31 @@ def update_database():
 @login_required
 def import_movies():
     """
-    Function for finding all movies not currently tracked by ARM in the COMPLETED_PATH
-    This should not be run frequently
-    This causes a HUGE number of requests to OMdb\n
-    :return: Outputs json - contains a dict/json of movies added and a notfound list
-             that doesn't match ARM identified folder format.
-    .. note:: This should eventually be moved to /json page load times are too long
+    Start finding all movies not currently tracked by ARM in the COMPLETED_PATH\n
+    The import runs in the background, see library_import. Movie folders already
+    imported are skipped and posters come from the metadata cache where possible.
+    :return: Outputs json - started, false if an import was already running, and the
+             progress of the import, see import_movies_status()
     """
-    my_path = cfg.arm_config['COMPLETED_PATH']
-    app.logger.debug(my_path)
-    movies = {0: {'notfound': {}}}
-    i = 1
-    movie_dirs = ui_utils.generate_file_list(my_path)
-    app.logger.debug(movie_dirs)
-    if len(movie_dirs) < 1:
-        app.logger.debug("movie_dirs found none")
-
-    for movie in movie_dirs:
-        # will match 'Movie (0000)'
-        regex = r"([\w\ \'\.\-\&\,]*?) \((\d{2,4})\)"
-        # get our match
-        matched = re.match(regex, movie)
-        # if we can match the standard arm output format "Movie (year)"
-        if matched:
-            poster_image, imdb_id = get_omdb_poster(matched.group(1), matched.group(2))
-            app.logger.debug(os.path.join(my_path, str(movie)))
-            app.logger.debug(str(os.listdir(os.path.join(my_path, str(movie)))))
-            movies[i] = ui_utils.import_movie_add(poster_image,
-                                                  imdb_id, matched,
-                                                  os.path.join(my_path, str(movie)))
-        else:
-            # If we didn't get a match assume that the directory is a main directory for other folders
-            # This means we can check for "series" type movie folders e.g
-            # - Lord of the rings
-            #     - The Lord of the Rings The Fellowship of the Ring (2001)
-            #     - The Lord of the Rings The Two Towers (2002)
-            #     - The Lord of the Rings The Return of the King (2003)
-            #
-            sub_path = os.path.join(my_path, str(movie))
-            # Go through each folder and treat it as a sub-folder of movie folder
-            subfiles = ui_utils.generate_file_list(sub_path)
-            for sub_movie in subfiles:
-                sub_matched = re.match(regex, sub_movie)
-                if sub_matched:
-                    # Fix poster image and imdb_id
-                    poster_image, imdb_id = get_omdb_poster(sub_matched.group(1), sub_matched.group(2))
-                    app.logger.debug(os.listdir(os.path.join(sub_path, str(sub_movie))))
-                    # Add the movies to the main movie dict
-                    movies[i] = ui_utils.import_movie_add(poster_image,
-                                                          imdb_id, sub_matched,
-                                                          os.path.join(sub_path, str(sub_movie)))
-                else:
-                    movies[0]['notfound'][str(i)] = str(sub_movie)
-            app.logger.debug(subfiles)
-        i += 1
-    app.logger.debug(movies)
-    db.session.commit()
-    movies = {k: v for k, v in movies.items() if v}
-    return app.response_class(response=json.dumps(movies, indent=4, sort_keys=True),
+    started = library_import.start()
+    app.logger.debug(f"Movie import started: {started}")
+    return import_status_response(started=started)
+
+
+@route_database.route('/import_movies/status')
+@login_required
+def import_movies_status():
+    """
+    Progress and result of the movie import\n
+    :return: Outputs json - state, total, done, skipped, the movies added by crc_id
+             and a notfound list of folders that don't match the ARM folder format
+    """
+    return import_status_response()
+
+
+def import_status_response(**extra):
+    status = library_import.status()
+    status.update(extra)
+    return app.response_class(response=json.dumps(status, indent=4, sort_keys=True),
                               status=200,
                               mimetype=constants.JSON_TYPE)
@@ -0,0 +1,328 @@
+"""
+Central write layer for the ARM database
+
+Every ripper, transcode worker and the UI share one SQLite file. This module
+- switches the database to WAL mode with a real busy timeout, so readers never
+  block writers and writers wait inside SQLite instead of failing at once
+- retries commits that still hit a lock with bounded exponential backoff,
+  replaying the changes of the transaction after the rollback, including the
+  ones autoflush or a bulk query.update() already sent to the database
+- coalesces frequent job state updates, written by a background thread at most
+  once per COALESCE_INTERVAL per row
+- counts commits and lock waits, see stats()
+"""
+import atexit
+import contextlib
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, attributes, object_mapper
+
+from arm.ui import app, db
+
+# Milliseconds SQLite waits for a lock before reporting "database is locked"
+BUSY_TIMEOUT = 10000
+# Attempts and backoff for commits that still hit a lock
+MAX_ATTEMPTS = 6
+BACKOFF_START = 0.1
+BACKOFF_MAX = 2.0
+# Seconds coalesced updates are held before they are written
+COALESCE_INTERVAL = 1.0
+
+_stats_lock = threading.Lock()
+_stats = {
+    "commits": 0,
+    "lock_waits": 0,
+    "lock_wait_seconds": 0.0,
+    "failed_commits": 0,
+    "coalesced_updates": 0,
+    "coalesced_writes": 0,
+}
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    """Enable WAL and the busy timeout on every new SQLite connection"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT:d}")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL, only the last transactions can be lost on power failure
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    finally:
+        cursor.close()
+
+
+def _count(key, value=1):
+    with _stats_lock:
+        _stats[key] += value
+
+
+def stats():
+    """
+    Counters of this process\n
+    :return dict: commits, lock_waits, lock_wait_seconds, failed_commits, coalesced_updates, coalesced_writes
+    """
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _is_locked(error):
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _pending_changes(session):
+    """Snapshot of the changes in a session, so they can be replayed after a rollback"""
+    dirty = []
+    for obj in session.dirty:
+        state = inspect(obj)
+        values = {column.key: getattr(obj, column.key) for column in state.mapper.column_attrs
+                  if state.attrs[column.key].history.has_changes()}
+        dirty.append((obj, values))
+    return dirty, list(session.new), list(session.deleted)
+
+
+def _replay(session, changes):
+    dirty, new, deleted = changes
+    for obj, values in dirty:
+        for key, value in values.items():
+            setattr(obj, key, value)
+    for obj in new:
+        session.add(obj)
+    for obj in deleted:
+        session.delete(obj)
+
+
+def _journal(session):
+    """Changes already sent to the database in the current transaction of a session, oldest first"""
+    return session.info.setdefault("db_writer_journal", [])
+
+
+@event.listens_for(Session, "before_flush")
+def _journal_flush(session, _flush_context, _instances):
+    if session.dirty or session.new or session.deleted:
+        _journal(session).append((_replay, _pending_changes(session)))
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _journal_bulk(orm_execute_state):
+    """query.update() and query.delete() don't go through a flush"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        _journal(orm_execute_state.session).append(
+            (_execute, (orm_execute_state.statement, orm_execute_state.parameters,
+                        orm_execute_state.execution_options)))
+
+
+def _execute(session, statement):
+    statement, parameters, execution_options = statement
+    session.execute(statement, parameters, execution_options=execution_options)
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def _end_journal(session):
+    session.info.pop("db_writer_journal", None)
+
+
+def _run(write, session, lock=None):
+    """
+    Call write() and commit, retrying with exponential backoff while the database is locked\n
+    :param lock: held from write() until the commit of each attempt, released while waiting
+    :raises RuntimeError: any other database error, or still locked after MAX_ATTEMPTS
+    """
+    delay = BACKOFF_START
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        started = time.monotonic()
+        try:
+            with lock or contextlib.nullcontext():
+                write()
+                session.commit()
+            _count("commits")
+            return True
+        except OperationalError as error:
+            session.rollback()
+            if not _is_locked(error) or attempt == MAX_ATTEMPTS:
+                _count("failed_commits")
+                logging.error(f"Database write failed after {attempt} attempt(s): {error}")
+                raise RuntimeError(str(error)) from error
+            sleep_time = delay * random.uniform(0.5, 1.0)
+            logging.debug(f"database is locked - try {attempt}/{MAX_ATTEMPTS}, retrying in {sleep_time:.2f}s")
+            time.sleep(sleep_time)
+            _count("lock_waits")
+            _count("lock_wait_seconds", time.monotonic() - started)
+            delay = min(delay * 2, BACKOFF_MAX)
+    return False
+
+
+def commit(session=None):
+    """
+    Commit the session, retrying while the database is locked\n
+    :param session: defaults to db.session
+    :return: True
+    """
+    session = session or db.session
+    # What autoflush or bulk updates already wrote in this transaction is undone by a rollback too
+    changes = list(_journal(session)) + [(_replay, _pending_changes(session))]
+    replay = False
+
+    def write():
+        nonlocal replay
+        # A failed attempt rolled back the session, make the changes again
+        if replay:
+            for apply, change in changes:
+                apply(session, change)
+        replay = True
+
+    return _run(write, session)
+
+
+def update(obj, args, coalesce=False):
+    """
+    Set attributes of a model instance and write them\n
+    :param obj: Job/Track/... instance
+    :param dict args: attribute name -> new value
+    :param bool coalesce: write in the background together with other updates of the same row,
+                          for frequent state changes that don't need to be on disk straight away
+    :return: True
+    """
+    if coalesce and inspect(obj).persistent:
+        _coalescer.put(obj, args)
+        return True
+    for key, value in args.items():
+        setattr(obj, key, value)
+    return commit()
+
+
+def add(obj):
+    """
+    Add a new model instance and write it\n
+    :param obj: Job/Config/Track/... instance
+    :return: True
+    """
+    db.session.add(obj)
+    return commit()
+
+
+def flush():
+    """Write all coalesced updates now, e.g. before the process exits"""
+    _coalescer.flush()
+
+
+class _Coalescer:
+    """
+    Pending coalesced updates per row, written by a background thread
+
+    Coalesced values are set on the instance without marking it dirty, so the
+    session of the caller doesn't write them. If the caller sets a coalesced
+    attribute directly, its newer value wins (see _drop_overwritten). That
+    includes values being written by flush() right now: the lock is held from
+    reading them until the UPDATE is committed, so drop() either removes a value
+    before it is written or waits until it is committed and the direct write
+    comes after it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._inflight = {}
+        self._thread = None
+
+    def put(self, obj, args):
+        key = (object_mapper(obj).class_, inspect(obj).identity)
+        for name, value in args.items():
+            attributes.set_committed_value(obj, name, value)
+        with self._lock:
+            self._pending.setdefault(key, {}).update(args)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="db-writer", daemon=True)
+                self._thread.start()
+        _count("coalesced_updates")
+
+    def has_pending(self):
+        return bool(self._pending or self._inflight)
+
+    def drop(self, obj, names):
+        key = (object_mapper(obj).class_, inspect(obj).identity)
+        with self._lock:
+            for pending in (self._pending.get(key), self._inflight.get(key)):
+                if pending:
+                    for name in names:
+                        pending.pop(name, None)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                self._inflight, self._pending = self._pending, {}
+                if not any(self._inflight.values()):
+                    self._inflight = {}
+                    return
+            written = 0
+            # A session of its own, a rollback on a locked database must not throw away
+            # the unsaved changes of the caller's session
+            session = db.session.session_factory()
+
+            def write():
+                nonlocal written
+                # Read the values now, drop() may have removed some since the swap
+                pending = {key: dict(values) for key, values in self._inflight.items() if values}
+                for (model, identity), values in pending.items():
+                    primary_key = inspect(model).primary_key
+                    query = session.query(model).filter(
+                        *(column == value for column, value in zip(primary_key, identity)))
+                    query.update(values, synchronize_session=False)
+                written = len(pending)
+
+            try:
+                _run(write, session, self._lock)
+            finally:
+                session.close()
+                with self._lock:
+                    self._inflight = {}
+            _count("coalesced_writes", written)
+
+    def _loop(self):
+        with app.app_context():
+            while True:
+                time.sleep(COALESCE_INTERVAL)
+                try:
+                    self.flush()
+                except Exception as error:
+                    logging.error(f"Writing coalesced updates failed: {error}")
+                finally:
+                    db.session.remove()
+
+
+_coalescer = _Coalescer()
+
+
+@event.listens_for(Session, "before_flush")
+def _drop_overwritten(session, _flush_context, _instances):
+    """Attributes set directly after a coalesced update are newer, don't let the background write undo them"""
+    if not _coalescer.has_pending():
+        return
+    for obj in session.dirty:
+        state = inspect(obj)
+        if state.identity is None:
+            continue
+        changed = [column.key for column in state.mapper.column_attrs
+                   if state.attrs[column.key].history.has_changes()]
+        if changed:
+            _coalescer.drop(obj, changed)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        with app.app_context():
+            flush()
+    except Exception as error:
+        logging.error(f"Writing coalesced updates at exit failed: {error}")
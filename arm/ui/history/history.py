@@ -9,8 +9,7 @@ from flask_login import LoginManager, login_required  # noqa: F401
 from flask import render_template, request, Blueprint, session
 
 import arm.ui.utils as ui_utils
-from arm.ui import app, db
-from arm.models.job import Job
+from arm.ui import app, job_pages
 import arm.config.config as cfg
 
 route_history = Blueprint('route_history', __name__,
@@ -30,17 +29,14 @@ def history():
     """
     # regenerate the armui_cfg we don't want old settings
     armui_cfg = ui_utils.arm_db_cfg()
-    page = request.args.get('page', 1, type=int)
+    before = request.args.get('before', type=int)
+    after = request.args.get('after', type=int)
     if os.path.isfile(cfg.arm_config['DBFILE']):
-        # after roughly 175 entries firefox readermode will break
-        # jobs = Job.query.filter_by().limit(175).all()
-        jobs = Job.query.order_by(db.desc(Job.job_id)).paginate(page=page,
-                                                                max_per_page=int(
-                                                                    armui_cfg.database_limit),
-                                                                error_out=False)
+        jobs = job_pages.get_page(job_pages.HISTORY_FIELDS, int(armui_cfg.database_limit),
+                                  before=before, after=after)
     else:
         app.logger.error('ERROR: /history database file doesnt exist')
-        jobs = {}
+        jobs = job_pages.JobPage([], 0, None, None)
     app.logger.debug(f"Date format - {cfg.arm_config['DATE_FORMAT']}")
 
     session["page_title"] = "History"
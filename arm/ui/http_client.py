@@ -0,0 +1,198 @@
+"""
+Shared HTTP client for the outbound calls of the rippers and the UI
+
+One client per process
+- keeps the connections to each host alive in a pool of POOL_SIZE connections
+- gives every request HTTP_TIMEOUT seconds unless the caller asks for another timeout
+- sends at most one request per RATE_LIMITS[host] seconds to the hosts listed there
+- retries connection errors, timeouts, 429 and 5xx answers up to MAX_ATTEMPTS times
+  with jittered exponential backoff, a Retry-After header is honoured up to BACKOFF_MAX
+- counts requests, retries, errors and their duration per host, see stats()
+Libraries with their own transport (musicbrainzngs) are run through call().
+"""
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import arm.config.config as cfg
+
+# Connections kept open per host
+POOL_SIZE = 8
+# Attempts and backoff for requests that fail or get a retryable answer
+MAX_ATTEMPTS = 3
+BACKOFF_START = 0.5
+BACKOFF_MAX = 8.0
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Seconds between two requests to a host, hosts not listed aren't limited
+RATE_LIMITS = {
+    "musicbrainz.org": 1.0,
+    "coverartarchive.org": 1.0,
+    "1337server.pythonanywhere.com": 1.0,
+    "forum.makemkv.com": 5.0,
+}
+
+_session = None
+_session_lock = threading.Lock()
+_rate_lock = threading.Lock()
+_next_slot = {}
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def session():
+    """
+    The pooled session of this process\n
+    :return requests.Session:
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=POOL_SIZE)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _timeout():
+    return float(cfg.arm_config.get('HTTP_TIMEOUT', 10))
+
+
+def _host(url):
+    return urllib.parse.urlsplit(url).hostname or ""
+
+
+def _rate_limit(host):
+    """Wait for the next free slot of host"""
+    interval = next((seconds for limited, seconds in RATE_LIMITS.items()
+                     if host == limited or host.endswith(f".{limited}")), None)
+    if not interval:
+        return
+    with _rate_lock:
+        now = time.monotonic()
+        slot = max(now, _next_slot.get(host, 0.0))
+        _next_slot[host] = slot + interval
+    if slot > now:
+        time.sleep(slot - now)
+
+
+def _record(host, seconds, retry=False, error=False):
+    with _stats_lock:
+        host_stats = _stats.setdefault(host, {"requests": 0, "retries": 0, "errors": 0,
+                                              "seconds": 0.0, "max_seconds": 0.0})
+        host_stats["requests"] += 1
+        host_stats["retries"] += int(retry)
+        host_stats["errors"] += int(error)
+        host_stats["seconds"] += seconds
+        host_stats["max_seconds"] = max(host_stats["max_seconds"], seconds)
+
+
+def _backoff(attempt, retry_after=None):
+    delay = min(BACKOFF_START * 2 ** attempt, BACKOFF_MAX)
+    try:
+        delay = min(max(delay, float(retry_after)), BACKOFF_MAX)
+    except (TypeError, ValueError):
+        pass
+    return random.uniform(delay / 2, delay)
+
+
+def request(method, url, timeout=None, attempts=MAX_ATTEMPTS, **kwargs):
+    """
+    Send a request through the shared pool\n
+    :param str method: GET, POST, ...
+    :param str url: full url
+    :param timeout: seconds, or a (connect, read) tuple, HTTP_TIMEOUT if None
+    :param int attempts: tries before giving up, 1 for requests that mustn't be repeated
+    :param kwargs: passed on to requests
+    :return requests.Response: the last answer, also when it is an error status
+    :raises requests.RequestException: when no answer came back
+    """
+    host = _host(url)
+    if timeout is None:
+        timeout = _timeout()
+    for attempt in range(attempts):
+        last = attempt + 1 >= attempts
+        _rate_limit(host)
+        start = time.monotonic()
+        try:
+            response = session().request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as error:
+            _record(host, time.monotonic() - start, retry=not last, error=True)
+            if last:
+                raise
+            logging.debug(f"{method} {host} failed, trying again: {error}")
+            time.sleep(_backoff(attempt))
+            continue
+        seconds = time.monotonic() - start
+        retry = response.status_code in RETRY_STATUS and not last
+        _record(host, seconds, retry=retry, error=response.status_code >= 400)
+        logging.debug(f"{method} {host} {response.status_code} in {seconds * 1000:.0f}ms")
+        if not retry:
+            return response
+        logging.debug(f"{host} answered {response.status_code}, trying again")
+        time.sleep(_backoff(attempt, response.headers.get("Retry-After")))
+    return response
+
+
+def get(url, **kwargs):
+    """GET url, see request()"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """POST to url, see request()"""
+    return request("POST", url, **kwargs)
+
+
+def call(host, function, *args, timeout=None, **kwargs):
+    """
+    Run a library call that does its own http through the rate limit, timeout and counters of host\n
+    The call runs on a daemon thread, a call that doesn't return in time is left behind.
+    :param str host: host the library talks to
+    :param function: the library function
+    :param timeout: seconds, HTTP_TIMEOUT * MAX_ATTEMPTS if None, the library may retry on its own
+    :return: what function returned
+    :raises TimeoutError: when the call took longer than timeout
+    """
+    if timeout is None:
+        timeout = _timeout() * MAX_ATTEMPTS
+    result = {}
+
+    def run():
+        try:
+            result["value"] = function(*args, **kwargs)
+        except Exception as error:
+            result["error"] = error
+
+    _rate_limit(host)
+    start = time.monotonic()
+    thread = threading.Thread(target=run, name=f"http-{host}", daemon=True)
+    thread.start()
+    thread.join(timeout)
+    seconds = time.monotonic() - start
+    if thread.is_alive():
+        _record(host, seconds, error=True)
+        raise TimeoutError(f"{host} didn't answer within {timeout:g}s")
+    _record(host, seconds, error="error" in result)
+    logging.debug(f"{getattr(function, '__name__', 'call')} {host} in {seconds * 1000:.0f}ms")
+    if "error" in result:
+        raise result["error"]
+    return result["value"]
+
+
+def stats():
+    """
+    Request counters and durations per host\n
+    :return dict: host: requests, retries, errors, avg_ms, max_ms
+    """
+    with _stats_lock:
+        return {host: {"requests": host_stats["requests"],
+                       "retries": host_stats["retries"],
+                       "errors": host_stats["errors"],
+                       "avg_ms": round(host_stats["seconds"] / host_stats["requests"] * 1000),
+                       "max_ms": round(host_stats["max_seconds"] * 1000)}
+                for host, host_stats in _stats.items()}
@@ -0,0 +1,189 @@
+"""
+Server-Sent Events for the active jobs
+
+One broadcaster thread per UI process reads the active jobs, their progress
+and new notifications every EVENT_INTERVAL and pushes only what changed to
+the connected browsers. The database is read once per interval however many
+tabs are open. Events:
+- snapshot: {"jobs": [...], "notes": [...]}, sent when a client connects or fell behind
+- job: a new active job
+- update: the changed fields of a job, always with its job_id
+- remove: {"job_id": ...}, the job finished or was deleted
+- notification: a new unread notification
+Clients get a comment line every HEARTBEAT_INTERVAL seconds without events.
+"""
+import json
+import queue
+import threading
+import time
+
+from arm.ui import app, db, json_api, poster_cache
+from arm.models.job import Job
+from arm.models.notifications import Notifications
+
+# Seconds between two reads of the active jobs
+EVENT_INTERVAL = 1.0
+# Seconds without events before a heartbeat is sent
+HEARTBEAT_INTERVAL = 15
+# Seconds a browser waits before it reconnects a dropped stream
+RECONNECT_DELAY = 5
+# Every client holds a waitress thread, keep enough threads for normal requests
+MAX_CLIENTS = 20
+# Events queued for a client before it counts as too slow and gets a new snapshot
+CLIENT_QUEUE_SIZE = 100
+
+JOB_FIELDS = ("job_id", "title", "year", "poster_url", "status", "devpath", "video_type", "disctype")
+CONFIG_FIELDS = ("RIPMETHOD", "MAINFEATURE", "MINLENGTH", "MAXLENGTH")
+
+
+class TooManyClients(Exception):
+    """MAX_CLIENTS are already connected, the client should poll /json instead"""
+
+
+def job_snapshot(job):
+    """
+    Fields of a job shown on the home page, as strings like in the json api\n
+    :param job: active Job
+    :return dict:
+    """
+    snapshot = {field: str(getattr(job, field)) for field in JOB_FIELDS}
+    # Changes together with poster_url, the home page prefers the cached thumbnail
+    snapshot["poster_thumb"] = poster_cache.url(job.poster_url)
+    progress = json_api.process_progress(job, {})
+    snapshot.update({key: str(value) for key, value in progress.items()})
+    snapshot.setdefault("stage", str(job.stage))
+    snapshot["config"] = {field: str(getattr(job.config, field, None)) for field in CONFIG_FIELDS}
+    return snapshot
+
+
+class _Broadcaster:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._new_clients = set()
+        self._jobs = {}
+        self._notes = {}
+        self._thread = None
+
+    def subscribe(self):
+        """
+        Register a client, it gets a snapshot with the next tick\n
+        :return queue.Queue: events for the client
+        :raises TooManyClients:
+        """
+        client = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self._lock:
+            if len(self._clients) + len(self._new_clients) >= MAX_CLIENTS:
+                raise TooManyClients()
+            self._new_clients.add(client)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="job-events", daemon=True)
+                self._thread.start()
+        return client
+
+    def unsubscribe(self, client):
+        with self._lock:
+            self._clients.discard(client)
+            self._new_clients.discard(client)
+
+    def _read(self):
+        with app.app_context():
+            try:
+                jobs = {job.job_id: job_snapshot(job) for job in Job.query.filter(Job.active).all()}
+                notes = {note.id: note.get_d() for note in Notifications.query.filter_by(seen=False).all()}
+            finally:
+                # Read only, don't keep the progress fields set on the jobs
+                db.session.remove()
+        return jobs, notes
+
+    def _changes(self, jobs, notes):
+        events = []
+        for job_id, snapshot in jobs.items():
+            old = self._jobs.get(job_id)
+            if old is None:
+                events.append(("job", snapshot))
+                continue
+            changed = {key: value for key, value in snapshot.items() if old.get(key) != value}
+            if changed:
+                changed["job_id"] = snapshot["job_id"]
+                events.append(("update", changed))
+        events += [("remove", {"job_id": str(job_id)}) for job_id in self._jobs.keys() - jobs.keys()]
+        events += [("notification", note) for note_id, note in notes.items() if note_id not in self._notes]
+        return events
+
+    def _send(self, client, events):
+        try:
+            for event in events:
+                client.put_nowait(event)
+        except queue.Full:
+            # Too slow, drop what is queued and start over with a snapshot
+            with self._lock:
+                if client in self._clients:
+                    self._clients.discard(client)
+                    self._new_clients.add(client)
+            while True:
+                try:
+                    client.get_nowait()
+                except queue.Empty:
+                    break
+
+    def tick(self):
+        """Read the jobs and send the changes since the last tick to all clients"""
+        jobs, notes = self._read()
+        events = self._changes(jobs, notes)
+        self._jobs, self._notes = jobs, notes
+        with self._lock:
+            new_clients, self._new_clients = self._new_clients, set()
+            self._clients |= new_clients
+            clients = self._clients - new_clients
+        snapshot = [("snapshot", {"jobs": list(jobs.values()), "notes": list(notes.values())})]
+        for client in new_clients:
+            self._send(client, snapshot)
+        if events:
+            for client in clients:
+                self._send(client, events)
+
+    def _loop(self):
+        while True:
+            with self._lock:
+                idle = not self._clients and not self._new_clients
+            if idle:
+                # Nobody listens, the next client gets a fresh snapshot anyway
+                self._jobs, self._notes = {}, {}
+            else:
+                try:
+                    self.tick()
+                except Exception as error:
+                    app.logger.error(f"Reading job events failed: {error}")
+            time.sleep(EVENT_INTERVAL)
+
+
+_broadcaster = _Broadcaster()
+
+
+def subscribe():
+    """
+    Register a new event stream client\n
+    :return: client handle for stream()
+    :raises TooManyClients:
+    """
+    return _broadcaster.subscribe()
+
+
+def stream(client):
+    """
+    Generator of the Server-Sent Events of a client, unsubscribes it when the connection closes\n
+    :param client: handle from subscribe()
+    :return: generator of str
+    """
+    try:
+        yield f"retry: {RECONNECT_DELAY * 1000:d}\n\n"
+        while True:
+            try:
+                event, data = client.get(timeout=HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield ": heartbeat\n\n"
+                continue
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        _broadcaster.unsubscribe(client)
@@ -0,0 +1,98 @@
+"""
+Keyset pagination of the job history for /database, /history and the jobpage json api
+
+Pages are read from the job_id primary key, before or after the last job
+shown, so a page costs the same however far back it is. Only the columns a
+list view renders are loaded. The total shown with the list is counted at
+most every COUNT_CACHE_SECONDS, or sooner when a new job was added.
+"""
+import threading
+import time
+
+from sqlalchemy.orm import joinedload, load_only
+
+from arm.ui import db
+from arm.models.config import Config
+from arm.models.job import Job
+
+# Seconds a count of all jobs is reused while no new job was added
+COUNT_CACHE_SECONDS = 60
+
+# Fields the list views render
+DATABASE_FIELDS = ("job_id", "title", "title_manual", "year", "year_auto", "video_type", "devpath", "status",
+                   "poster_url", "start_time", "job_length", "logfile")
+HISTORY_FIELDS = ("job_id", "title", "start_time", "job_length", "status", "logfile")
+CONFIG_FIELDS = ("RIPMETHOD", "MAINFEATURE", "MINLENGTH", "MAXLENGTH")
+
+_count_lock = threading.Lock()
+_count_cache = {"max_id": None, "count": 0, "time": None}
+
+
+class JobPage:
+    """
+    One page of jobs, newest first\n
+    newer and older are the job_id to pass as after/before for the neighbouring pages, None at either end
+    """
+
+    def __init__(self, items, total, newer, older):
+        self.items = items
+        self.total = total
+        self.newer = newer
+        self.older = older
+
+
+def total_jobs():
+    """
+    Number of jobs in the database, cached\n
+    :return int:
+    """
+    max_id = db.session.query(db.func.max(Job.job_id)).scalar()
+    now = time.monotonic()
+    with _count_lock:
+        cached = _count_cache["time"] is not None and now - _count_cache["time"] < COUNT_CACHE_SECONDS
+        if cached and _count_cache["max_id"] == max_id:
+            return _count_cache["count"]
+    count = db.session.query(db.func.count(Job.job_id)).scalar()
+    with _count_lock:
+        _count_cache.update(max_id=max_id, count=count, time=now)
+    return count
+
+
+def reset_total():
+    """Count the jobs again on the next page load, e.g. after a job was deleted"""
+    with _count_lock:
+        _count_cache["time"] = None
+
+
+def _exists(condition):
+    return db.session.query(Job.job_id).filter(condition).limit(1).first() is not None
+
+
+def get_page(fields, limit, before=None, after=None, with_config=False):
+    """
+    Read one page of jobs by job_id\n
+    :param fields: Job columns to load, the others aren't read
+    :param int limit: jobs per page
+    :param int before: return the jobs older than this job_id
+    :param int after: return the jobs newer than this job_id, used when paging back
+    :param bool with_config: also load the rip settings shown on the /database cards
+    :return JobPage:
+    """
+    options = [load_only(*(getattr(Job, field) for field in fields))]
+    if with_config:
+        options.append(joinedload(Job.config).load_only(*(getattr(Config, field) for field in CONFIG_FIELDS)))
+    query = Job.query.options(*options)
+    if after is not None:
+        jobs = query.filter(Job.job_id > after).order_by(Job.job_id.asc()).limit(limit).all()[::-1]
+    else:
+        if before is not None:
+            query = query.filter(Job.job_id < before)
+        jobs = query.order_by(Job.job_id.desc()).limit(limit).all()
+
+    newer = older = None
+    if jobs:
+        if _exists(Job.job_id > jobs[0].job_id):
+            newer = jobs[0].job_id
+        if _exists(Job.job_id < jobs[-1].job_id):
+            older = jobs[-1].job_id
+    return JobPage(jobs, total_jobs(), newer, older)
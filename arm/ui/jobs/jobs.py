@@ -11,6 +11,7 @@ Covers
 - changeparams [GET]
 - list_titles [GET]
 - json [JSON GET]
+- events [Server-Sent Events GET]
 """
 
 import json
@@ -19,9 +20,10 @@ from flask import render_template, request, Blueprint, flash, redirect, url_for
 from werkzeug.routing import ValidationError
 
 import arm.ui.utils as ui_utils
-from arm.ui import app, db, constants, json_api
+from arm.ui import app, db, constants, json_api, job_events
 from arm.models.job import Job, JobState
 from arm.models.notifications import Notifications
+from arm.ripper import job_signal, known_discs
 import arm.config.config as cfg
 from arm.ui.forms import TitleSearchForm, ChangeParamsForm, TrackFormDynamic
 
@@ -111,6 +113,7 @@ def jobdetail_load():
         # Set job to ready
         job.manual_start = True
         db.session.commit()
+        job_signal.post(job.job_id)
         app.logger.debug(f"Setting [{job.job_id}] to [{job.manual_start}], lets get ripping")
         flash("Tracks was updated", "success")
 
@@ -154,6 +157,7 @@ def customtitle():
                                      f'{request.args.get("title")} ({request.args.get("year")})')
         db.session.add(notification)
         ui_utils.database_updater(args, job)
+        job_signal.post(job.job_id)
         flash(f'Custom title changed. Title={job.title}, Year={job.year}.', "success")
         return redirect(url_for('home'))
     return render_template('customTitle.html', title='Change Title', form=form, job=job)
@@ -229,6 +233,9 @@ def updatetitle():
                                  f'{request.args.get("title")} ({request.args.get("year")})')
     db.session.add(notification)
     db.session.commit()
+    # A corrected title of a finished DVD is what the disc should be known as
+    known_discs.remember(job)
+    job_signal.post(job.job_id)
     flash(f'Title: {old_title} ({old_year}) was updated to '
           f'{request.args.get("title")} ({request.args.get("year")})', "success")
     return redirect("/")
@@ -308,6 +315,8 @@ def feed_json():
         valid_data = {
             'j_id': request.args.get('job'),
             'searchq': request.args.get('q'),
+            'page': request.args.get('page', 1),
+            'before': request.args.get('before'),
             'logpath': cfg.arm_config['LOGPATH'],
             'fail': 'fail',
             'success': 'success',
@@ -323,7 +332,7 @@ def feed_json():
             'delete': {'funct': json_api.delete_job, 'args': ('j_id', 'mode')},
             'abandon': {'funct': json_api.abandon_job, 'args': ('j_id',)},
             'full': {'funct': json_api.generate_log, 'args': ('logpath', 'j_id')},
-            'search': {'funct': json_api.search, 'args': ('searchq',)},
+            'search': {'funct': json_api.search, 'args': ('searchq', 'page')},
             'getfailed': {
                 'funct': json_api.get_x_jobs,
                 'args': (JobState.FAILURE.value,),
@@ -337,7 +346,12 @@ def feed_json():
             'send_item': {'funct': ui_utils.send_to_remote_db, 'args': ('j_id',)},
             'change_job_params': {'funct': json_api.change_job_params, 'args': ('config_id',)},
             'read_notification': {'funct': json_api.read_notification, 'args': ('notify_id',)},
-            'notify_timeout': {'funct': json_api.get_notify_timeout, 'args': ('notify_timeout',)}
+            'notify_timeout': {'funct': json_api.get_notify_timeout, 'args': ('notify_timeout',)},
+            'slot_status': {'funct': json_api.get_slot_status, 'args': ()},
+            'db_stats': {'funct': json_api.get_db_stats, 'args': ()},
+            'metadata_cache': {'funct': json_api.get_metadata_cache_stats, 'args': ()},
+            'http_stats': {'funct': json_api.get_http_stats, 'args': ()},
+            'jobpage': {'funct': json_api.get_job_page, 'args': ('before',)},
         }
     else:
         valid_data = {
@@ -356,3 +370,21 @@ def feed_json():
     return app.response_class(response=json.dumps(return_json, indent=4, sort_keys=True),
                               status=200,
                               mimetype=constants.JSON_TYPE)
+
+
+@route_jobs.route('/events', methods=['GET'])
+def events():
+    """
+    Server-Sent Events stream of the active jobs, see arm.ui.job_events
+    Pushes changes of the job list as they happen instead of the page polling json?mode=joblist,
+    which stays available as the fallback. Like joblist this doesn't need a login.
+    """
+    try:
+        client = job_events.subscribe()
+    except job_events.TooManyClients:
+        app.logger.debug("Too many event stream clients, the page falls back to polling")
+        return app.response_class(status=503)
+    return app.response_class(response=job_events.stream(client),
+                              status=200,
+                              mimetype="text/event-stream",
+                              headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -6,22 +6,43 @@ import os
 import subprocess
 import re
 import html
-from collections import deque
 from pathlib import Path
 import datetime
 import psutil
 from flask import request
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload, load_only
 
 import arm.config.config as cfg
 from arm.models.config import Config
 from arm.models.job import Job, JobState, JOB_STATUS_FINISHED
 from arm.models.notifications import Notifications
 from arm.models.track import Track
+from arm.models.transcode_queue import TranscodeQueue
 from arm.models.ui_settings import UISettings
-from arm.ui import app, db
+from arm.ui import app, db, db_writer, http_client, job_pages, metadata_cache, poster_cache
 from arm.ui.forms import ChangeParamsForm
 from arm.ui.utils import job_id_validator, database_updater, authenticated_state
 from arm.ui.settings import DriveUtils as drive_utils # noqa E402
+from arm.ripper import slot_scheduler, job_signal, progress
+
+# Job states the rippers and transcode workers publish progress for
+PROGRESS_STATES = {
+    JobState.VIDEO_RIPPING.value,
+    JobState.AUDIO_RIPPING.value,
+    JobState.TRANSCODE_ACTIVE.value,
+}
+# Results per page of a search
+SEARCH_PAGE_SIZE = 50
+# Words of a search query used, the rest is ignored
+SEARCH_MAX_TERMS = 8
+# bm25 weights of the job_search columns: title, label, imdb_id, year, crc_id, path
+SEARCH_WEIGHTS = (10.0, 5.0, 8.0, 2.0, 8.0, 1.0)
+# Fields the search result cards show
+SEARCH_JOB_FIELDS = ("job_id", "title", "title_manual", "year", "video_type", "devpath", "status", "stage",
+                     "poster_url", "disctype", "start_time", "job_length", "logfile")
+SEARCH_CONFIG_FIELDS = ("RIPMETHOD", "MAINFEATURE", "MINLENGTH", "MAXLENGTH")
 
 
 def get_notifications():
@@ -41,7 +62,7 @@ def get_x_jobs(job_status):
     """
     success = False
     if job_status == "joblist":
-        jobs = db.session.query(Job).filter(~Job.finished).all()
+        jobs = db.session.query(Job).filter(Job.active).all()
     elif JobState(job_status) in JOB_STATUS_FINISHED:
         jobs = Job.query.filter_by(status=job_status)
     else:
@@ -51,8 +72,7 @@ def get_x_jobs(job_status):
     i = 0
     for j in jobs:
         job_results[i] = {}
-        job_log = os.path.join(cfg.arm_config['LOGPATH'], str(j.logfile))
-        process_logfile(job_log, j, job_results[i])
+        process_progress(j, job_results[i])
         try:
             job_results[i]['config'] = j.config.get_d()
         except AttributeError:
@@ -62,6 +82,7 @@ def get_x_jobs(job_status):
         for key, value in j.get_d().items():
             if key != "config":
                 job_results[i][str(key)] = str(value)
+        job_results[i]['poster_thumb'] = poster_cache.url(j.poster_url)
         i += 1
     if jobs:
         app.logger.debug("jobs  - we have " + str(len(job_results)) + " jobs")
@@ -77,211 +98,117 @@ def get_x_jobs(job_status):
             "authenticated": authenticated}
 
 
-def process_logfile(logfile, job, job_results):
+def process_progress(job, job_results):
     """
-        Decide if we need to process HandBrake or MakeMKV
-        :param logfile: the logfile for parsing
+        Fill in the stage, progress and ETA of an active job from the records
+        its ripper or transcode workers published, see arm.ripper.progress.read
+        for how titles encoded side by side are combined
         :param job: the Job class
         :param job_results: the {} of
         :return: should be dict for the json api
     """
-    app.logger.debug(f"Disc Type: {job.disctype}, Status: {job.status}")
-    if job.disctype in {"dvd", "bluray"}:
-        if job.status == JobState.VIDEO_RIPPING.value:
-            app.logger.debug("using mkv - " + logfile)
-            return process_makemkv_logfile(job, job_results)
-        if job.status == JobState.TRANSCODE_ACTIVE.value:
-            app.logger.debug("using handbrake")
-            return process_handbrake_logfile(logfile, job, job_results)
-    if job.disctype == "music" and job.status == JobState.AUDIO_RIPPING.value:
-        app.logger.debug("using audio disc")
-        return process_audio_logfile(job.logfile, job, job_results)
+    if job.status not in PROGRESS_STATES:
+        return job_results
+    record = progress.read(job.job_id)
+    if record is None or record.get("status") != job.status:
+        app.logger.debug(f"Job [{job.job_id}] has no progress yet - setting progress to 0%")
+        job.stage = job_results['stage'] = "Unknown"
+        job.progress = job.progress_round = job_results['progress'] = job_results['progress_round'] = 0
+        job.eta = job_results['eta'] = "Unknown"
+        return job_results
+
+    stage = record['stage']
+    if record['title']:
+        stage = f"{stage} - {record['title']}"
+    job.stage = job_results['stage'] = stage
+    job.progress = job_results['progress'] = f"{record['progress']:.2f}"
+    job.progress_round = job_results['progress_round'] = int(record['progress'])
+    job.eta = job_results['eta'] = record['eta'] or "Unknown"
+    if record['rate'] is not None:
+        job_results['rate'] = f"{record['rate']:.1f} {record['rate_unit']}"
     return job_results
 
 
-def percentage(part, whole):
-    """percent calculator"""
-    percent = 100 * float(part) / float(whole)
-    return percent
-
-
-def process_makemkv_logfile(job, job_results):
+def get_job_page(before):
     """
-    Process the logfile and find current status and job progress percent\n
-    :return: job_results dict
+    Next page of the job history, for infinite scrolling\n
+    :param before: job_id of the last job shown, None for the newest jobs
+    :return: json/dict with the jobs and the job_id to pass as before for the page after
     """
-    job_progress_status = None
-    job_stage_index = None
-    lines = read_log_line(os.path.join(cfg.arm_config['LOGPATH'], job.logfile))
-    # Correctly get last entry for progress bar
-    for line in lines:
-        job_progress_status = re.search(r"PRGV:(\d{3,}),(\d+),(\d{3,})", str(line))
-        job_stage_index = re.search(r"PRGC:\d+,(\d+),\"([\w -]{2,})\"", str(line))
-
-    if job_progress_status is not None:
-        app.logger.debug(f"job_progress_status: {job_progress_status}")
-        job.progress = job_results['progress'] = \
-            f"{percentage(job_progress_status.group(1), job_progress_status.group(3)):.2f}"
-        job.progress_round = percentage(job_progress_status.group(1),
-                                        job_progress_status.group(3))
-    else:
-        app.logger.debug(f"Job [{job.job_id}] MakeMKV status not defined - setting progress to 0%")
-        job.progress = job.progress_round = job_results['progress'] = 0
-
-    if job_stage_index is not None:
-        try:
-            current_index = f"{(int(job_stage_index.group(1)) + 1)}/{job.no_of_titles} - {job_stage_index.group(2)}"
-            job.stage = job_results['stage'] = current_index
-            db.session.commit()
-        except Exception as error:
-            job.stage = f"Unknown -  {error}"
-
-    job.eta = "Unknown"
-
-    return job_results
-
-
-def process_handbrake_logfile(logfile, job, job_results):
+    try:
+        before = int(before) if before is not None else None
+    except ValueError:
+        return {'success': False, 'mode': 'jobpage', 'Error': 'Not a valid job'}
+    limit = int(UISettings.query.first().database_limit)
+    page = job_pages.get_page(job_pages.HISTORY_FIELDS, limit, before=before)
+    results = []
+    for job in page.items:
+        job_dict = {key: str(value) for key, value in job.get_d().items()}
+        job_dict['start_date'] = job.start_time.strftime(cfg.arm_config['DATE_FORMAT']) if job.start_time else ""
+        results.append(job_dict)
+    return {'success': True, 'mode': 'jobpage', 'results': results, 'older': page.older, 'total': page.total}
+
+
+def _search_terms(search_query):
     """
-    process a logfile looking for HandBrake or FFMPEG progress
-    :param logfile: the logfile for parsing
-    :param job: the Job class
-    :param job_results: the {} of
-    :return: should be dict for the json api
+    FTS5 query matching every word of the search as a prefix, e.g. 'star wa' -> '"star"* "wa"*'\n
+    :param str search_query: what the user typed
+    :return str: MATCH expression, empty if the query has no words
     """
-    job_status = None
-    job_status_index = None
-    ffmpeg_job_status = None
-    lines = read_log_line(logfile)
-    for line in lines:
-        # This correctly get the very last ETA and % for HandBrake
-        hb_search = re.search(r"Encoding: task (\d of \d), (\d{1,3}\.\d{2}) %.{0,40}"
-                              r"ETA ([\dhms]*?)\)(?!\\rEncod)", str(line))
-        if hb_search:
-            job_status = hb_search
-
-        hb_index_search = re.search(r"Processing track #(\d{1,2}) of (\d{1,2})"
-                                    r"(?!.*Processing track #)", str(line))
-        if hb_index_search:
-            job_status_index = hb_index_search
-
-        # Check for FFMPEG status
-        ffmpeg_search = re.search(r"ARM: .* - (\d{1,3}\.\d{2})%", str(line))
-        if ffmpeg_search:
-            ffmpeg_job_status = ffmpeg_search
-
-    # Check ARM can read the Handbrake library and get a status
-    if job_status is not None:
-        app.logger.debug(job_status.group())
-        job.stage = job_status.group(1)
-        job.progress = job_status.group(2)
-        job.eta = job_status.group(3)
-        job.progress_round = int(float(job.progress))
-    elif ffmpeg_job_status is not None:
-        job.stage = "Transcoding"
-        job.progress = ffmpeg_job_status.group(1)
-        job.eta = "Unknown"
-        job.progress_round = int(float(job.progress))
-    else:
-        app.logger.debug(f"Job [{job.job_id}] handbrake/ffmpeg status not defined - setting progress to 0%")
-        job.stage = "Unknown"
-        job.progress = job.progress_round = 0
-        job.eta = "Unknown"
-
-    job_results['stage'] = job.stage
-    job_results['progress'] = job.progress
-    job_results['eta'] = job.eta
-    job_results['progress_round'] = int(float(job_results['progress']))
+    words = re.findall(r'\w+', search_query or "")[:SEARCH_MAX_TERMS]
+    return " ".join(f'"{word}"*' for word in words)
 
-    if job_status_index:
-        try:
-            current_index = int(job_status_index.group(1))
-            job.stage = job_results['stage'] = f"{job.stage} - {current_index}/{job.no_of_titles}"
-        except Exception as error:
-            app.logger.debug(f"Problem finding the current track {error}")
-            job.stage = f"{job.stage} - %0%/%0%"
-    else:
-        app.logger.debug("Cant find index")
 
-    return job_results
+def _search_ids(terms, page):
+    """Job ids of one page of the index matches, best match first"""
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    rows = db.session.execute(
+        text(f"SELECT rowid FROM job_search WHERE job_search MATCH :terms "
+             f"ORDER BY bm25(job_search, {weights}) LIMIT :limit OFFSET :offset"),
+        {'terms': terms, 'limit': SEARCH_PAGE_SIZE + 1, 'offset': (page - 1) * SEARCH_PAGE_SIZE})
+    return [row[0] for row in rows]
 
 
-def process_audio_logfile(logfile, job, job_results):
-    """
-    Process audio disc logs to show current ripping tracks
-    :param logfile: will come in as only the bare logfile, no path
-    :param job: current job, so we can update the stage
-    :param job_results:
-    :return:
-    """
-    # \((track[^[]+)(?!track)
-    line = read_all_log_lines(os.path.join(cfg.arm_config["LOGPATH"], logfile))
-    for one_line in line:
-        job_stage_index = re.search(r"\(track([^[]+)", str(one_line))
-        if job_stage_index:
-            try:
-                current_index = f"Track: {job_stage_index.group(1)}/{job.no_of_titles}"
-                job.stage = job_results['stage'] = current_index
-                job.eta = calc_process_time(job.start_time, job_stage_index.group(1), job.no_of_titles)
-                job.progress = round(percentage(job_stage_index.group(1), job.no_of_titles + 1))
-                job.progress_round = round(job.progress)
-            except Exception as error:
-                app.logger.debug("Error processing abcde logfile. Error dump"
-                                 f"-  {error}", exc_info=True)
-                job.stage = "Unknown"
-                job.eta = "Unknown"
-                job.progress = job.progress_round = 0
-    return job_results
+def _search_ids_like(search_query, page):
+    """Fallback for databases without the search index, newest job first"""
+    safe_search = f"%{re.sub(r'[^a-zA-Z0-9]', '', search_query or '')}%"
+    rows = db.session.query(Job.job_id).filter(Job.title.like(safe_search)) \
+        .order_by(Job.job_id.desc()).limit(SEARCH_PAGE_SIZE + 1).offset((page - 1) * SEARCH_PAGE_SIZE)
+    return [row[0] for row in rows]
 
 
-def calc_process_time(starttime, cur_iter, max_iter):
-    """Modified from stackoverflow
-    Get a rough estimate of ETA, return formatted String"""
-    try:
-        time_elapsed = datetime.datetime.now() - starttime
-        time_estimated = (time_elapsed.seconds / int(cur_iter)) * int(max_iter)
-        finish_time = (starttime + datetime.timedelta(seconds=int(time_estimated)))
-        test = finish_time - datetime.datetime.now()
-    except TypeError:
-        app.logger.error("Failed to calculate processing time - Resetting to now, time wont be accurate!")
-        test = time_estimated = time_elapsed = finish_time = datetime.datetime.now()
-    return f"{str(test).split('.', maxsplit=1)[0]} - @{finish_time.strftime('%H:%M:%S')}"
-
-
-def read_log_line(log_file: os.PathLike):
+def search(search_query, page=1):
     """
-    :param log_file: path to log file
-    :return: the last 20 lines of the file at ``log_file``
+    Queries ARMui db for the movie/show matching the query\n
+    Uses the job_search full-text index over title, label, imdb id, year, crc id and path.
+    Only the fields shown on the result cards are loaded.
+    :param str search_query: words to search for, each matches as a prefix
+    :param page: page of SEARCH_PAGE_SIZE results, starts at 1
+    :return: json/dict with the results of the page and whether there are more
     """
     try:
-        with open(log_file, encoding="utf8", errors="ignore") as read_log_file:
-            lines = deque(read_log_file, maxlen=20)
-    except OSError:
-        app.logger.debug(f"Error while reading {log_file}, unable to calculate ETA")
-        lines = ["", ""]
-    return lines
-
-
-def read_all_log_lines(log_file):
-    """Try to catch if the logfile gets delete before the job is finished"""
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    terms = _search_terms(search_query)
+    if not terms:
+        return {'success': True, 'mode': 'search', 'results': {}, 'page': page, 'more': False}
     try:
-        with open(log_file, encoding="utf8", errors='ignore') as read_log_file:
-            line = read_log_file.readlines()
-    except FileNotFoundError:
-        line = ""
-    return line
-
-
-def search(search_query):
-    """ Queries ARMui db for the movie/show matching the query"""
-    safe_search = re.sub(r'[^a-zA-Z\d]', '', search_query)
-    safe_search = f"%{safe_search}%"
-    app.logger.debug('-' * 30)
-
-    posts = db.session.query(Job).filter(Job.title.like(safe_search)).all()
+        job_ids = _search_ids(terms, page)
+    except OperationalError as error:
+        app.logger.warning(f"Search index not available, searching titles only: {error}")
+        db.session.rollback()
+        job_ids = _search_ids_like(search_query, page)
+    more = len(job_ids) > SEARCH_PAGE_SIZE
+    job_ids = job_ids[:SEARCH_PAGE_SIZE]
+
+    jobs = db.session.query(Job).filter(Job.job_id.in_(job_ids)) \
+        .options(load_only(*(getattr(Job, field) for field in SEARCH_JOB_FIELDS)),
+                 joinedload(Job.config).load_only(*(getattr(Config, field) for field in SEARCH_CONFIG_FIELDS))) \
+        .all()
+    jobs_by_id = {job.job_id: job for job in jobs}
     search_results = {}
-    i = 0
-    for job in posts:
+    for i, job in enumerate(jobs_by_id[job_id] for job_id in job_ids if job_id in jobs_by_id):
         search_results[i] = {}
         try:
             search_results[i]['config'] = job.config.get_d()
@@ -292,8 +219,8 @@ def search(search_query):
         for key, value in iter(job.get_d().items()):
             if key != "config":
                 search_results[i][str(key)] = str(value)
-        i += 1
-    return {'success': True, 'mode': 'search', 'results': search_results}
+        search_results[i]['poster_thumb'] = poster_cache.url(job.poster_url)
+    return {'success': True, 'mode': 'search', 'results': search_results, 'page': page, 'more': more}
 
 
 def delete_job(job_id, mode):
@@ -351,10 +278,13 @@ def delete_job(job_id, mode):
                     Track.query.filter_by(job_id=job_id).delete()
                     Job.query.filter_by(job_id=job_id).delete()
                     Config.query.filter_by(job_id=job_id).delete()
+                    # Queue items of a deleted job would be picked up by a transcode worker without a job
+                    TranscodeQueue.query.filter_by(job_id=job_id).delete()
                     notification = Notifications(f"Job: {job_id} was Deleted!",
                                                  f'Job with id: {job_id} was successfully deleted from the database')
                     db.session.add(notification)
                     db.session.commit()
+                    job_pages.reset_total()
                     app.logger.debug(f"Admin deleting  job {job_id} was successful")
                     json_return = {'success': True, 'job': job_id, 'mode': mode}
     # If we run into problems with the database changes
@@ -497,6 +427,7 @@ def change_job_params(config_id):
         notification = Notifications(f"Job: {job.job_id} Config updated!", message)
         db.session.add(notification)
         database_updater(args, job)
+        job_signal.post(job.job_id)
 
         return {'message': message, 'form': 'change_job_params', "success": True}
     return {'return': '', 'success': False}
@@ -531,6 +462,36 @@ def get_notify_timeout(notify_timeout):
     return return_json
 
 
+def get_slot_status():
+    """Return queue depth, used slots and last wait time of the ripper slot schedulers"""
+    return {'success': True,
+            'mode': 'slot_status',
+            'slots': [slot_scheduler.transcode_scheduler().status(),
+                      slot_scheduler.encoder_scheduler().status(),
+                      slot_scheduler.makemkv_info_scheduler().status()]}
+
+
+def get_db_stats():
+    """Return the write counters of the UI database layer"""
+    return {'success': True,
+            'mode': 'db_stats',
+            'stats': db_writer.stats()}
+
+
+def get_metadata_cache_stats():
+    """Return the hit rate and size of the OMDb/TMDb response cache"""
+    return {'success': True,
+            'mode': 'metadata_cache',
+            'stats': metadata_cache.stats()}
+
+
+def get_http_stats():
+    """Return the outbound request counters of the UI per host"""
+    return {'success': True,
+            'mode': 'http_stats',
+            'stats': http_client.stats()}
+
+
 def restart_ui():
     app.logger.debug("Arm ui shutdown....")
     shutdown_code = subprocess.check_output(
@@ -0,0 +1,220 @@
+"""
+Background import of the movies in COMPLETED_PATH that ARM doesn't know yet
+
+/import_movies starts one import per UI process and answers straight away, the
+progress and the result are read from status().
+- folders named "Movie (year)" are imported, directly in COMPLETED_PATH or one
+  level down ("Lord of the Rings/The Two Towers (2002)"), other folders are
+  reported as not found
+- folders already imported are found with one query instead of one per folder
+- posters are looked up by IMPORT_WORKERS threads, each title and year only once,
+  through the metadata cache so a second import doesn't ask OMDb again
+- jobs are created without probing a drive and committed WRITE_BATCH at a time
+"""
+import datetime
+import hashlib
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import arm.config.config as cfg
+import arm.ui.utils as ui_utils
+from arm.models.job import Job, JobState
+from arm.ui import app, db, db_writer
+from arm.ui.metadata import get_omdb_poster
+
+# Threads asking for posters at once
+IMPORT_WORKERS = 4
+# Jobs added per commit
+WRITE_BATCH = 50
+# Folders named like ARM names its output, 'Movie (0000)'
+MOVIE_FOLDER = re.compile(r"([\w\ \'\.\-\&\,]*?) \((\d{2,4})\)")
+VIDEO_EXTENSIONS = (".mkv", ".avi", ".mp4")
+
+
+def find_movies(my_path):
+    """
+    Movie folders below my_path\n
+    :param my_path: COMPLETED_PATH
+    :return tuple: list of (title, year, name, path) and list of the folder names that didn't match
+    """
+    movies = []
+    notfound = []
+    for movie in ui_utils.generate_file_list(my_path):
+        matched = MOVIE_FOLDER.match(movie)
+        if matched:
+            movies.append((matched.group(1), matched.group(2), matched.group(0), os.path.join(my_path, movie)))
+            continue
+        # If we didn't get a match assume that the directory is a main directory for other folders
+        # This means we can check for "series" type movie folders e.g
+        # - Lord of the rings
+        #     - The Lord of the Rings The Fellowship of the Ring (2001)
+        #     - The Lord of the Rings The Two Towers (2002)
+        sub_path = os.path.join(my_path, movie)
+        for sub_movie in ui_utils.generate_file_list(sub_path):
+            sub_matched = MOVIE_FOLDER.match(sub_movie)
+            if sub_matched:
+                movies.append((sub_matched.group(1), sub_matched.group(2), sub_matched.group(0),
+                               os.path.join(sub_path, sub_movie)))
+            else:
+                notfound.append(sub_movie)
+    return movies, notfound
+
+
+def crc_id(name):
+    """Fake crc64 of an imported folder, an md5 of its name"""
+    return hashlib.md5(f"{name}".strip().encode()).hexdigest()
+
+
+def imported_crc_ids(crc_ids):
+    """The crc ids of crc_ids that already have a successful job"""
+    known = set()
+    crc_ids = list(crc_ids)
+    # Stay below the SQLite limit of variables per query
+    for start in range(0, len(crc_ids), 500):
+        known.update(crc for (crc,) in db.session.query(Job.crc_id).filter(
+            Job.crc_id.in_(crc_ids[start:start + 500]), Job.status == JobState.SUCCESS.value,
+            Job.hasnicetitle.is_(True)))
+    return known
+
+
+def movie_job(title, year, movie_crc, path, poster_image, imdb_id):
+    """
+    Job of an imported movie folder, not added to the session\n
+    :return tuple: the Job and the dict shown to the user
+    """
+    movie_files = [f for f in os.listdir(path)
+                   if os.path.isfile(os.path.join(path, f)) and f.endswith(VIDEO_EXTENSIONS)]
+    movie_dict = {
+        'title': title,
+        'year': year,
+        'crc_id': movie_crc,
+        'imdb_id': imdb_id,
+        'poster': poster_image,
+        'status': JobState.SUCCESS.value if len(movie_files) >= 1 else JobState.FAILURE.value,
+        'video_type': 'movie',
+        'disctype': 'unknown',
+        'hasnicetitle': True,
+        'no_of_titles': len(movie_files)
+    }
+    new_movie = Job("/dev/sr0", probe=False)
+    new_movie.title = title
+    new_movie.year = year
+    new_movie.crc_id = movie_crc
+    new_movie.imdb_id = imdb_id
+    new_movie.status = movie_dict['status']
+    new_movie.video_type = movie_dict['video_type']
+    new_movie.disctype = movie_dict['disctype']
+    new_movie.hasnicetitle = movie_dict['hasnicetitle']
+    new_movie.no_of_titles = movie_dict['no_of_titles']
+    new_movie.poster_url = poster_image
+    new_movie.start_time = datetime.datetime.now()
+    new_movie.logfile = "imported.log"
+    new_movie.ejected = True
+    new_movie.path = path
+    return new_movie, movie_dict
+
+
+def _poster(title, year):
+    try:
+        return get_omdb_poster(title, year)
+    except Exception as error:
+        app.logger.debug(f"No poster for {title} ({year}): {error}")
+        return None, None
+
+
+class _Import:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {"state": "idle"}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._status = {"state": "scanning", "started": datetime.datetime.now().isoformat(timespec="seconds"),
+                            "finished": None, "total": 0, "done": 0, "skipped": 0,
+                            "added": {}, "notfound": [], "error": None}
+            self._thread = threading.Thread(target=self._run, name="library-import", daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self):
+        with self._lock:
+            status = dict(self._status)
+            for key in ("added", "notfound"):
+                if key in status:
+                    status[key] = status[key].copy()
+            return status
+
+    def _update(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def _run(self):
+        with app.app_context():
+            try:
+                self.run(cfg.arm_config['COMPLETED_PATH'])
+                self._update(state="finished")
+            except Exception as error:
+                app.logger.error(f"Importing movies failed: {error}")
+                db.session.rollback()
+                self._update(state="failed", error=str(error))
+            finally:
+                self._update(finished=datetime.datetime.now().isoformat(timespec="seconds"))
+                db.session.remove()
+
+    def run(self, my_path):
+        """Import the movies of my_path, progress is kept in the status"""
+        movies, notfound = find_movies(my_path)
+        known = imported_crc_ids(crc_id(name) for _title, _year, name, _path in movies)
+        new_movies = {}
+        for title, year, name, path in movies:
+            # Two folders with the same name share the fake crc, only the first is imported
+            new_movies.setdefault(crc_id(name), (title, year, path))
+        for known_crc in known:
+            new_movies.pop(known_crc, None)
+        self._update(state="importing", notfound=notfound, total=len(new_movies),
+                     skipped=len(movies) - len(new_movies))
+        app.logger.info(f"Importing {len(new_movies)} movies from {my_path}, {len(known)} already imported")
+
+        with ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-poster") as executor:
+            posters = {}
+            for title, year, _path in new_movies.values():
+                if (title, year) not in posters:
+                    posters[(title, year)] = executor.submit(_poster, title, year)
+            batch = 0
+            for movie_crc, (title, year, path) in new_movies.items():
+                poster_image, imdb_id = posters[(title, year)].result()
+                new_movie, movie_dict = movie_job(title, year, movie_crc, path, poster_image, imdb_id)
+                db.session.add(new_movie)
+                batch += 1
+                with self._lock:
+                    self._status["added"][movie_dict['crc_id']] = movie_dict
+                    self._status["done"] += 1
+                if batch >= WRITE_BATCH:
+                    db_writer.commit()
+                    batch = 0
+            db_writer.commit()
+
+
+_import = _Import()
+
+
+def start():
+    """
+    Start importing the movies of COMPLETED_PATH in the background\n
+    :return bool: False if an import is already running
+    """
+    return _import.start()
+
+
+def status():
+    """
+    Progress and result of the last import\n
+    :return dict: state (idle, scanning, importing, finished or failed), total, done, skipped,
+                  added movies by crc_id, notfound folder names, started, finished and error
+    """
+    return _import.status()
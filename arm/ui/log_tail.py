@@ -0,0 +1,223 @@
+"""
+Shared tail engine for the log readers
+
+Every streamed log is read from a byte offset and only the bytes written
+since are read again. One watcher thread per UI process waits for changes of
+all followed logs with inotify, or checks their size every POLL_INTERVAL
+where inotify isn't available, and wakes the readers of a log when it grows.
+Readers are generators, the next chunk is only read once the web server took
+the previous one, so a slow client never makes the UI buffer a log in memory.
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import threading
+
+from arm.ui import app
+
+# Bytes read from a log per chunk
+CHUNK_SIZE = 64 * 1024
+# Seconds between size checks without inotify, and the longest a reader waits before it looks itself
+POLL_INTERVAL = 1.0
+# Bytes shown when a log is opened in tail mode
+TAIL_BYTES = 64 * 1024
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_WATCH_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_DELETE_SELF | _IN_MOVE_SELF
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal inotify binding, raises OSError where it isn't available"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+    def add(self, path):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        return wd
+
+    def remove(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """:return set: watch descriptors with events"""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        wds = set()
+        offset = 0
+        while offset < len(data):
+            wd, _mask, _cookie, length = _EVENT.unpack_from(data, offset)
+            wds.add(wd)
+            offset += _EVENT.size + length
+        return wds
+
+
+class _Watched:
+    """A followed log, readers wait on it for new data"""
+
+    def __init__(self, path):
+        self.path = path
+        self.readers = 0
+        self.wd = None
+        self.size = -1
+        self.generation = 0
+        self.changed = threading.Condition()
+
+    def notify(self):
+        with self.changed:
+            self.generation += 1
+            self.changed.notify_all()
+
+    def wait(self, generation):
+        """Wait until notify() was called after generation was read, at most POLL_INTERVAL"""
+        with self.changed:
+            if self.generation == generation:
+                self.changed.wait(POLL_INTERVAL)
+            return self.generation
+
+
+class _Watcher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+        self._thread = None
+        try:
+            self._inotify = _Inotify()
+        except (OSError, AttributeError) as error:
+            app.logger.info(f"inotify isn't available, log readers poll every {POLL_INTERVAL}s: {error}")
+            self._inotify = None
+
+    def follow(self, path):
+        with self._lock:
+            watched = self._files.get(path)
+            if watched is None:
+                watched = self._files[path] = _Watched(path)
+                if self._inotify is not None:
+                    try:
+                        watched.wd = self._inotify.add(path)
+                    except OSError as error:
+                        app.logger.debug(f"Can't watch {path}, polling it: {error}")
+            watched.readers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="log-tail", daemon=True)
+                self._thread.start()
+        return watched
+
+    def unfollow(self, watched):
+        with self._lock:
+            watched.readers -= 1
+            if watched.readers > 0:
+                return
+            del self._files[watched.path]
+            if watched.wd is not None:
+                self._inotify.remove(watched.wd)
+
+    def _poll(self, files):
+        for watched in files:
+            if watched.wd is not None:
+                continue
+            try:
+                size = os.stat(watched.path).st_size
+            except OSError:
+                size = -1
+            if size != watched.size:
+                watched.size = size
+                watched.notify()
+
+    def _loop(self):
+        while True:
+            if self._inotify is not None:
+                readable, _, _ = select.select([self._inotify.fd], [], [], POLL_INTERVAL)
+                wds = self._inotify.read() if readable else set()
+            else:
+                select.select([], [], [], POLL_INTERVAL)
+                wds = set()
+            with self._lock:
+                files = list(self._files.values())
+            for watched in files:
+                if watched.wd in wds:
+                    watched.notify()
+            self._poll(files)
+
+
+_watcher = _Watcher()
+
+
+def tail_offset(path):
+    """
+    Offset of the start of the line TAIL_BYTES before the end of a log\n
+    :param path: full path of the log
+    :return int:
+    """
+    size = os.path.getsize(path)
+    if size <= TAIL_BYTES:
+        return 0
+    with open(path, "rb") as log_file:
+        log_file.seek(size - TAIL_BYTES)
+        skipped = log_file.readline()
+    return size - TAIL_BYTES + len(skipped)
+
+
+def _read_chunks(log_file, offset):
+    """Read everything after offset in CHUNK_SIZE chunks"""
+    while chunk := os.pread(log_file.fileno(), CHUNK_SIZE, offset):
+        offset += len(chunk)
+        yield offset, chunk
+
+
+def follow(path, offset=0, arm_only=False):
+    """
+    Stream a log from offset and keep streaming what is appended to it\n
+    The stream ends when the log is deleted or replaced.
+    :param path: full path of the log
+    :param int offset: byte offset to start at, e.g. to resume a dropped stream
+    :param bool arm_only: only lines with "ARM:" in them, used by the armcat mode
+    :return: generator of bytes
+    """
+    watched = _watcher.follow(path)
+    partial_line = b""
+    try:
+        with open(path, "rb") as log_file:
+            inode = os.fstat(log_file.fileno()).st_ino
+            while True:
+                generation = watched.generation
+                if os.fstat(log_file.fileno()).st_size < offset:
+                    # Truncated, start over
+                    offset = 0
+                    partial_line = b""
+                for offset, chunk in _read_chunks(log_file, offset):
+                    if not arm_only:
+                        yield chunk
+                        continue
+                    lines = (partial_line + chunk).split(b"\n")
+                    partial_line = lines.pop()
+                    matches = [line for line in lines if b"ARM:" in line]
+                    if matches:
+                        yield b"\n".join(matches) + b"\n"
+                try:
+                    if os.stat(path).st_ino != inode:
+                        return
+                except FileNotFoundError:
+                    return
+                watched.wait(generation)
+    except OSError as error:
+        if error.errno != errno.ENOENT:
+            raise
+    finally:
+        _watcher.unfollow(watched)
@@ -13,7 +13,7 @@ from flask import render_template, request, Blueprint, send_file, session
 from werkzeug.routing import ValidationError
 
 import arm.ui.utils as ui_utils
-from arm.ui import app
+from arm.ui import app, log_tail
 import arm.config.config as cfg
 
 route_logs = Blueprint('route_logs', __name__,
@@ -74,16 +74,38 @@ def logreader():
     full_path = os.path.join(log_path, request.args.get('logfile'))
     ui_utils.validate_logfile(request.args.get('logfile'), mode, Path(full_path))
 
-    # Only ARM logs
-    if mode == "armcat":
-        generate = ui_utils.generate_arm_cat(full_path)
-    # Give everything / Tail
-    elif mode == "full":
-        generate = ui_utils.generate_full_log(full_path)
-    elif mode == "download":
+    if mode == "download":
         return send_file(full_path, as_attachment=True)
-    else:
+    # Only ARM logs / Give everything / Tail, all keep streaming what is appended
+    if mode not in ("armcat", "full", "tail"):
         # No mode - error out
         raise ValidationError
-
-    return app.response_class(generate, mimetype='text/plain')
+    if request.range is not None:
+        if mode == "armcat":
+            # Byte ranges are of the log file, they don't map onto the filtered armcat stream
+            return app.response_class("armcat doesn't support Range requests", status=416, mimetype='text/plain',
+                                      headers={"Content-Range": f"bytes */{os.path.getsize(full_path)}"})
+        # The range of the log as it is now, 206 with Content-Range, following it needs the offset argument
+        return send_file(full_path, mimetype='text/plain', conditional=True)
+    offset = stream_offset(full_path, mode)
+    generate = log_tail.follow(full_path, offset, arm_only=mode == "armcat")
+    return app.response_class(generate, mimetype='text/plain',
+                              headers={"X-Log-Offset": str(offset), "Cache-Control": "no-cache"})
+
+
+def stream_offset(full_path, mode):
+    """
+    Byte offset a log stream starts at\n
+    An offset argument resumes a dropped stream, otherwise tail starts near the
+    end and the other modes at the beginning. The offset counts bytes of the log
+    file, X-Log-Offset plus the bytes received so far for full and tail. The
+    armcat stream leaves lines out, so it can't be resumed and an offset is rejected.
+    :param full_path: full path of the log
+    :param mode: logreader mode
+    :return int:
+    """
+    if 'offset' in request.args:
+        if mode == "armcat" or not request.args['offset'].isdigit():
+            raise ValidationError
+        return min(int(request.args['offset']), os.path.getsize(full_path))
+    return log_tail.tail_offset(full_path) if mode == "tail" else 0
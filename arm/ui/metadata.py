@@ -5,10 +5,68 @@ import re
 import requests
 from flask.logging import default_handler  # noqa: F401
 
-from arm.ui import app
+from arm.ui import app, http_client, metadata_cache
 import arm.config.config as cfg
 
 TMDB_YEAR_REGEX = r"-\d{0,2}-\d{0,2}"
+# OMDb errors that mean the title doesn't exist, other errors (api key, request limit) aren't cached
+OMDB_NOT_FOUND_ERRORS = ("Movie not found!", "Series not found!", "Incorrect IMDb ID.", "Too many results.")
+# TMDb status code of an unknown id
+TMDB_NOT_FOUND_STATUS = 34
+
+
+def _timeout():
+    """Seconds a single provider request may take"""
+    return float(cfg.arm_config.get('METADATA_TIMEOUT', 10))
+
+
+def omdb_found(title_info):
+    """Classify an OMDb response for the cache: True found, False not found, None error"""
+    if 'Error' not in title_info and title_info.get('Response') != "False":
+        return True
+    return False if title_info.get('Error') in OMDB_NOT_FOUND_ERRORS else None
+
+
+def tmdb_found(search_results):
+    """Classify a TMDb response for the cache: True found, False not found, None error"""
+    if 'status_code' in search_results:
+        return False if search_results['status_code'] == TMDB_NOT_FOUND_STATUS else None
+    if search_results.get('total_results') == 0:
+        return False
+    if 'movie_results' in search_results:
+        return bool(search_results['movie_results'] or search_results['tv_results'])
+    return True
+
+
+def omdb_get(endpoint, query, year, url):
+    """
+    Cached OMDb request\n
+    :param endpoint: kind of request, part of the cache key
+    :param query: title or imdb id of the request
+    :param year: year of the request
+    :param url: full url
+    :return dict: the parsed response
+    """
+    return metadata_cache.lookup(f"omdb:{endpoint}", query, year,
+                                 lambda: http_client.get(url, timeout=_timeout()).json(), omdb_found)
+
+
+def tmdb_get(endpoint, query, year, url, keep=None):
+    """
+    Cached TMDb request\n
+    :param endpoint: kind of request, part of the cache key
+    :param query: title or id of the request
+    :param year: year of the request
+    :param url: full url
+    :param keep: keys of the response to keep, all if None
+    :return dict: the parsed response
+    """
+    def fetch():
+        response = json.loads(http_client.get(url, timeout=_timeout()).text)
+        if keep is not None and 'status_code' not in response:
+            response = {key: value for key, value in response.items() if key in keep}
+        return response
+    return metadata_cache.lookup(f"tmdb:{endpoint}", query, year, fetch, tmdb_found)
 
 
 def call_omdb_api(title=None, year=None, imdb_id=None, plot="short"):
@@ -40,13 +98,15 @@ def call_omdb_api(title=None, year=None, imdb_id=None, plot="short"):
         app.logger.debug("no params")
     # connect to omdb and add background key
     try:
-        title_info_json = urllib.request.urlopen(str_url).read()
-        title_info = json.loads(title_info_json.decode())
+        if imdb_id:
+            title_info = omdb_get(f"id:{plot}", imdb_id, None, str_url)
+        else:
+            title_info = omdb_get("search", title, year, str_url)
         title_info['background_url'] = None
         app.logger.debug(f"omdb - {title_info}")
         if 'Error' in title_info or title_info['Response'] == "False":
             title_info = None
-    except urllib.error.HTTPError as error:
+    except (requests.RequestException, ValueError) as error:
         app.logger.error(f"omdb call failed with error - {error}")
     else:
         app.logger.debug("omdb - call was successful")
@@ -73,18 +133,19 @@ def get_omdb_poster(title=None, year=None, imdb_id=None, plot="short"):
         app.logger.debug("no params")
         return None, None
     try:
-        title_info_json = urllib.request.urlopen(requests.utils.requote_uri(str_url)).read()
+        if imdb_id:
+            title_info = omdb_get(f"id:{plot}", imdb_id, None, requests.utils.requote_uri(str_url))
+        else:
+            title_info = omdb_get("search", title, year, requests.utils.requote_uri(str_url))
     except Exception as error:
         app.logger.debug(f"Failed to reach OMdb - {error}")
     else:
-        title_info = json.loads(title_info_json.decode())
         # app.logger.debug("omdb - " + str(title_info))
         if 'Error' not in title_info:
             return title_info['Search'][0]['Poster'], title_info['Search'][0]['imdbID']
 
         try:
-            title_info_json2 = urllib.request.urlopen(requests.utils.requote_uri(str_url_2)).read()
-            title_info2 = json.loads(title_info_json2.decode())
+            title_info2 = omdb_get("title", title, year, requests.utils.requote_uri(str_url_2))
             # app.logger.debug("omdb - " + str(title_info2))
             if 'Error' not in title_info2:
                 return title_info2['Poster'], title_info2['imdbID']
@@ -102,7 +163,7 @@ def get_tmdb_poster(search_query=None, year=None):
     :return: dict of search results
     """
     tmdb_api_key = cfg.arm_config['TMDB_API_KEY']
-    search_results, poster_base, response = tmdb_fetch_results(search_query, year, tmdb_api_key)
+    search_results, poster_base, _response = tmdb_fetch_results(search_query, year, tmdb_api_key)
 
     # if status_code is in search_results we know there was an error
     if 'status_code' in search_results:
@@ -116,8 +177,7 @@ def get_tmdb_poster(search_query=None, year=None):
 
     # Search tmdb for tv series
     url = f"https://api.themoviedb.org/3/search/tv?api_key={tmdb_api_key}&query={search_query}"
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    search_results = tmdb_get("search_tv", search_query, None, url)
     # app.logger.debug(json.dumps(response.json(), indent=4, sort_keys=True))
     if search_results['total_results'] > 0:
         app.logger.debug(search_results['total_results'])
@@ -154,7 +214,7 @@ def tmdb_search(search_query=None, year=None):
     :return: json/dict of search results
     """
     tmdb_api_key = cfg.arm_config['TMDB_API_KEY']
-    search_results, poster_base, response = tmdb_fetch_results(search_query, year, tmdb_api_key)
+    search_results, poster_base, _response = tmdb_fetch_results(search_query, year, tmdb_api_key)
     app.logger.debug(f"Search results - movie - {search_results}")
     if 'status_code' in search_results:
         app.logger.error(f"tmdb_fetch_results failed with error -  {search_results['status_message']}")
@@ -166,8 +226,7 @@ def tmdb_search(search_query=None, year=None):
     # Search for tv series
     app.logger.debug("tmdb_search - movie not found, trying tv series ")
     url = f"https://api.themoviedb.org/3/search/tv?api_key={tmdb_api_key}&query={search_query}"
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    search_results = tmdb_get("search_tv", search_query, None, url)
     if search_results['total_results'] > 0:
         app.logger.debug(search_results['total_results'])
         return tmdb_process_results(poster_base, return_results, search_results, "series")
@@ -215,13 +274,11 @@ def tmdb_get_imdb(tmdb_id):
           f"append_to_response=alternative_titles,credits,images,keywords,releases,reviews,similar,videos,external_ids"
     url_tv = f"https://api.themoviedb.org/3/tv/{tmdb_id}/external_ids?api_key={tmdb_api_key}"
     # Making a get request
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    search_results = tmdb_get("movie", tmdb_id, None, url, keep=("external_ids",))
     # 'status_code' means id wasn't found
     if 'status_code' in search_results:
         # Try tv series
-        response = requests.get(url_tv)
-        tv_json = json.loads(response.text)
+        tv_json = tmdb_get("tv_external_ids", tmdb_id, None, url_tv)
         app.logger.debug(tv_json)
         if 'status_code' not in tv_json:
             return tv_json['imdb_id']
@@ -240,8 +297,7 @@ def tmdb_find(imdb_id):
     poster_size = "original"
     poster_base = f"https://image.tmdb.org/t/p/{poster_size}"
     # Making a get request
-    response = requests.get(url)
-    search_results = json.loads(response.text)
+    search_results = tmdb_get("find", imdb_id, None, url)
     # app.logger.debug(f"tmdb_find = {search_results}")
     if len(search_results['movie_results']) > 0:
         # We want to push out everything even if we don't use it right now, it may be used later.
@@ -286,7 +342,7 @@ def tmdb_fetch_results(search_query, year, tmdb_api_key):
     :param str search_query: search query from ARMui
     :param str year: the year of the movie/tv-show
     :param str tmdb_api_key: tmdb API key
-    :return: [search_results dict, poster_img string, requests Response]
+    :return: [search_results dict, poster_img string, None]
     """
     # https://api.themoviedb.org/3/movie/78?api_key= # base url
     # Additional
@@ -299,6 +355,5 @@ def tmdb_fetch_results(search_query, year, tmdb_api_key):
     # "w92", "w154", "w185", "w342", "w500", "w780", "original"
     poster_size = "original"
     poster_base = f"https://image.tmdb.org/t/p/{poster_size}"
-    response = requests.get(url)
-    return_json = json.loads(response.text)
-    return return_json, poster_base, response
+    return_json = tmdb_get("search_movie", search_query, year, url)
+    return return_json, poster_base, None
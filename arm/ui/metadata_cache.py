@@ -0,0 +1,233 @@
+"""
+Response cache for the OMDb and TMDb lookups
+
+Responses are kept in a small SQLite database next to the ARM database, so
+the rippers and the UI share them. Entries are keyed on the provider (with
+the endpoint), the normalised query and the year.
+- found responses live METADATA_CACHE_TTL hours, "not found" responses
+  METADATA_CACHE_NEGATIVE_TTL hours, errors (bad api key, rate limits, no
+  network) are never stored
+- at most METADATA_CACHE_SIZE entries are kept, the least recently used go first
+- hits, misses and stores are counted in memory and added to the cache
+  database at most every TOUCH_INTERVAL, see stats()
+- each thread keeps one connection, the tables are created once per process
+METADATA_CACHE_TTL: 0 turns the cache off.
+"""
+import atexit
+import collections
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import arm.config.config as cfg
+
+CACHE_FILE = "metadata_cache.db"
+# Milliseconds a writer waits for the cache database
+BUSY_TIMEOUT = 5000
+# Seconds between two updates of an entry's last use or of the counters, keeps hits from writing every time
+TOUCH_INTERVAL = 60
+# Stores between two size checks
+PRUNE_EVERY = 50
+
+COUNTERS = ("hits", "negative_hits", "misses", "stores", "negative_stores", "errors", "evictions")
+
+_stores_since_prune = 0
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_counts_lock = threading.Lock()
+_counts = collections.Counter()
+_counts_written = time.monotonic()
+
+
+def cache_path():
+    """Path of the cache database, stored next to the ARM database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), CACHE_FILE)
+
+
+def normalise(query):
+    """
+    Cache key form of a query, case, url quoting and spacing don't matter\n
+    :param query: title, search string or id
+    :return str:
+    """
+    query = urllib.parse.unquote_plus(str(query or ""))
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def _year(year):
+    year = str(year or "").strip()
+    return "" if year == "None" else year
+
+
+def _connect():
+    """Connection of this thread to the cache database, the first one of the process creates the tables"""
+    path = cache_path()
+    if getattr(_local, "path", None) == path:
+        return _local.connection
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, isolation_level=None)
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with _schema_lock:
+        if path not in _schema_ready:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, provider TEXT, "
+                               "found INTEGER, value TEXT, expires REAL, last_used REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used)")
+            connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+            _schema_ready.add(path)
+    _local.connection, _local.path = connection, path
+    return connection
+
+
+def _disconnect():
+    """Forget the connection of this thread after an error, the next one checks the tables again"""
+    connection, _local.connection, _local.path = getattr(_local, "connection", None), None, None
+    if connection is not None:
+        connection.close()
+    with _schema_lock:
+        _schema_ready.clear()
+
+
+def _count(name, value=1):
+    with _counts_lock:
+        _counts[name] += value
+
+
+def _write_counts(connection, force=False):
+    """Add the counts of this process to the cache database, at most every TOUCH_INTERVAL unless forced"""
+    global _counts_written
+    with _counts_lock:
+        if not _counts or (not force and time.monotonic() - _counts_written < TOUCH_INTERVAL):
+            return
+        counts = dict(_counts)
+        _counts.clear()
+        _counts_written = time.monotonic()
+    try:
+        connection.executemany("INSERT INTO counters (name, value) VALUES (?, ?) "
+                               "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", counts.items())
+    except sqlite3.Error:
+        # Keep them for the next attempt
+        with _counts_lock:
+            _counts.update(counts)
+        raise
+
+
+def _get(connection, key, now):
+    row = connection.execute("SELECT found, value, last_used FROM responses WHERE key = ? AND expires > ?",
+                             (key, now)).fetchone()
+    if row is None:
+        return None
+    if now - row[2] > TOUCH_INTERVAL:
+        connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+    return bool(row[0]), json.loads(row[1])
+
+
+def _put(connection, key, provider, found, value, ttl, now):
+    global _stores_since_prune
+    connection.execute("INSERT OR REPLACE INTO responses (key, provider, found, value, expires, last_used) "
+                       "VALUES (?, ?, ?, ?, ?, ?)", (key, provider, int(found), json.dumps(value), now + ttl, now))
+    _stores_since_prune += 1
+    if _stores_since_prune >= PRUNE_EVERY:
+        _stores_since_prune = 0
+        prune(connection)
+
+
+def prune(connection=None):
+    """
+    Drop expired entries and the least recently used ones above METADATA_CACHE_SIZE\n
+    :return int: entries removed
+    """
+    if connection is None:
+        return prune(_connect())
+    removed = connection.execute("DELETE FROM responses WHERE expires <= ?", (time.time(),)).rowcount
+    size = int(cfg.arm_config.get('METADATA_CACHE_SIZE', 5000))
+    removed += connection.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                                  "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (size,)).rowcount
+    if removed:
+        _count("evictions", removed)
+    return removed
+
+
+def lookup(provider, query, year, fetch, classify):
+    """
+    Cached response of a metadata request\n
+    :param str provider: provider and endpoint, e.g. "omdb:search"
+    :param query: what is looked up, title or id
+    :param year: year of release, may be None
+    :param fetch: function without arguments doing the request, returns the parsed response
+    :param classify: function of a response, True if found, False if not found, None for errors that aren't stored
+    :return: the response, from the cache or from fetch()
+    """
+    ttl = float(cfg.arm_config.get('METADATA_CACHE_TTL', 168)) * 3600
+    if ttl <= 0:
+        return fetch()
+    key = f"{provider}|{normalise(query)}|{_year(year)}"
+    now = time.time()
+    try:
+        connection = _connect()
+        cached = _get(connection, key, now)
+        if cached is not None:
+            found, value = cached
+            _count("hits" if found else "negative_hits")
+            _write_counts(connection)
+            return value
+        _count("misses")
+    except sqlite3.Error as error:
+        logging.debug(f"Metadata cache not available, asking {provider} directly: {error}")
+        _disconnect()
+        return fetch()
+
+    value = fetch()
+    found = classify(value)
+    try:
+        connection = _connect()
+        if found is None:
+            _count("errors")
+        elif found:
+            _put(connection, key, provider, True, value, ttl, now)
+            _count("stores")
+        else:
+            negative_ttl = float(cfg.arm_config.get('METADATA_CACHE_NEGATIVE_TTL', 24)) * 3600
+            _put(connection, key, provider, False, value, negative_ttl, now)
+            _count("negative_stores")
+        _write_counts(connection)
+    except sqlite3.Error as error:
+        logging.debug(f"Couldn't store the {provider} response: {error}")
+        _disconnect()
+    return value
+
+
+def stats():
+    """
+    Counters and size of the cache, shared by the rippers and the UI\n
+    :return dict:
+    """
+    try:
+        connection = _connect()
+        _write_counts(connection, force=True)
+        counters = dict(connection.execute("SELECT name, value FROM counters").fetchall())
+        entries = connection.execute("SELECT count(*) FROM responses").fetchone()[0]
+    except sqlite3.Error as error:
+        logging.debug(f"Metadata cache not available: {error}")
+        _disconnect()
+        return {}
+    result = {name: counters.get(name, 0) for name in COUNTERS}
+    lookups = result["hits"] + result["negative_hits"] + result["misses"]
+    result["hit_rate"] = round((result["hits"] + result["negative_hits"]) / lookups, 3) if lookups else None
+    result["entries"] = entries
+    return result
+
+
+@atexit.register
+def _write_counts_at_exit():
+    if not _counts:
+        return
+    try:
+        _write_counts(_connect(), force=True)
+    except sqlite3.Error as error:
+        logging.debug(f"Couldn't write the metadata cache counters: {error}")
@@ -0,0 +1,175 @@
+"""
+Local copies of the posters and cover art shown by the UI
+
+Job.poster_url points at OMDb, TMDb or the Cover Art Archive. The first time a
+page shows a remote poster it still gets the remote url, and the poster is
+downloaded in the background by FETCH_WORKERS threads. After that, pages get
+/posters/<name>, served from the cache folder next to the ARM database with a
+Cache-Control of a year. The names are content hashes, so a file never changes.
+- the download is kept as <sha256>.<ext>, with a <sha256>_small.jpg and a
+  <sha256>_medium.jpg thumbnail (SIZES) made by ffmpeg
+- the url -> file index is an SQLite file in the cache folder, read into memory once
+- a url that failed is tried again after RETRY_FAILED seconds
+Without ffmpeg the full size download is served for every size.
+"""
+import hashlib
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+
+import arm.config.config as cfg
+from arm.ui import app, http_client
+
+POSTER_DIR = "posters"
+INDEX_FILE = "index.db"
+# Width in pixels of each thumbnail
+SIZES = {"small": 120, "medium": 240}
+# Threads downloading posters
+FETCH_WORKERS = 2
+# Largest download kept, in bytes
+MAX_BYTES = 5 * 1024 * 1024
+# Seconds before a url that couldn't be downloaded is tried again
+RETRY_FAILED = 3600
+# Seconds browsers may keep a cached poster
+CACHE_MAX_AGE = 365 * 24 * 3600
+EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp", "image/gif": ".gif"}
+
+_lock = threading.Lock()
+_index = None
+_pending = set()
+_failed = {}
+_executor = None
+
+
+def cache_dir():
+    """Folder of the cached posters, next to the ARM database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), POSTER_DIR)
+
+
+def _connect():
+    connection = sqlite3.connect(os.path.join(cache_dir(), INDEX_FILE), timeout=5)
+    connection.execute("CREATE TABLE IF NOT EXISTS posters (url TEXT PRIMARY KEY, digest TEXT, ext TEXT, "
+                       "thumbnails INTEGER, fetched REAL)")
+    return connection
+
+
+def _load_index():
+    """url: (digest, ext, thumbnails) of every cached poster, read once per process"""
+    global _index
+    if _index is None:
+        index = {}
+        try:
+            os.makedirs(cache_dir(), exist_ok=True)
+            with closing(_connect()) as connection:
+                for url, digest, ext, thumbnails in connection.execute(
+                        "SELECT url, digest, ext, thumbnails FROM posters"):
+                    index[url] = (digest, ext, bool(thumbnails))
+        except (OSError, sqlite3.Error) as error:
+            app.logger.warning(f"Poster cache not available: {error}")
+        _index = index
+    return _index
+
+
+def _is_remote(poster_url):
+    return isinstance(poster_url, str) and poster_url.startswith(("http://", "https://"))
+
+
+def url(poster_url, size="medium"):
+    """
+    Url a page shows for a poster, the local copy when there is one\n
+    Remote posters that aren't cached yet are queued for download.
+    :param poster_url: Job.poster_url
+    :param str size: small, medium or full
+    :return: /posters/<name>, or poster_url unchanged
+    """
+    if not _is_remote(poster_url):
+        return poster_url
+    with _lock:
+        cached = _load_index().get(poster_url)
+    if cached is None:
+        _queue(poster_url)
+        return poster_url
+    digest, ext, thumbnails = cached
+    if thumbnails and size in SIZES:
+        return f"/posters/{digest}_{size}.jpg"
+    return f"/posters/{digest}{ext}"
+
+
+def _queue(poster_url):
+    global _executor
+    with _lock:
+        if poster_url in _pending or time.monotonic() < _failed.get(poster_url, 0):
+            return
+        _pending.add(poster_url)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="poster-cache")
+    _executor.submit(_fetch_logged, poster_url)
+
+
+def _fetch_logged(poster_url):
+    try:
+        fetch(poster_url)
+    except Exception as error:
+        app.logger.debug(f"Couldn't cache poster {poster_url}: {error}")
+        with _lock:
+            _failed[poster_url] = time.monotonic() + RETRY_FAILED
+    finally:
+        with _lock:
+            _pending.discard(poster_url)
+
+
+def _write(path, content):
+    if os.path.exists(path):
+        return
+    with open(f"{path}.tmp", "wb") as poster_file:
+        poster_file.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def _thumbnail(source, target, width):
+    """Scale source down to width with ffmpeg, smaller images keep their size"""
+    if os.path.exists(target):
+        return
+    subprocess.run(["ffmpeg", "-v", "error", "-y", "-i", source, "-vf", f"scale='min({width},iw)':-2",
+                    "-frames:v", "1", "-q:v", "4", f"{target}.tmp.jpg"],
+                   check=True, stdin=subprocess.DEVNULL, capture_output=True, timeout=60)
+    os.replace(f"{target}.tmp.jpg", target)
+
+
+def fetch(poster_url):
+    """
+    Download a poster into the cache and make its thumbnails\n
+    :param str poster_url: remote url of the image
+    :return str: content hash the poster is stored as
+    :raises ValueError: when the url doesn't give an image
+    """
+    response = http_client.get(poster_url)
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if response.status_code != 200 or content_type not in EXTENSIONS:
+        raise ValueError(f"answered {response.status_code} {content_type}")
+    if len(response.content) > MAX_BYTES:
+        raise ValueError(f"{len(response.content)} bytes is too large")
+    digest = hashlib.sha256(response.content).hexdigest()
+    ext = EXTENSIONS[content_type]
+    folder = cache_dir()
+    os.makedirs(folder, exist_ok=True)
+    source = os.path.join(folder, f"{digest}{ext}")
+    _write(source, response.content)
+    try:
+        for size, width in SIZES.items():
+            _thumbnail(source, os.path.join(folder, f"{digest}_{size}.jpg"), width)
+        thumbnails = True
+    except (OSError, subprocess.SubprocessError) as error:
+        app.logger.debug(f"No thumbnails for {poster_url}, serving it full size: {error}")
+        thumbnails = False
+    with closing(_connect()) as connection, connection:
+        connection.execute("INSERT OR REPLACE INTO posters (url, digest, ext, thumbnails, fetched) "
+                           "VALUES (?, ?, ?, ?, ?)", (poster_url, digest, ext, int(thumbnails), time.time()))
+    with _lock:
+        _load_index()[poster_url] = (digest, ext, thumbnails)
+    app.logger.debug(f"Cached poster {poster_url} as {digest}")
+    return digest
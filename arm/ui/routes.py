@@ -6,6 +6,7 @@ Covers
 - error [GET]
 - errorhandler [GET]
 - setup [GET] -- penned for removal
+- posters [GET]
 Other routes handled in flask blueprints
 - auth, database, history, jobs, logs, sendmovies, settings
 """
@@ -14,21 +15,19 @@ import json
 from pathlib import Path, PurePath
 from werkzeug.exceptions import HTTPException
 from flask import Flask, render_template, request, flash, \
-    redirect, url_for, session   # noqa: F401
+    redirect, url_for, session, send_from_directory   # noqa: F401
 from flask.logging import default_handler  # noqa: F401
 from flask_login import LoginManager, login_required, \
     current_user, login_user, logout_user  # noqa: F401
 from sqlalchemy.exc import SQLAlchemyError
 
 import arm.ui.utils as ui_utils
-from arm.ui import app, db, constants
+from arm.ui import app, db, constants, poster_cache, stats_collector
 from arm.models.job import Job
 from arm.models.system_info import SystemInfo
 from arm.models.user import User
 import arm.config.config as cfg
 from arm.ui.forms import DBUpdate
-from arm.ui.settings.ServerUtil import ServerUtil
-from arm.ui.settings.settings import check_hw_transcode_support
 
 # This attaches the armui_cfg globally to let the users use any bootswatch skin from cdn
 armui_cfg = ui_utils.arm_db_cfg()
@@ -37,6 +36,9 @@ armui_cfg = ui_utils.arm_db_cfg()
 login_manager = LoginManager()
 login_manager.init_app(app)
 
+# {{ job.poster_url|poster('small') }} gives the cached copy of a poster
+app.add_template_filter(poster_cache.url, name="poster")
+
 
 @app.route('/')
 @app.route('/index.html')
@@ -46,9 +48,9 @@ def home():
     The main homepage showing current rips and server stats
     """
     # Check the database is current
-    db_update = ui_utils.arm_db_check()
+    db_update = stats_collector.db_check()
     # Push out HW transcode status for the homepage
-    stats = {'hw_support': check_hw_transcode_support()}
+    stats = {'hw_support': stats_collector.hw_support()}
     if not db_update["db_current"] or not db_update["db_exists"]:
         dbform = DBUpdate(request.form)
         app.logger.debug(f"Error with ARM DB: [{db_update['db_current']}]-[{db_update['db_exists']}]")
@@ -58,7 +60,8 @@ def home():
 
     # Get system details from Server Info and Config
     server = SystemInfo.query.filter_by(id="1").first()
-    serverutil = ServerUtil()
+    serverutil = stats_collector.latest()
+    serverutil.flash_missing_paths()
     arm_path = cfg.arm_config['TRANSCODE_PATH']
     media_path = cfg.arm_config['COMPLETED_PATH']
 
@@ -68,7 +71,7 @@ def home():
 
     if os.path.isfile(cfg.arm_config['DBFILE']):
         try:
-            jobs = db.session.query(Job).filter(Job.status.notin_(['fail', 'success'])).all()
+            jobs = db.session.query(Job).filter(Job.active).all()
         except SQLAlchemyError as e:
             # db isn't setup
             app.logger.error(f"Error getting jobs from DB: {e}")
@@ -89,6 +92,29 @@ def home():
                            arm_path=arm_path, media_path=media_path, stats=stats)
 
 
+@app.route('/stats/timeseries')
+def stats_timeseries():
+    """
+    Server samples and daily job totals for history graphs\n
+    hours: only the samples of the last hours, days: number of days of totals (default 30)
+    """
+    hours = request.args.get('hours', type=float)
+    days = max(1, request.args.get('days', 30, type=int))
+    return app.response_class(response=json.dumps(stats_collector.timeseries(hours, days), indent=4, sort_keys=True),
+                              status=200,
+                              mimetype=constants.JSON_TYPE)
+
+
+@app.route('/posters/<name>')
+def cached_poster(name):
+    """
+    A poster from the poster cache, the names are content hashes so browsers may keep it for good
+    """
+    response = send_from_directory(poster_cache.cache_dir(), name)
+    response.headers["Cache-Control"] = f"public, max-age={poster_cache.CACHE_MAX_AGE}, immutable"
+    return response
+
+
 @app.route('/error')
 def was_error(error):
     """
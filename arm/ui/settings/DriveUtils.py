@@ -14,6 +14,7 @@ import re
 import pyudev
 
 from arm.models import SystemDrives
+from arm.ripper import drive_index
 from arm.ui import app, db
 
 
@@ -229,7 +230,8 @@ def drives_update(startup=False):
     - `serial_id` is assumed persistent/unique.
     - `mount` point may change for USB devices
 
-    on system startup, clear all mdisc (MakeMKV disc index) values.
+    on system startup, clear all mdisc (MakeMKV disc index) values, unless the
+    drives are still the same as on the last MakeMKV drive scan.
     """
     drive_count = SystemDrives.query.count()
 
@@ -306,6 +308,12 @@ def drives_update(startup=False):
     if stale_count > 0:
         app.logger.info("%d drives are unavailable.", stale_count)
 
+    if startup:
+        drive_index.restore()
+    elif not drive_index.is_current():
+        # A drive was added, removed or moved since the last scan
+        drive_index.invalidate()
+
     return drive_count - SystemDrives.query.count()
 
 
@@ -21,11 +21,14 @@ class ServerUtil():
     storage_transcode_percent = 0.0
     storage_completed_free = 0
     storage_completed_percent = 0.0
+    # ARM folders that couldn't be read
+    missing_paths = ()
 
     def __init__(self):
         self.get_update()
 
     def get_update(self):
+        self.missing_paths = []
         self.get_cpu_util()
         self.get_cpu_temp()
         self.get_memory()
@@ -90,15 +93,20 @@ class ServerUtil():
     def get_disk_space(self, filepath):
         # Hard drive space
         try:
-            disk_space = psutil.disk_usage(filepath).free
-            disk_space = round(disk_space / 1073741824, 1)
-            disk_percent = psutil.disk_usage(filepath).percent
+            disk_usage = psutil.disk_usage(filepath)
+            disk_space = round(disk_usage.free / 1073741824, 1)
+            disk_percent = disk_usage.percent
         except FileNotFoundError:
             disk_space = 0
             disk_percent = 0
             app.logger.debug("ARM folders not found")
-            flash("There was a problem accessing the ARM folder: "
-                  f"'{filepath}'. Please make sure you have setup ARM", "danger")
+            self.missing_paths.append(filepath)
         app.logger.debug(f"Server {filepath} Space:  {disk_space}")
         app.logger.debug(f"Server {filepath} Percent:  {disk_percent}")
         return disk_space, disk_percent
+
+    def flash_missing_paths(self):
+        """Warn the user about ARM folders that couldn't be read, needs a request"""
+        for filepath in self.missing_paths:
+            flash("There was a problem accessing the ARM folder: "
+                  f"'{filepath}'. Please make sure you have setup ARM", "danger")
@@ -86,11 +86,23 @@ function musicCheck(job, idsplit) {
     return x;
 }
 
+/**
+ * Poster of a job, the copy in the poster cache of the job's server when there is one
+ * @param {Object} job  job from the json api
+ * @returns {string} image url
+ */
+function posterSrc(job) {
+    if (job.poster_thumb && job.poster_thumb.startsWith("/posters/")) {
+        return `${job.server_url ? job.server_url : ""}${job.poster_thumb}`;
+    }
+    return job.poster_url;
+}
+
 function posterCheck(job) {
     let x;
     let image;
     if (job.poster_url !== "None" && job.poster_url !== "N/A") {
-        x = `<img id="jobId${job.job_id}_poster_url" alt="poster img" src="${job.poster_url}" width="240px" class="img-thumbnail">`;
+        x = `<img id="jobId${job.job_id}_poster_url" alt="poster img" src="${posterSrc(job)}" width="240px" class="img-thumbnail">`;
     } else {
         if (job.video_type === "Music") {
             image = 'music.png';
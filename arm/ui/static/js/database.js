@@ -119,7 +119,11 @@ function switchSearch(data) {
             $(CARD_DECK).append(z);
         });
         console.log(data);
-        $(MSG_1_ID).html("Here are the jobs i found matching your query");
+        if (data.more) {
+            $(MSG_1_ID).html(`Here are the ${size} best matches for your query, refine it to narrow them down`);
+        } else {
+            $(MSG_1_ID).html("Here are the jobs i found matching your query");
+        }
         $("#m-body").addClass("bd-example-modal-lg");
         $("#m-body").modal("handleUpdate");
         $(MODEL_ID).modal("toggle");
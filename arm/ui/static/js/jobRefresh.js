@@ -153,8 +153,8 @@ function updateJobItem(oldJob, job) {
         cardHeader[0].innerText = `${job.title} (${job.year})`;
     }
     // Update card poster image
-    if (job.poster_url !== posterUrl[0].src && job.poster_url !== "None" && job.poster_url !== "N/A") {
-        posterUrl[0].src = job.poster_url;
+    if (posterSrc(job) !== posterUrl[0].getAttribute("src") && job.poster_url !== "None" && job.poster_url !== "N/A") {
+        posterUrl[0].src = posterSrc(job);
     }
     // Update job status image
     if (job.status !== status[0].title) {
@@ -303,6 +303,65 @@ function refreshJobs() {
     });
 }
 
+/**
+ * Follow the job list through the /events stream, poll the json api when streaming isn't possible
+ * @param {number} refreshInterval    polling interval in ms for the fallback
+ */
+function startJobEvents(refreshInterval) {
+    // Child servers can only be polled
+    if (typeof (EventSource) === "undefined" || activeServers.length > 1) {
+        window.setInterval(refreshJobs, refreshInterval);
+        return;
+    }
+    const source = new EventSource("events");
+    // Full job cards are built from the json api, (re)connects and new jobs fetch it once
+    source.addEventListener("snapshot", function () {
+        refreshJobs();
+    });
+    source.addEventListener("job", function () {
+        refreshJobs();
+    });
+    source.addEventListener("update", function (event) {
+        applyJobUpdate(JSON.parse(event.data));
+    });
+    source.addEventListener("remove", function (event) {
+        const job = activeJobs.find(e => e.job_id === `0_${JSON.parse(event.data).job_id}`);
+        if (typeof (job) !== "undefined") {
+            removeJobItem(job);
+            activeJobs.splice(activeJobs.indexOf(job), 1);
+        }
+    });
+    source.addEventListener("notification", function (event) {
+        checkNotifications({notes: [JSON.parse(event.data)]});
+    });
+    source.onerror = function () {
+        // The browser reconnects by itself, unless the server refused the stream
+        if (source.readyState === EventSource.CLOSED) {
+            console.log("Job events unavailable, polling instead");
+            window.setInterval(refreshJobs, refreshInterval);
+        }
+    };
+}
+
+/**
+ * Merge the changed fields of a job from the event stream into its card
+ * @param changes    changed fields, always with the job_id
+ */
+function applyJobUpdate(changes) {
+    const jobId = `0_${changes.job_id}`;
+    const oldJob = activeJobs.find(e => e.job_id === jobId);
+    if (typeof (oldJob) === "undefined") {
+        refreshJobs();
+        return;
+    }
+    const job = Object.assign({}, oldJob, changes, {
+        job_id: jobId,
+        config: Object.assign({}, oldJob.config, changes.config)
+    });
+    activeJobs[activeJobs.indexOf(oldJob)] = job;
+    updateJobItem(oldJob, job);
+}
+
 /**
  * Function to push all child servers from arm.yaml config into links on the homepage
  */
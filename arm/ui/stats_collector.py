@@ -0,0 +1,234 @@
+"""
+Background statistics for the home page and the /stats/timeseries api
+
+One collector thread per UI process
+- samples cpu, temperature, memory, the ARM folders and the active job count
+  every SAMPLE_INTERVAL into a ring buffer of HISTORY_SAMPLES samples
+- checks the database version at most every DB_CHECK_INTERVAL while it is current
+- checks the HandBrake hardware encoders every HW_CHECK_INTERVAL
+- adds up the jobs finished per day into DailyStats every AGGREGATE_INTERVAL
+Pages read the latest values from memory instead of measuring on every hit.
+"""
+import collections
+import datetime
+import threading
+import time
+
+from sqlalchemy.orm import load_only
+
+import arm.ui.utils as ui_utils
+from arm.ui import app, db, db_writer
+from arm.models.daily_stats import DailyStats
+from arm.models.job import Job, JobState
+from arm.models.transcode_queue import TranscodeQueue
+from arm.ui.settings.ServerUtil import ServerUtil
+from arm.ui.settings.settings import check_hw_transcode_support
+
+# Seconds between two samples
+SAMPLE_INTERVAL = 10
+# Samples kept, a day at the default interval
+HISTORY_SAMPLES = 8640
+# Seconds a current database version is trusted before it is checked again
+DB_CHECK_INTERVAL = 60
+# Seconds between two checks of the hardware encoders, HandBrake is started for each
+HW_CHECK_INTERVAL = 3600
+# Seconds between two aggregations of today and yesterday
+AGGREGATE_INTERVAL = 300
+
+SAMPLE_FIELDS = ("cpu_util", "cpu_temp", "memory_free", "memory_used", "memory_percent",
+                 "storage_transcode_free", "storage_transcode_percent",
+                 "storage_completed_free", "storage_completed_percent")
+
+
+def aggregate_day(day):
+    """
+    Count the jobs that finished on day and store them as its DailyStats\n
+    Rip time runs from the job start until its files were queued for transcoding, or until
+    the job finished when it wasn't transcoded. Transcode time is the time the queue item ran.
+    Bytes are the Job.output_bytes stored when the job succeeded, older jobs are measured once here.
+    :param datetime.date day:
+    :return DailyStats:
+    """
+    start = datetime.datetime.combine(day, datetime.time.min)
+    jobs = Job.query.options(load_only(Job.job_id, Job.status, Job.start_time, Job.stop_time, Job.path,
+                                       Job.output_bytes)) \
+        .filter(Job.stop_time >= start, Job.stop_time < start + datetime.timedelta(days=1), Job.finished).all()
+    queue_items = {item.job_id: item for item in
+                   TranscodeQueue.query.filter(TranscodeQueue.job_id.in_([job.job_id for job in jobs]))}
+
+    stats = DailyStats.query.get(day) or DailyStats(day)
+    stats.reset()
+    for job in jobs:
+        if job.status == JobState.SUCCESS.value:
+            stats.jobs_completed += 1
+            if job.output_bytes is None:
+                job.measure_output()
+            stats.bytes_ripped += job.output_bytes
+        else:
+            stats.jobs_failed += 1
+        item = queue_items.get(job.job_id)
+        rip_end = item.queued_time if item and item.queued_time else job.stop_time
+        if job.start_time and rip_end:
+            stats.rip_seconds += (rip_end - job.start_time).total_seconds()
+            stats.rip_count += 1
+        if item and item.start_time and item.stop_time:
+            stats.transcode_seconds += (item.stop_time - item.start_time).total_seconds()
+            stats.transcode_count += 1
+    db.session.add(stats)
+    db_writer.commit()
+    return stats
+
+
+def _missing_days():
+    """Days with finished jobs but no DailyStats yet, e.g. from before the collector existed"""
+    finished_days = {datetime.date.fromisoformat(str(day)) for (day,) in
+                     db.session.query(db.func.date(Job.stop_time)).filter(Job.stop_time.isnot(None)).distinct()}
+    known_days = {day for (day,) in db.session.query(DailyStats.day)}
+    return sorted(finished_days - known_days)
+
+
+class _Collector:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = collections.deque(maxlen=HISTORY_SAMPLES)
+        self._serverutil = None
+        self._active_jobs = 0
+        self._hw_support = None
+        self._hw_checked = 0.0
+        self._db_checked = None
+        self._aggregated = 0.0
+        self._backfilled = False
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name="stats-collector", daemon=True)
+            self._thread.start()
+
+    def sample(self):
+        """Measure the server and the active jobs and add them to the history"""
+        serverutil = ServerUtil()
+        try:
+            with app.app_context():
+                active_jobs = Job.query.filter(Job.active).count()
+        except Exception as error:
+            app.logger.debug(f"Couldn't count the active jobs: {error}")
+            active_jobs = self._active_jobs
+        sample = {field: getattr(serverutil, field) for field in SAMPLE_FIELDS}
+        sample["active_jobs"] = active_jobs
+        sample["time"] = datetime.datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self._serverutil = serverutil
+            self._active_jobs = active_jobs
+            self._samples.append(sample)
+
+    def serverutil(self):
+        if self._serverutil is None:
+            self.sample()
+        return self._serverutil
+
+    def hw_support(self):
+        now = time.monotonic()
+        if self._hw_support is None or now - self._hw_checked > HW_CHECK_INTERVAL:
+            self._hw_support = check_hw_transcode_support()
+            self._hw_checked = now
+        return self._hw_support
+
+    def db_check(self):
+        now = time.monotonic()
+        if self._db_checked is not None and now - self._db_checked < DB_CHECK_INTERVAL:
+            return {"db_exists": True, "db_current": True}
+        db_update = ui_utils.arm_db_check()
+        # Only a current database is cached, an outdated one is checked again until it's updated
+        self._db_checked = now if db_update["db_exists"] and db_update["db_current"] else None
+        return db_update
+
+    def reset_db_check(self):
+        self._db_checked = None
+
+    def samples(self, since=None):
+        with self._lock:
+            samples = list(self._samples)
+        if since is not None:
+            samples = [sample for sample in samples if sample["time"] >= since]
+        return samples
+
+    def aggregate(self):
+        """Aggregate today and yesterday, and on the first run every day that was never aggregated"""
+        today = datetime.date.today()
+        with app.app_context():
+            try:
+                days = {today, today - datetime.timedelta(days=1)}
+                if not self._backfilled:
+                    days.update(_missing_days())
+                for day in sorted(days):
+                    aggregate_day(day)
+                self._backfilled = True
+            finally:
+                db.session.remove()
+
+    def _loop(self):
+        while True:
+            try:
+                self.sample()
+                if time.monotonic() - self._aggregated > AGGREGATE_INTERVAL:
+                    self._aggregated = time.monotonic()
+                    self.aggregate()
+            except Exception as error:
+                app.logger.error(f"Collecting stats failed: {error}")
+            time.sleep(SAMPLE_INTERVAL)
+
+
+_collector = _Collector()
+
+
+def latest():
+    """
+    Latest server sample, measured now if nothing was sampled yet\n
+    :return ServerUtil:
+    """
+    _collector.start()
+    return _collector.serverutil()
+
+
+def hw_support():
+    """
+    HandBrake hardware encoder support, checked at most every HW_CHECK_INTERVAL\n
+    :return dict: nvidia/intel/amd: bool
+    """
+    return _collector.hw_support()
+
+
+def db_check():
+    """
+    ui_utils.arm_db_check(), trusted for DB_CHECK_INTERVAL once the database is current\n
+    :return dict: at least db_exists and db_current
+    """
+    return _collector.db_check()
+
+
+def reset_db_check():
+    """Check the database version again on the next page load, e.g. after a migration"""
+    _collector.reset_db_check()
+
+
+def timeseries(hours=None, days=30):
+    """
+    Server samples and daily job totals for history graphs\n
+    :param hours: only the samples of the last hours, all kept samples if None
+    :param int days: number of days of DailyStats, newest last
+    :return dict:
+    """
+    _collector.start()
+    since = None
+    if hours is not None:
+        since = (datetime.datetime.now() - datetime.timedelta(hours=hours)).isoformat(timespec="seconds")
+    first_day = datetime.date.today() - datetime.timedelta(days=days - 1)
+    daily = DailyStats.query.filter(DailyStats.day >= first_day).order_by(DailyStats.day).all()
+    return {
+        "interval": SAMPLE_INTERVAL,
+        "samples": _collector.samples(since),
+        "days": [day.get_d() for day in daily],
+    }
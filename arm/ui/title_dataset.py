@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Offline title dataset, the "local" METADATA_PROVIDER
+
+Titles are imported from the public IMDb dataset (title.basics.tsv.gz, and
+optionally title.ratings.tsv.gz to rank popular titles first) into a SQLite
+file next to the ARM database. Episodes, shorts and games are left out.
+    python3 arm/ui/title_dataset.py title.basics.tsv.gz --ratings title.ratings.tsv.gz
+The import builds a new file and swaps it in when it is complete, so lookups
+keep working while it runs.
+
+A search first looks for the normalised title (lower case, no accents or
+punctuation), then does a fuzzy search over a trigram index of the normalised
+titles, ranked by how similar the titles are. Results come back in the OMDb
+format, like the tmdb provider, so identification needs no network at all.
+"""
+import argparse
+import csv
+import difflib
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from contextlib import closing
+from importlib.util import find_spec
+from pathlib import Path
+
+# If the arm module can't be found, add the folder this file is in to PYTHONPATH
+if find_spec("arm") is None:
+    sys.path.append(str(Path(__file__).parents[2]))
+
+import arm.config.config as cfg  # noqa: E402
+
+DATASET_FILE = "title_dataset.db"
+# IMDb title types kept, and the OMDb type they are shown as
+TITLE_TYPES = {
+    "movie": "movie",
+    "tvMovie": "movie",
+    "video": "movie",
+    "tvSpecial": "movie",
+    "tvSeries": "series",
+    "tvMiniSeries": "series",
+}
+# Rows written per transaction during an import
+BATCH_SIZE = 10000
+# Candidates read from the trigram index and least similarity a fuzzy match needs
+FUZZY_CANDIDATES = 200
+MIN_SIMILARITY = 0.6
+SEARCH_RESULTS = 10
+# Words too common to find a title by on their own
+STOP_WORDS = {"the", "and", "of", "disc", "dvd"}
+
+
+def dataset_path():
+    """Path of the dataset, stored next to the ARM database"""
+    return os.path.join(os.path.dirname(cfg.arm_config['DBFILE']), DATASET_FILE)
+
+
+def normalise(title):
+    """
+    Form titles are matched in: lower case ascii words separated by single spaces\n
+    "Amélie" and "AMELIE", "Spider-Man" and "SPIDER_MAN" give the same result.
+    :param str title:
+    :return str:
+    """
+    title = unicodedata.normalize("NFKD", str(title or "")).encode("ascii", "ignore").decode()
+    title = title.lower().replace("&", " and ")
+    return " ".join(re.split(r"[\W_]+", title)).strip()
+
+
+def available():
+    """True if a dataset was imported"""
+    return os.path.isfile(dataset_path())
+
+
+def _connect():
+    connection = sqlite3.connect(f"file:{dataset_path()}?mode=ro", uri=True)
+    connection.row_factory = sqlite3.Row
+    return connection
+
+
+def _value(field):
+    return None if field == "\\N" else field
+
+
+def _open(path):
+    return gzip.open(path, "rt", encoding="utf-8") if str(path).endswith(".gz") else \
+        open(path, encoding="utf-8")
+
+
+def import_dataset(basics, ratings=None):
+    """
+    Build the dataset from IMDb TSV files and replace the current one\n
+    :param basics: path of title.basics.tsv(.gz)
+    :param ratings: path of title.ratings.tsv(.gz), optional
+    :return int: number of titles imported
+    """
+    target = dataset_path()
+    building = f"{target}.import"
+    if os.path.exists(building):
+        os.remove(building)
+    count = 0
+    with closing(sqlite3.connect(building)) as connection:
+        connection.execute("PRAGMA journal_mode=OFF")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute("CREATE TABLE titles (tconst TEXT PRIMARY KEY, title TEXT, original_title TEXT, "
+                           "norm TEXT, year INTEGER, type TEXT, runtime INTEGER, genres TEXT, "
+                           "votes INTEGER DEFAULT 0, rating REAL)")
+        with _open(basics) as tsv:
+            reader = csv.reader(tsv, delimiter="\t", quoting=csv.QUOTE_NONE)
+            next(reader)
+            batch = []
+            for row in reader:
+                # tconst titleType primaryTitle originalTitle isAdult startYear endYear runtimeMinutes genres
+                if len(row) < 9 or row[1] not in TITLE_TYPES or row[4] == "1":
+                    continue
+                year = _value(row[5])
+                runtime = _value(row[7])
+                batch.append((row[0], row[2], row[3], normalise(row[2]), int(year) if year else None,
+                              TITLE_TYPES[row[1]], int(runtime) if runtime and runtime.isdigit() else None,
+                              _value(row[8])))
+                if len(batch) >= BATCH_SIZE:
+                    connection.executemany("INSERT INTO titles (tconst, title, original_title, norm, year, "
+                                           "type, runtime, genres) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+                    connection.commit()
+                    count += len(batch)
+                    batch = []
+            connection.executemany("INSERT INTO titles (tconst, title, original_title, norm, year, "
+                                   "type, runtime, genres) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            connection.commit()
+            count += len(batch)
+        if ratings:
+            with _open(ratings) as tsv:
+                reader = csv.reader(tsv, delimiter="\t", quoting=csv.QUOTE_NONE)
+                next(reader)
+                batch = []
+                for tconst, rating, votes in reader:
+                    batch.append((float(rating), int(votes), tconst))
+                    if len(batch) >= BATCH_SIZE:
+                        connection.executemany("UPDATE titles SET rating = ?, votes = ? WHERE tconst = ?", batch)
+                        batch = []
+                connection.executemany("UPDATE titles SET rating = ?, votes = ? WHERE tconst = ?", batch)
+            connection.commit()
+        connection.execute("CREATE INDEX ix_titles_norm_year ON titles (norm, year)")
+        # Trigrams of the title without spaces, so "SPIDERMAN" finds "Spider-Man"
+        connection.execute("CREATE VIRTUAL TABLE titles_fts USING fts5(compact, content='', tokenize='trigram')")
+        connection.execute("INSERT INTO titles_fts (rowid, compact) SELECT rowid, replace(norm, ' ', '') FROM titles")
+        connection.commit()
+        connection.execute("VACUUM")
+    os.replace(building, target)
+    return count
+
+
+def _year(year):
+    year = re.sub(r"\D", "", str(year or ""))
+    return int(year) if len(year) == 4 else None
+
+
+def similarity(norm, title_norm):
+    """
+    How alike two normalised titles are, 0 to 1\n
+    The better of the character similarity and the share of words the two have in common,
+    so a disc label with extra words ("breaking bad season 1") still finds the title.
+    """
+    ratio = difflib.SequenceMatcher(None, norm, title_norm).ratio()
+    words = norm.split()
+    title_words = title_norm.split()
+    if not words or not title_words:
+        return ratio
+    coverage = (sum(word in title_words for word in words) / len(words)
+                + sum(word in words for word in title_words) / len(title_words)) / 2
+    return max(ratio, coverage)
+
+
+def _rank(norm, rows):
+    """Order rows by similarity to norm, then by votes, dropping the ones that aren't similar enough"""
+    scored = []
+    for row in rows:
+        score = similarity(norm, row["norm"])
+        if score >= MIN_SIMILARITY:
+            scored.append((score, row["votes"] or 0, row))
+    scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+    return [row for _score, _votes, row in scored]
+
+
+def _fuzzy(connection, norm, year):
+    words = [word for word in norm.split() if len(word) >= 3]
+    if not words:
+        return []
+    query = " AND ".join(f'"{word}"' for word in words)
+    sql = "SELECT titles.* FROM titles_fts JOIN titles ON titles.rowid = titles_fts.rowid " \
+          "WHERE titles_fts MATCH ?" + (" AND titles.year = ?" if year else "") + \
+          " ORDER BY titles.votes DESC LIMIT ?"
+    params = [query] + ([year] if year else []) + [FUZZY_CANDIDATES]
+    rows = connection.execute(sql, params).fetchall()
+    rare_words = [word for word in words if word not in STOP_WORDS]
+    if not rows and len(rare_words) > 1:
+        # Not every word is in the title, e.g. a disc label with "disc 1" or "special edition"
+        params[0] = " OR ".join(f'"{word}"' for word in rare_words)
+        rows = connection.execute(sql, params).fetchall()
+    return _rank(norm, rows)
+
+
+def find(title, year=None):
+    """
+    Titles matching a title, the closest and most popular first\n
+    :param str title: title or disc label, words may be joined with "+" or "_"
+    :param year: year of release, only titles of that year are returned if given
+    :return list: sqlite3.Row of the titles table, at most SEARCH_RESULTS
+    """
+    norm = normalise(str(title or "").replace("+", " "))
+    if not norm or not available():
+        return []
+    year = _year(year)
+    start = time.monotonic()
+    with closing(_connect()) as connection:
+        sql = "SELECT * FROM titles WHERE norm = ?" + (" AND year = ?" if year else "") + " ORDER BY votes DESC"
+        rows = connection.execute(sql, (norm, year) if year else (norm,)).fetchall()
+        if not rows:
+            rows = _fuzzy(connection, norm, year)
+    logging.debug(f"Local dataset: {len(rows)} titles for {norm} ({year}) in {(time.monotonic() - start) * 1000:.0f}ms")
+    return rows[:SEARCH_RESULTS]
+
+
+def _omdb_item(row):
+    return {
+        'Title': row["title"],
+        'Year': str(row["year"] or ""),
+        'imdbID': row["tconst"],
+        'Type': row["type"],
+        'Poster': "N/A",
+    }
+
+
+def search(title, year=None):
+    """
+    Search the dataset\n
+    :return dict: OMDb style search result, None if nothing matched
+    """
+    try:
+        rows = find(title, year)
+    except sqlite3.Error as error:
+        logging.error(f"Local title dataset failed: {error}")
+        return None
+    if not rows:
+        return None
+    return {'Search': [_omdb_item(row) for row in rows], 'totalResults': str(len(rows)),
+            'Response': "True", 'background_url': None}
+
+
+def details(imdb_id):
+    """
+    One title of the dataset\n
+    :return dict: OMDb style title details, None if the id isn't in the dataset
+    """
+    if not imdb_id or not available():
+        return None
+    try:
+        with closing(_connect()) as connection:
+            row = connection.execute("SELECT * FROM titles WHERE tconst = ?", (str(imdb_id),)).fetchone()
+    except sqlite3.Error as error:
+        logging.error(f"Local title dataset failed: {error}")
+        return None
+    if row is None:
+        return None
+    result = _omdb_item(row)
+    result.update({
+        'Genre': (row["genres"] or "").replace(",", ", "),
+        'Runtime': f"{row['runtime']} min" if row["runtime"] else "N/A",
+        'imdbRating': str(row["rating"]) if row["rating"] else "N/A",
+        'imdbVotes': str(row["votes"] or "N/A"),
+        'Plot': "N/A",
+        'Response': "True",
+        'background_url': None,
+    })
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import the IMDb title dataset for the local metadata provider")
+    parser.add_argument("basics", help="title.basics.tsv.gz from https://datasets.imdbws.com/")
+    parser.add_argument("--ratings", help="title.ratings.tsv.gz, ranks popular titles first")
+    args = parser.parse_args()
+    print(f"Imported {import_dataset(args.basics, args.ratings)} titles into {dataset_path()}")
+
+
+if __name__ == "__main__":
+    main()
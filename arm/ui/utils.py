@@ -1,7 +1,6 @@
 """
 Main catch all page for functions for the A.R.M ui
 """
-import hashlib
 import os
 import shutil
 import json
@@ -11,7 +10,7 @@ import re
 from datetime import datetime
 from pathlib import Path
 from sqlalchemy.exc import SQLAlchemyError
-from time import strftime, localtime, time, sleep
+from time import strftime, localtime, time
 
 import bcrypt
 import requests
@@ -27,7 +26,7 @@ from arm.models.job import Job
 from arm.models.system_info import SystemInfo
 from arm.models.ui_settings import UISettings
 from arm.models.user import User
-from arm.ui import app, db
+from arm.ui import app, db, db_writer, http_client, title_dataset
 from arm.ui.metadata import tmdb_search, get_tmdb_poster, tmdb_find, call_omdb_api
 from arm.ui.settings import DriveUtils
 
@@ -35,32 +34,18 @@ from arm.ui.settings import DriveUtils
 path_migrations = "arm/migrations"
 
 
-def database_updater(args, job, wait_time=90):
+def database_updater(args, job):
     """
-    Try to update our db for x seconds and handle it nicely if we cant\n
+    Update our db, retrying with backoff while the database is locked\n
 
     :param args: This needs to be a Dict with the key being the
     job.method you want to change and the value being the new value.
     :param job: This is the job object
-    :param wait_time: The time to wait in seconds
     :returns : Boolean
     """
-    # Loop through our args and try to set any of our job variables
     for (key, value) in args.items():
-        setattr(job, key, value)
         app.logger.debug(f"Setting {key}: {value}")
-    for i in range(wait_time):  # give up after the users wait period in seconds
-        try:
-            db.session.commit()
-        except Exception as error:
-            if "locked" in str(error):
-                sleep(1)
-                app.logger.debug(f"database is locked - trying in 1 second {i}/{wait_time} - {error}")
-            else:
-                app.logger.debug("Error: " + str(error))
-                db.session.rollback()
-                raise RuntimeError(str(error)) from error
-
+    db_writer.update(job, args)
     app.logger.debug("successfully written to the database")
     return True
 
@@ -360,43 +345,6 @@ def generate_comments():
     return comments
 
 
-def generate_full_log(full_path):
-    """
-    Gets/tails all lines from log file
-    :param full_path: full path to job logfile
-    :return: None
-    """
-    try:
-        with open(full_path) as read_log_file:
-            while True:
-                yield read_log_file.read()
-                sleep(1)
-    except IOError:
-        try:
-            with open(full_path, encoding="utf8", errors='ignore') as read_log_file:
-                while True:
-                    yield read_log_file.read()
-                    sleep(1)
-        except FileNotFoundError as error:
-            raise FileNotFoundError("Not found with utf8 encoding") from error
-
-
-def generate_arm_cat(full_path):
-    """
-    Read from log file and only output ARM: logs
-    :param full_path: full path to job logfile
-    :return: None
-    """
-    read_log_file = open(full_path)
-    while True:
-        new = read_log_file.readline()
-        if new:
-            if "ARM:" in new:
-                yield new
-            else:
-                sleep(1)
-
-
 def setup_database():
     """
     Try to get the db.User if not we nuke everything
@@ -477,8 +425,8 @@ def job_dupe_check(crc_id):
 
 def metadata_selector(func, query="", year="", imdb_id=""):
     """
-    Used to switch between OMDB or TMDB as the metadata provider
-    - TMDB returned queries are converted into the OMDB format
+    Used to switch between OMDB, TMDB or the local dataset as the metadata provider
+    - TMDB and local returned queries are converted into the OMDB format
 
     :param func: the function that is being called - allows for more dynamic results
     :param query: this can either be a search string or movie/show title
@@ -507,6 +455,12 @@ def metadata_selector(func, query="", year="", imdb_id=""):
             return_function = call_omdb_api(str(query), str(year))
         elif func == "get_details":
             return_function = call_omdb_api(title=str(query), year=str(year), imdb_id=str(imdb_id), plot="full")
+    elif cfg.arm_config['METADATA_PROVIDER'].lower() == "local":
+        app.logger.debug(f"provider local - function: {func}")
+        if func == "get_details" and imdb_id:
+            return_function = title_dataset.details(imdb_id)
+        else:
+            return_function = title_dataset.search(query, year)
     else:
         app.logger.debug("Unknown metadata selected")
     return return_function
@@ -591,7 +545,8 @@ def send_to_remote_db(job_id):
           f"&y={job.year}&imdb={job.imdb_id}" \
           f"&hnt={job.hasnicetitle}&l={job.label}&vt={job.video_type}"
     app.logger.debug(url.replace(api_key, "<api_key>"))
-    response = requests.get(url)
+    # A repeated request could store the job twice
+    response = http_client.get(url, attempts=1)
     req = json.loads(response.text)
     app.logger.debug("req= " + str(req))
     job_dict = job.get_d().items()
@@ -798,69 +753,6 @@ def generate_file_list(my_path):
     return movie_dirs
 
 
-def import_movie_add(poster_image, imdb_id, movie_group, my_path):
-    """
-    Search the movie directory, make sure we have movie files and then import it into the db\n
-    :param poster_image:
-    :param imdb_id:
-    :param movie_group:
-    :param my_path:
-    :return:
-    """
-    app.logger.debug(f"Poster image: {poster_image}, IMDB: {imdb_id}, "
-                     f"Movie_group: {movie_group.group(0)}, Path: {my_path}")
-    # only used to add a non-unique crc64
-    movie = movie_group.group(0)
-    # Fake crc64 number
-    hash_object = hashlib.md5(f"{movie}".strip().encode())
-    # Check if we already have this in the db exit if we do
-    dupe_found, _ = job_dupe_check(hash_object.hexdigest())
-    if dupe_found:
-        app.logger.debug("We found dupes breaking loop")
-        return None
-    app.logger.debug(f"List dir = {os.listdir(my_path)}")
-
-    # Build file list with common video extension types
-    movie_files = [f for f in os.listdir(my_path)
-                   if os.path.isfile(os.path.join(my_path, f))
-                   and f.endswith((".mkv", ".avi", ".mp4", ".avi"))]
-    app.logger.debug(f"movie files = {movie_files}")
-
-    # This dict will be returned to the big list, so we can display to the user
-    movie_dict = {
-        'title': movie_group.group(1),
-        'year': movie_group.group(2),
-        'crc_id': hash_object.hexdigest(),
-        'imdb_id': imdb_id,
-        'poster': poster_image,
-        'status': 'success' if len(movie_files) >= 1 else 'fail',
-        'video_type': 'movie',
-        'disctype': 'unknown',
-        'hasnicetitle': True,
-        'no_of_titles': len(movie_files)
-    }
-    app.logger.debug(movie_dict)
-    # Create the new job and use the found values
-    new_movie = Job("/dev/sr0")
-    new_movie.title = movie_dict['title']
-    new_movie.year = movie_dict['year']
-    new_movie.crc_id = hash_object.hexdigest()
-    new_movie.imdb_id = imdb_id
-    new_movie.status = movie_dict['status']
-    new_movie.video_type = movie_dict['video_type']
-    new_movie.disctype = movie_dict['disctype']
-    new_movie.hasnicetitle = movie_dict['hasnicetitle']
-    new_movie.no_of_titles = movie_dict['no_of_titles']
-    new_movie.poster_url = movie_dict['poster']
-    new_movie.start_time = datetime.now()
-    new_movie.logfile = "imported.log"
-    new_movie.ejected = True
-    new_movie.path = my_path
-    app.logger.debug(new_movie)
-    db.session.add(new_movie)
-    return movie_dict
-
-
 def get_git_revision_hash() -> str:
     """Get short hash of current git commit"""
     git_hash: str = 'unknown'
@@ -889,7 +781,7 @@ def git_check_updates(current_hash) -> bool:
     arm_current = True      # set True, any exceptions will return a true value
 
     try:
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         response.raise_for_status()  # Raise an error for HTTP failures (4xx, 5xx)
 
         latest_commit = response.json().get("sha", "").strip()
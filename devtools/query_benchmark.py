@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Automatic-Ripping-Machine Development Tools
+    Benchmark of the hot database queries
+
+    Builds a synthetic database with the job, track, notifications and system_drives
+    columns the hot queries use, times every query without and with the indexes of the
+    hot query migration and prints the median latency and the query plan of both runs.
+    Like the ARM database the benchmark database isn't ANALYZEd.
+    The data is generated from a fixed seed, so runs with the same options compare.
+"""
+
+import argparse
+import ast
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+path_migration = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "arm", "migrations",
+                              "versions", "d81e5b3c7f42_hot_query_indexes.py")
+
+SCHEMA = (
+    "CREATE TABLE job (job_id INTEGER PRIMARY KEY, crc_id VARCHAR(63), logfile VARCHAR(256), "
+    "start_time DATETIME, status VARCHAR(32), title VARCHAR(256), year VARCHAR(4), video_type VARCHAR(20), "
+    "imdb_id VARCHAR(15), devpath VARCHAR(15), hasnicetitle BOOLEAN, disctype VARCHAR(20), "
+    "label VARCHAR(256), path VARCHAR(256), pid INTEGER)",
+    "CREATE TABLE track (track_id INTEGER PRIMARY KEY, job_id INTEGER REFERENCES job (job_id), "
+    "track_number VARCHAR(4), length INTEGER, main_feature BOOLEAN, filename VARCHAR(256), ripped BOOLEAN, "
+    "status VARCHAR(32))",
+    "CREATE TABLE notifications (id INTEGER PRIMARY KEY, seen BOOLEAN, trigger_time DATETIME, "
+    "title VARCHAR(256), message VARCHAR(256), cleared BOOLEAN NOT NULL)",
+    "CREATE TABLE system_drives (drive_id INTEGER PRIMARY KEY, name VARCHAR(100), mount VARCHAR(100), "
+    "job_id_current INTEGER REFERENCES job (job_id))",
+)
+
+# (name, query, parameters), the statements SQLAlchemy issues for the hot paths
+QUERIES = (
+    ("active jobs", "SELECT * FROM job WHERE job.status IN (:s1, :s2, :s3, :s4, :s5, :s6)",
+     {"s1": "active", "s2": "info", "s3": "ripping", "s4": "transcoding", "s5": "waiting", "s6": "waiting_transcode"}),
+    ("active jobs, not in", "SELECT * FROM job WHERE job.status NOT IN (:s1, :s2)", {"s1": "fail", "s2": "success"}),
+    ("jobs by status", "SELECT * FROM job WHERE job.status = :status", {"status": "fail"}),
+    ("failed job count", "SELECT count(*) FROM job WHERE job.status = :status", {"status": "fail"}),
+    ("dupe check by label", "SELECT * FROM job WHERE job.label = :label AND job.status = :status",
+     {"label": "DISC_LABEL_00042", "status": "success"}),
+    ("dupe check by crc", "SELECT * FROM job WHERE job.crc_id = :crc_id AND job.status = :status "
+     "AND job.hasnicetitle = 1", {"crc_id": "crc0000000000042", "status": "success"}),
+    ("track by filename", "SELECT * FROM track WHERE :job_id = track.job_id AND track.filename = :filename",
+     {"job_id": 25000, "filename": "title_t03.mkv"}),
+    ("unread notifications", "SELECT * FROM notifications WHERE notifications.seen = 0", {}),
+    ("drive by mount", "SELECT * FROM system_drives WHERE system_drives.mount = :mount", {"mount": "/dev/sr3"}),
+)
+
+
+def load_indexes():
+    """
+    Index definitions of the hot query migration, read without importing alembic
+        INPUT: none
+        OUTPUT: tuple of (name, table, columns)
+    """
+    with open(path_migration, encoding="utf-8") as migration:
+        tree = ast.parse(migration.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "INDEXES" for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"No INDEXES in {path_migration}")
+
+
+def populate(connection, jobs, tracks_per_job, seed):
+    """
+    Fill the database with synthetic jobs, tracks, notifications and drives
+        INPUT: sqlite connection, number of jobs, tracks per job, random seed
+        OUTPUT: none
+    """
+    rng = random.Random(seed)
+    # Mostly history, the last few jobs are still running
+    statuses = ["success"] * 87 + ["fail"] * 13
+    running = ["active", "ripping", "waiting", "transcoding"]
+    connection.executemany(
+        "INSERT INTO job (job_id, crc_id, logfile, start_time, status, title, year, video_type, imdb_id, devpath, "
+        "hasnicetitle, disctype, label, path, pid) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((job_id, f"crc{job_id % (jobs // 2 or 1):013d}", f"DISC_{job_id}.log", "2024-01-01 00:00:00",
+          running[jobs - job_id] if jobs - job_id < len(running) else rng.choice(statuses),
+          f"Title {job_id}", str(rng.randint(1950, 2025)), rng.choice(["movie", "series"]),
+          f"tt{job_id:07d}", f"sr{job_id % 8}", rng.random() < 0.8, rng.choice(["dvd", "bluray", "music"]),
+          f"DISC_LABEL_{job_id % (jobs // 3 or 1):05d}", f"/home/arm/media/completed/Title {job_id}", job_id)
+         for job_id in range(1, jobs + 1)))
+    connection.executemany(
+        "INSERT INTO track (job_id, track_number, length, main_feature, filename, ripped, status) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        ((job_id, str(number), rng.randint(60, 9000), number == 0, f"title_t{number:02d}.mkv", True, "success")
+         for job_id in range(1, jobs + 1) for number in range(tracks_per_job)))
+    connection.executemany(
+        "INSERT INTO notifications (seen, trigger_time, title, message, cleared) VALUES (?, ?, ?, ?, ?)",
+        ((number >= 5, "2024-01-01 00:00:00", "ARM notification", f"Job {number} finished", False)
+         for number in range(jobs)))
+    connection.executemany(
+        "INSERT INTO system_drives (name, mount) VALUES (?, ?)",
+        ((f"Drive {number}", f"/dev/sr{number}") for number in range(8)))
+    connection.commit()
+
+
+def measure(connection, runs):
+    """
+    Median latency in ms and query plan of every query
+        INPUT: sqlite connection, runs per query
+        OUTPUT: dict of name: (ms, plan)
+    """
+    results = {}
+    for name, query, params in QUERIES:
+        plan = "; ".join(row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}", params))
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            connection.execute(query, params).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(timings), plan)
+    return results
+
+
+def run(jobs=50000, tracks_per_job=10, runs=20, seed=42, path_db=None):
+    """
+    Build the database, time the queries before and after indexing and print the comparison
+        INPUT: number of jobs, tracks per job, runs per query, random seed, database file (temporary if None)
+        OUTPUT: dict of name: (ms before, ms after)
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        connection = sqlite3.connect(path_db or os.path.join(tmp_dir, "benchmark.db"))
+        try:
+            for statement in SCHEMA:
+                connection.execute(statement)
+            print(f"Populating {jobs} jobs with {tracks_per_job} tracks each")
+            populate(connection, jobs, tracks_per_job, seed)
+            before = measure(connection, runs)
+            for name, table, columns in load_indexes():
+                connection.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+            after = measure(connection, runs)
+        finally:
+            connection.close()
+
+    print(f"{'query':<22}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for name, _query, _params in QUERIES:
+        ms_before, ms_after = before[name][0], after[name][0]
+        print(f"{name:<22}{ms_before:>12.3f}{ms_after:>12.3f}{ms_before / max(ms_after, 0.001):>9.1f}x")
+    print()
+    for name, _query, _params in QUERIES:
+        print(f"{name}:\n    before: {before[name][1]}\n    after:  {after[name][1]}")
+    return {name: (before[name][0], after[name][0]) for name in before}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the hot ARM database queries with and without indexes")
+    parser.add_argument("--jobs", type=int, default=50000, help="Number of synthetic jobs")
+    parser.add_argument("--tracks", type=int, default=10, help="Tracks per job")
+    parser.add_argument("--runs", type=int, default=20, help="Runs per query, the median is reported")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the synthetic data")
+    parser.add_argument("--db", help="Keep the database in this file instead of a temporary one")
+    args = parser.parse_args()
+    run(args.jobs, args.tracks, args.runs, args.seed, args.db)
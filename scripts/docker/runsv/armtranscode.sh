@@ -0,0 +1,5 @@
+#!/bin/bash
+
+echo "Starting transcode worker pool"
+chmod +x /opt/arm/arm/ripper/transcode_worker.py
+exec /sbin/setuser arm /bin/python3 /opt/arm/arm/ripper/transcode_worker.py
@@ -964,6 +964,10 @@ function CreateAndStartService() {
   systemctl daemon-reload
   systemctl enable armui
   systemctl start armui
+  cp /opt/arm/setup/armtranscode.service /lib/systemd/system/armtranscode.service
+  systemctl daemon-reload
+  systemctl enable armtranscode
+  systemctl start armtranscode
 }
 
 function LaunchSetup() {
@@ -0,0 +1,43 @@
+"""
+Throughput of the MakeMKV robot output parser, run with pytest-benchmark
+
+    pytest test/benchmark --benchmark-autosave
+    pytest-benchmark compare
+
+Save a run before and after a parser change to compare them, the lines/s of
+each case are stored in the extra_info of the saved run.
+"""
+import sys
+
+import pytest
+
+sys.path.insert(0, '/opt/arm')
+
+pytest.importorskip("pytest_benchmark")
+
+from arm.ripper.makemkv import OutputType, parse_line  # noqa: E402
+from test.unittest.test_ripper_makemkv_parser import info_output, mkv_output  # noqa: E402
+
+# What makemkv_info() and run_rip() ask run() for
+INFO_SELECT = OutputType.MSG | OutputType.TCOUNT | OutputType.CINFO | OutputType.TINFO | OutputType.SINFO
+RIP_SELECT = OutputType.MSG | OutputType.PRGC | OutputType.PRGV
+
+CASES = {
+    "info": (info_output, INFO_SELECT),
+    "mkv": (mkv_output, RIP_SELECT),
+    "mkv-no-progress": (mkv_output, OutputType.MSG),
+}
+
+
+def parse_all(lines, select):
+    for line in lines:
+        parse_line(line, select)
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_parse(benchmark, case):
+    output, select = CASES[case]
+    lines = output()
+    benchmark(parse_all, lines, select)
+    benchmark.extra_info["lines"] = len(lines)
+    benchmark.extra_info["lines_per_second"] = round(len(lines) / benchmark.stats.stats.mean)
@@ -0,0 +1,105 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, '/opt/arm')
+
+from arm.ripper import makemkv  # noqa: E402
+from arm.ripper.makemkv import OutputType, parse_line  # noqa: E402
+
+DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+def info_output():
+    """makemkvcon --robot info of a Blu-ray with 7 titles"""
+    with open(os.path.join(DATA, "makemkv_info_bluray.txt"), encoding="utf-8") as output:
+        return output.read().splitlines()
+
+
+def mkv_output(progress_lines=40000):
+    """
+    makemkvcon --robot --progress=-same mkv of the Blu-ray of info_output()\n
+    The disc scan of the info output, then the rip of title 0 with progress_lines PRGV lines
+    """
+    lines = [line for line in info_output() if not line.startswith(("TCOUNT", "CINFO", "TINFO", "SINFO"))]
+    lines += [
+        'MSG:5014,0,2,"Saving 1 titles into directory file:///home/arm/raw/The Movie","Saving %1 titles into '
+        'directory %2","1","file:///home/arm/raw/The Movie"',
+        'PRGT:5018,0,"Saving to MKV file"',
+        'PRGC:5018,0,"Saving to MKV file"',
+    ]
+    for step in range(progress_lines):
+        value = step * 65536 // progress_lines
+        lines.append(f"PRGV:{value},{value},65536")
+        if step % 5000 == 4999:
+            lines.append('PRGC:5017,0,"Analyzing seamless segments"')
+            lines.append('PRGC:5018,0,"Saving to MKV file"')
+    lines += [
+        'PRGV:65536,65536,65536',
+        'MSG:5036,0,1,"Copy complete. 1 titles saved.","Copy complete. %1 titles saved.","1"',
+        'MSG:5004,0,2,"1 titles saved","%1 titles saved, %2 failed","1","0"',
+    ]
+    return lines
+
+
+class TestMakeMkvParser(unittest.TestCase):
+    def test_info_output(self):
+        """Test that every line of an info scan is parsed to the dataclass of its type"""
+        counts = {}
+        titles = {}
+        for line in info_output():
+            msg_type, data = parse_line(line)
+            counts[msg_type] = counts.get(msg_type, 0) + 1
+            if msg_type == OutputType.TINFO and data.id == makemkv.TrackID.DURATION:
+                titles[data.tid] = data.value
+        self.assertEqual(counts[OutputType.DRV], 16)
+        self.assertEqual(counts[OutputType.TCOUNT], 1)
+        self.assertEqual(len(titles), 7)
+        self.assertEqual(titles[0], "2:14:31")
+
+    def test_fields(self):
+        """Test that numbers are converted and quoted strings keep their commas"""
+        _, tinfo = parse_line('TINFO:1,26,0,"155,156,157"')
+        self.assertEqual((tinfo.tid, tinfo.id, tinfo.code, tinfo.value), (1, 26, 0, "155,156,157"))
+        _, sinfo = parse_line('SINFO:0,3,1,6202,"Audio"')
+        self.assertEqual((sinfo.tid, sinfo.sid, sinfo.id, sinfo.code, sinfo.value), (0, 3, 1, 6202, "Audio"))
+        _, msg = parse_line('MSG:3307,0,2,"File 00800.mpls was added as title #0","File %1 was added as title '
+                            '#%2","00800.mpls","0"')
+        self.assertEqual(msg.code, makemkv.MessageID.FILE_ADDED)
+        self.assertEqual(msg.sprintf, ["File %1 was added as title #%2", "00800.mpls", "0"])
+        _, drive = parse_line('DRV:0,2,999,12,"BD-RE HL-DT-ST","THE_MOVIE","/dev/sr0"')
+        self.assertEqual((drive.mount, drive.disc, drive.index), ("/dev/sr0", "THE_MOVIE", 0))
+        self.assertTrue(drive.media_bd and drive.loaded)
+
+    def test_select(self):
+        """Test that unselected lines give no dataclass, but MSG lines are still checked"""
+        self.assertEqual(parse_line("PRGV:10,20,65536", OutputType.MSG), (OutputType.PRGV, None))
+        _, values = parse_line("PRGV:10,20,65536", OutputType.PRGV)
+        self.assertEqual((values.current, values.total, values.maximum), (10, 20, 65536))
+        with self.assertRaises(makemkv.MakeMkvRuntimeError):
+            parse_line('MSG:5004,0,2,"0 titles saved","%1 titles saved, %2 failed","0","1"', OutputType.PRGV)
+
+    def test_slots(self):
+        """Test that the records of the frequent lines don't carry a __dict__"""
+        for line in ("PRGV:1,2,3", 'PRGC:5018,0,"Saving to MKV file"', 'TINFO:0,9,0,"1:00:00"',
+                     'SINFO:0,0,1,6201,"Video"', 'MSG:3007,0,0,"Direct","Direct"'):
+            _, data = parse_line(line)
+            self.assertFalse(hasattr(data, "__dict__"), line)
+
+    def test_errors(self):
+        """Test that lines that can't be parsed raise MakeMkvParserError"""
+        for line in ("no colon", "FOO:1,2", "TINFO:x,26,0,\"value\"", "PRGV:1,2", "TCOUNT:"):
+            with self.assertRaises(makemkv.MakeMkvParserError, msg=line):
+                parse_line(line)
+
+    def test_mkv_output(self):
+        """Test that a whole rip parses with its progress"""
+        progress = [data.total for msg_type, data in map(parse_line, mkv_output(1000))
+                    if msg_type == OutputType.PRGV]
+        rip = progress[-1001:]
+        self.assertEqual(rip, sorted(rip))
+        self.assertEqual(rip[-1], 65536)
+
+
+if __name__ == '__main__':
+    unittest.main()
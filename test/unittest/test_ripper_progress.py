@@ -0,0 +1,72 @@
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, '/opt/arm')
+
+from arm.ripper import progress  # noqa: E402
+
+
+class TestProgress(unittest.TestCase):
+    def setUp(self):
+        log_path = tempfile.TemporaryDirectory()
+        self.addCleanup(log_path.cleanup)
+        patcher = patch.dict(progress.cfg.arm_config, {"LOGPATH": log_path.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_publish_and_read(self):
+        """Test that a published record is read back and removed by clear"""
+        reporter = progress.Reporter(7, "transcoding", "Transcoding", "2/5")
+        reporter.update(42.5, eta="0:01:00", rate=24.0, rate_unit="fps")
+        record = progress.read(7)
+        self.assertEqual(record["status"], "transcoding")
+        self.assertEqual(record["title"], "2/5")
+        self.assertEqual(record["progress"], 42.5)
+        self.assertEqual(record["eta"], "0:01:00")
+        progress.clear(7)
+        self.assertIsNone(progress.read(7))
+
+    def test_throttle(self):
+        """Test that updates within PUBLISH_INTERVAL are skipped unless the stage changes"""
+        reporter = progress.Reporter(8, "ripping", "Ripping")
+        reporter.update(10)
+        reporter.update(20)
+        self.assertEqual(progress.read(8)["progress"], 10)
+        reporter.update(30, stage="Saving to MKV file")
+        record = progress.read(8)
+        self.assertEqual(record["progress"], 30)
+        self.assertEqual(record["stage"], "Saving to MKV file")
+
+    def test_clamp(self):
+        """Test that the progress stays between 0 and 100"""
+        progress.Reporter(9, "ripping", "Ripping").update(101.3)
+        self.assertEqual(progress.read(9)["progress"], 100)
+
+    def test_concurrent_titles(self):
+        """Test that titles encoded side by side are combined instead of overwriting each other"""
+        progress.Reporter(10, "ripping", "Ripping").update(100)
+        first = progress.Reporter(10, "transcoding", "Transcoding", "1/3")
+        second = progress.Reporter(10, "transcoding", "Transcoding", "2/3")
+        third = progress.Reporter(10, "transcoding", "Transcoding", "3/3")
+        first.update(80, eta="0:00:30", rate=20.0, rate_unit="fps")
+        second.update(20, eta="0:05:00", rate=25.0, rate_unit="fps")
+        record = progress.read(10)
+        self.assertEqual(record["status"], "transcoding")
+        self.assertEqual(record["title"], "1/3, 2/3")
+        self.assertEqual(record["progress"], 50)
+        self.assertEqual(record["eta"], "0:05:00")
+        self.assertEqual(record["rate"], 45.0)
+        first.finish()
+        third.update(40)
+        record = progress.read(10)
+        self.assertEqual(record["title"], "2/3, 3/3")
+        self.assertEqual([title["title"] for title in record["titles"]], ["2/3", "3/3"])
+        self.assertAlmostEqual(record["progress"], 53.33)
+        progress.clear(10)
+        self.assertIsNone(progress.read(10))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import sys
+import unittest
+import os
+import tempfile
+import shutil
+import threading
+import time
+
+sys.path.insert(0, '/opt/arm')
+
+from arm.ripper.slot_scheduler import SlotScheduler  # noqa: E402
+
+
+class TestSlotScheduler(unittest.TestCase):
+    def setUp(self):
+        """Create a temporary directory for the slot files"""
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Clean up the temporary directory"""
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_disabled_scheduler(self):
+        """Test that a limit of 0 never blocks and creates no files"""
+        scheduler = SlotScheduler("test", 0, os.path.join(self.test_dir, "test"))
+        with scheduler.slot() as wait_time:
+            self.assertEqual(wait_time, 0.0)
+        self.assertFalse(os.path.exists(scheduler.path))
+
+    def test_status_counts_held_slots(self):
+        """Test that status reports the held slot and the wait time"""
+        scheduler = SlotScheduler("test", 2, self.test_dir)
+        with scheduler.slot():
+            status = scheduler.status()
+            self.assertEqual(status["active"], 1)
+            self.assertEqual(status["queued"], 0)
+            self.assertIsNotNone(status["last_wait"])
+        self.assertEqual(scheduler.active(), 0)
+
+    def test_waiters_served_in_order(self):
+        """Test that waiters get the slot in arrival order as soon as it is released"""
+        scheduler = SlotScheduler("test", 1, self.test_dir)
+        order = []
+
+        def worker(number):
+            with SlotScheduler("test", 1, self.test_dir).slot():
+                order.append(number)
+
+        with scheduler.slot():
+            threads = []
+            for number in range(3):
+                thread = threading.Thread(target=worker, args=(number,))
+                thread.start()
+                threads.append(thread)
+                # Make sure each thread has drawn its ticket before starting the next
+                while scheduler.queue_depth() < number + 1:
+                    time.sleep(0.01)
+        start = time.monotonic()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [0, 1, 2])
+        # Released slots wake the next waiter immediately, not after a poll interval
+        self.assertLess(time.monotonic() - start, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import sys
+import unittest
+import subprocess
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+sys.path.insert(0, '/opt/arm')
+
+from arm.ripper import transcode_pool  # noqa: E402
+from arm.ripper.slot_scheduler import SlotScheduler  # noqa: E402
+
+
+def make_track(number):
+    return SimpleNamespace(track_number=number, status="transcoding", ripped=False, error=None)
+
+
+class TestTranscodePool(unittest.TestCase):
+    def setUp(self):
+        self.job = SimpleNamespace(job_id=1)
+        patchers = [
+            patch.object(transcode_pool, 'db_writer', MagicMock()),
+            patch.object(transcode_pool.slot_scheduler, 'encoder_scheduler',
+                         return_value=SlotScheduler("test", 0, "/nonexistent")),
+            patch.dict(transcode_pool.cfg.arm_config, {"TRANSCODE_JOB_PARALLELISM": 2}),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_out_of_order_completion(self):
+        """Test that every track is marked when the second title finishes first"""
+        first_running = threading.Event()
+        second_done = threading.Event()
+
+        def slow():
+            first_running.set()
+            self.assertTrue(second_done.wait(5))
+
+        def fast():
+            self.assertTrue(first_running.wait(5))
+            second_done.set()
+
+        tracks = [make_track(1), make_track(2)]
+        transcode_pool.run_encodes(self.job, [(tracks[0], "title 1", slow), (tracks[1], "title 2", fast)])
+        for track in tracks:
+            self.assertEqual(track.status, "success")
+            self.assertTrue(track.ripped)
+            self.assertIsNone(track.error)
+
+    def test_failure_stops_new_titles(self):
+        """Test that a failed title is marked and raised and later titles aren't started"""
+        started = []
+
+        def encode(number, fail=False):
+            def run():
+                started.append(number)
+                if fail:
+                    raise subprocess.CalledProcessError(3, "encoder")
+            return run
+
+        transcode_pool.cfg.arm_config["TRANSCODE_JOB_PARALLELISM"] = 1
+        tracks = [make_track(1), make_track(2), make_track(3)]
+        encodes = [(tracks[0], "title 1", encode(1)),
+                   (tracks[1], "title 2", encode(2, fail=True)),
+                   (tracks[2], "title 3", encode(3))]
+        with self.assertRaises(subprocess.CalledProcessError):
+            transcode_pool.run_encodes(self.job, encodes)
+        self.assertEqual(started, [1, 2])
+        self.assertEqual(tracks[0].status, "success")
+        self.assertEqual(tracks[1].status, "fail")
+        self.assertEqual(tracks[1].error, "title 2 failed with code: 3")
+        self.assertFalse(tracks[1].ripped)
+        self.assertEqual(tracks[2].status, "transcoding")
+
+
+if __name__ == '__main__':
+    unittest.main()